@@ -123,7 +123,7 @@ export default function Orders() {
                 type="text"
                 value={search}
                 onChange={(e) => setSearch(e.target.value)}
-                placeholder="Order number or email..."
+                placeholder="Order number, email or postcode..."
                 className="flex-1 input-field"
               />
               <button type="submit" className="btn-primary px-4">
@@ -0,0 +1,206 @@
+"""
+Admin analytics aggregations
+Pure functions over rows already fetched by admin_db - no database access, so
+they can run in a worker process (see upstream.run_cpu).
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List
+
+EXCLUDED_STATUSES = ("cancelled", "refunded")
+# Dashboard "recent orders": the newest RECENT_ORDER_LIMIT from the last RECENT_ORDER_DAYS
+RECENT_ORDER_DAYS = 30
+RECENT_ORDER_LIMIT = 10
+
+
+def recent_orders_since() -> str:
+    """ISO timestamp of the start of the recent-orders window."""
+    return (datetime.now(timezone.utc) - timedelta(days=RECENT_ORDER_DAYS)).isoformat()
+
+
+def _counts(item: Dict) -> bool:
+    """Whether an order item belongs to an order that counts towards sales."""
+    return (item.get("orders") or {}).get("status") not in EXCLUDED_STATUSES
+
+
+def compute_size_distribution(order_items: List[Dict], variants: List[Dict]) -> Dict[str, Dict]:
+    """
+    Size distribution for sold items grouped by product type, e.g.
+    {"T-Shirt": {"sizes": {"S": 5, "M": 10}, "total": 15, "percentages": {"S": 33.3, "M": 66.7}}}
+    """
+    # Map variant_id to product_type
+    variant_to_type = {
+        variant["id"]: (variant.get("products") or {}).get("product_type", "Unknown")
+        for variant in variants
+    }
+
+    # Aggregate by product type and size
+    distribution = {}
+    for item in order_items:
+        if not _counts(item):
+            continue
+
+        product_type = variant_to_type.get(item["product_variant_id"], "Unknown")
+        entry = distribution.setdefault(product_type, {"sizes": {}, "total": 0})
+        size = item["product_size"]
+        entry["sizes"][size] = entry["sizes"].get(size, 0) + item["quantity"]
+        entry["total"] += item["quantity"]
+
+    # Calculate percentages
+    for data in distribution.values():
+        total = data["total"]
+        data["percentages"] = {
+            size: round((count / total * 100), 1) if total > 0 else 0
+            for size, count in data["sizes"].items()
+        }
+
+    return distribution
+
+
+def compute_analytics_overview(data: Dict) -> Dict:
+    """
+    Revenue, cost and profit figures for the dashboard, from the analytics
+    rollups (see migration_analytics_rollups.sql).
+
+    data: {
+        "daily": analytics_daily rows (day, orders, total_amount, subtotal_amount, shipping_amount),
+        "product_sales": analytics_product_sales rows (product_name, quantity),
+        "products": [{id, name, unit_cost, product_variants: [{stock_quantity}]}],
+        "recent_orders": newest orders from the last 30 days, excluding cancelled/refunded,
+        "order_stats": get_order_stats() result,
+        "total_customers": int
+    }
+    """
+    daily = data["daily"]
+
+    # Calculate revenue components
+    total_revenue = sum(day["total_amount"] for day in daily)
+    product_revenue = sum(day["subtotal_amount"] for day in daily)
+    shipping_collected = sum(day["shipping_amount"] for day in daily)
+
+    # Shipping costs you pay (assuming same as shipping collected for now)
+    # In reality, you might pay less or more than what customer pays
+    shipping_costs = shipping_collected
+
+    total_orders = sum(day["orders"] for day in daily)
+
+    print(f"[ANALYTICS DEBUG] Total revenue: {total_revenue}, Product revenue: {product_revenue}, Shipping collected: {shipping_collected}")
+    print(f"[ANALYTICS DEBUG] Total orders: {total_orders}")
+
+    # This month's revenue (rollup days are UTC)
+    first_day_of_month = datetime.now(timezone.utc).date().replace(day=1)
+
+    month_revenue = 0
+    month_orders = 0
+    for day in daily:
+        if date.fromisoformat(str(day["day"])) >= first_day_of_month:
+            month_revenue += day["total_amount"]
+            month_orders += day["orders"]
+
+    # Product sales and cost of goods sold (COGS), excluding cancelled/refunded orders
+    product_costs = {p["name"]: p.get("unit_cost", 0) for p in data["products"]}
+    product_sales = {}
+    total_cost = 0
+    for row in data["product_sales"]:
+        if row["quantity"] <= 0:
+            continue
+        product_name = row["product_name"]
+        product_sales[product_name] = row["quantity"]
+        total_cost += product_costs.get(product_name, 0) * row["quantity"]
+
+    print(f"[ANALYTICS DEBUG] Total COGS: {total_cost}")
+
+    # Calculate inventory value (value of stock on hand)
+    # This is separate from COGS - it's unit_cost × current stock quantity
+    inventory_value = 0
+    for product in data["products"]:
+        total_stock = sum(v["stock_quantity"] for v in product.get("product_variants") or [] if v)
+        inventory_value += product.get("unit_cost", 0) * total_stock
+
+    print(f"[ANALYTICS DEBUG] Total inventory value: {inventory_value}")
+
+    # Calculate profit metrics
+    # Gross profit = Product revenue - COGS
+    gross_profit = product_revenue - total_cost
+    gross_margin = (gross_profit / product_revenue * 100) if product_revenue > 0 else 0
+
+    # Net profit = Gross profit - Shipping costs (and other expenses)
+    net_profit = gross_profit - shipping_costs
+    net_margin = (net_profit / total_revenue * 100) if total_revenue > 0 else 0
+
+    # Overall P&L (including inventory investment)
+    # This shows true financial position: have we recovered our inventory costs?
+    total_costs_including_inventory = total_cost + shipping_costs + inventory_value
+    overall_pl = total_revenue - total_costs_including_inventory
+    has_broken_even = overall_pl >= 0
+
+    print(f"[ANALYTICS DEBUG] Overall P&L: {overall_pl} (Break-even: {has_broken_even})")
+
+    top_products = sorted(product_sales.items(), key=lambda x: x[1], reverse=True)[:5]
+
+    return {
+        # Revenue breakdown
+        "total_revenue": total_revenue,
+        "product_revenue": product_revenue,
+        "shipping_collected": shipping_collected,
+
+        # Cost breakdown
+        "cogs": total_cost,  # Cost of Goods Sold
+        "shipping_costs": shipping_costs,
+        "inventory_value": inventory_value,
+        "total_costs_including_inventory": total_costs_including_inventory,
+
+        # Profit metrics
+        "gross_profit": gross_profit,
+        "gross_margin": round(gross_margin, 2),
+        "net_profit": net_profit,
+        "net_margin": round(net_margin, 2),
+
+        # Overall P&L (including inventory investment)
+        "overall_pl": overall_pl,
+        "has_broken_even": has_broken_even,
+
+        # Legacy fields (for backwards compatibility)
+        "total_cost": total_cost,
+        "total_profit": net_profit,
+        "profit_margin": round(net_margin, 2),
+
+        # Order metrics
+        "total_orders": total_orders,
+        "monthly_revenue": month_revenue,
+        "monthly_orders": month_orders,
+        "average_order_value": total_revenue // total_orders if total_orders > 0 else 0,
+        "total_customers": data["total_customers"],
+        "top_products": [{"name": name, "quantity": qty} for name, qty in top_products],
+        "order_stats": data["order_stats"],
+        "recent_orders": data["recent_orders"][:RECENT_ORDER_LIMIT]  # Last 10 orders for dashboard
+    }
+
+
+def empty_analytics_overview() -> Dict:
+    """Zeroed overview returned when the data can't be fetched."""
+    return {
+        "total_revenue": 0,
+        "product_revenue": 0,
+        "shipping_collected": 0,
+        "cogs": 0,
+        "shipping_costs": 0,
+        "inventory_value": 0,
+        "total_costs_including_inventory": 0,
+        "gross_profit": 0,
+        "gross_margin": 0,
+        "net_profit": 0,
+        "net_margin": 0,
+        "overall_pl": 0,
+        "has_broken_even": False,
+        "total_cost": 0,
+        "total_profit": 0,
+        "profit_margin": 0,
+        "total_orders": 0,
+        "monthly_revenue": 0,
+        "monthly_orders": 0,
+        "average_order_value": 0,
+        "total_customers": 0,
+        "top_products": [],
+        "order_stats": {},
+        "recent_orders": []
+    }
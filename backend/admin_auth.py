@@ -2,34 +2,164 @@
 Admin authentication middleware using Supabase JWT verification
 Supports both HS256 (with secret) and ES256 (with JWKS) tokens
 """
+import hashlib
 import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
 import jwt
 import requests
 from fastapi import HTTPException, Header
-from typing import Optional
-from functools import lru_cache
 
 SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 
+# Seconds before the JWKS is refetched
+JWKS_TTL_SECONDS = float(os.getenv("JWKS_TTL_SECONDS", "600"))
+# Minimum seconds between fetches triggered by an unknown key ID
+JWKS_MIN_REFRESH_SECONDS = float(os.getenv("JWKS_MIN_REFRESH_SECONDS", "30"))
+# Verified tokens remembered until exp (or ADMIN_TOKEN_CACHE_TTL, if sooner)
+ADMIN_TOKEN_CACHE_SIZE = int(os.getenv("ADMIN_TOKEN_CACHE_SIZE", "256"))
+ADMIN_TOKEN_CACHE_TTL = float(os.getenv("ADMIN_TOKEN_CACHE_TTL", "300"))
+
 if not SUPABASE_JWT_SECRET:
     print("Note: SUPABASE_JWT_SECRET not set. ES256 (JWKS) verification will be used.")
 
-@lru_cache(maxsize=1)
-def get_supabase_jwks():
-    """Fetch and cache Supabase JWKS (public keys for ES256 verification)"""
-    if not SUPABASE_URL:
-        return None
 
-    try:
-        jwks_url = f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json"
-        response = requests.get(jwks_url, timeout=5)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"Failed to fetch JWKS from Supabase: {e}")
-        return None
+# ============== SIGNING KEYS ==============
+
+class JWKSKeyStore:
+    """
+    Supabase's public signing keys, fetched once and refreshed every
+    JWKS_TTL_SECONDS. A token signed with an unknown key ID triggers a
+    refetch (key rotation); such refetches happen at most once per
+    JWKS_MIN_REFRESH_SECONDS, so forged key IDs can't hammer Supabase.
+    If a refresh fails the previous keys keep being used.
+    """
+
+    def __init__(self, url: str, ttl: float = JWKS_TTL_SECONDS, min_refresh: float = JWKS_MIN_REFRESH_SECONDS):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        self._lock = threading.Lock()
+        self._keys: Dict[Optional[str], object] = {}
+        self._fetched_at: Optional[float] = None
+        self._attempted_at = float("-inf")
+        self._miss_refreshed_at = float("-inf")
+        self.fetches = 0
+        self.fetch_errors = 0
+
+    def _refresh(self, now: float) -> None:
+        self._attempted_at = now
+        self.fetches += 1
+        try:
+            response = requests.get(self.url, timeout=5)
+            response.raise_for_status()
+            jwk_set = jwt.PyJWKSet.from_dict(response.json())
+            self._keys = {key.key_id: key.key for key in jwk_set.keys}
+            self._fetched_at = now
+        except Exception as e:
+            self.fetch_errors += 1
+            print(f"Failed to fetch JWKS from Supabase: {e}")
+
+    def get_key(self, kid: Optional[str]):
+        # Callers block on the lock while one of them fetches, so a burst of
+        # requests after expiry costs one round trip
+        with self._lock:
+            now = time.monotonic()
+            stale = self._fetched_at is None or now - self._fetched_at >= self.ttl
+            refreshed = stale and now - self._attempted_at >= self.min_refresh
+            if refreshed:
+                self._refresh(now)
+
+            key = self._lookup(kid)
+            if key is None and not refreshed and now - self._miss_refreshed_at >= self.min_refresh:
+                self._miss_refreshed_at = now
+                self._refresh(now)
+                key = self._lookup(kid)
+
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unknown signing key: {kid}")
+        return key
+
+    def _lookup(self, kid: Optional[str]):
+        if kid is None and len(self._keys) == 1:
+            return next(iter(self._keys.values()))
+        return self._keys.get(kid)
+
+    def stats(self) -> Dict:
+        return {
+            "keys": len(self._keys),
+            "age_seconds": round(time.monotonic() - self._fetched_at, 1) if self._fetched_at is not None else None,
+            "fetches": self.fetches,
+            "fetch_errors": self.fetch_errors,
+        }
+
 
+jwks_key_store = JWKSKeyStore(f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else "")
+
+
+# ============== VERIFIED TOKENS ==============
+
+class VerifiedTokenCache:
+    """
+    LRU of already-verified tokens, keyed by SHA-256 of the token, so the
+    parallel calls of a dashboard load verify the signature once.
+    """
+
+    def __init__(self, size: int = ADMIN_TOKEN_CACHE_SIZE, ttl: float = ADMIN_TOKEN_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[0])
+
+    def put(self, token: str, user: dict, exp: Optional[float]) -> None:
+        if not self.size:
+            return
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (dict(user), expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"size": len(self._entries), "capacity": self.size, "hits": self.hits, "misses": self.misses}
+
+
+verified_tokens = VerifiedTokenCache()
+
+
+def get_admin_auth_stats() -> Dict:
+    return {"jwks": jwks_key_store.stats(), "verified_tokens": verified_tokens.stats()}
+
+
+# ============== VERIFICATION ==============
 
 def verify_admin_token(authorization: Optional[str] = Header(None)) -> dict:
     """
@@ -46,6 +176,10 @@ def verify_admin_token(authorization: Optional[str] = Header(None)) -> dict:
 
     token = parts[1]
 
+    cached = verified_tokens.get(token)
+    if cached is not None:
+        return cached
+
     try:
         # Get token algorithm
         header = jwt.get_unverified_header(token)
@@ -53,18 +187,12 @@ def verify_admin_token(authorization: Optional[str] = Header(None)) -> dict:
 
         if algorithm == "ES256":
             # ES256 requires JWKS public key verification
-            from jwt import PyJWKClient
-
             if not SUPABASE_URL:
                 raise HTTPException(status_code=500, detail="SUPABASE_URL not configured")
 
-            jwks_url = f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json"
-            jwks_client = PyJWKClient(jwks_url)
-            signing_key = jwks_client.get_signing_key_from_jwt(token)
-
             payload = jwt.decode(
                 token,
-                signing_key.key,
+                jwks_key_store.get_key(header.get("kid")),
                 algorithms=["ES256"],
                 options={"verify_aud": False}
             )
@@ -89,11 +217,13 @@ def verify_admin_token(authorization: Optional[str] = Header(None)) -> dict:
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token payload - missing user ID")
 
-        return {
+        user = {
             "user_id": user_id,
             "email": email or "unknown",
             "role": payload.get("role", "authenticated"),
         }
+        verified_tokens.put(token, user, payload.get("exp"))
+        return user
 
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
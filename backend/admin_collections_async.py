@@ -0,0 +1,202 @@
+"""
+Admin collections management
+Awaited on the pooled async Supabase client.
+"""
+import asyncio
+from typing import List, Dict, Optional
+from datetime import datetime
+
+from supabase_async import async_supabase as supabase
+from catalog_cache import invalidate_catalog
+from single_flight import async_single_flight
+
+
+async def _with_product_count(collection: Dict) -> Dict:
+    response = await supabase.table("collection_products")\
+        .select("product_id", count="exact", head=True)\
+        .eq("collection_id", collection["id"])\
+        .execute()
+
+    return {
+        **collection,
+        "product_count": response.count or 0
+    }
+
+
+@async_single_flight
+async def get_all_collections() -> List[Dict]:
+    """
+    Get all collections with product count.
+    """
+    try:
+        collections_response = await supabase.table("collections").select("*").order("created_at", desc=True).execute()
+
+        # Product counts for every collection, fetched concurrently
+        return list(await asyncio.gather(*(
+            _with_product_count(collection) for collection in collections_response.data
+        )))
+
+    except Exception as e:
+        print(f"Error fetching collections: {e}")
+        raise
+
+
+async def get_collection_details(collection_id: str) -> Optional[Dict]:
+    """
+    Get collection with all its products.
+    """
+    try:
+        collection_response, products_response = await asyncio.gather(
+            supabase.table("collections").select("*").eq("id", collection_id).single().execute(),
+            supabase.table("collection_products").select(
+                """
+                product_id,
+                added_at,
+                products (
+                    id,
+                    name,
+                    description,
+                    base_price,
+                    product_type,
+                    colour,
+                    image_url,
+                    is_active
+                )
+                """
+            ).eq("collection_id", collection_id).execute()
+        )
+
+        products = [
+            {**item["products"], "added_at": item["added_at"]}
+            for item in products_response.data
+            if item.get("products")
+        ]
+
+        return {
+            **collection_response.data,
+            "products": products
+        }
+
+    except Exception as e:
+        print(f"Error fetching collection details: {e}")
+        return None
+
+
+async def create_collection(name: str, description: str = "") -> Optional[Dict]:
+    """
+    Create a new collection.
+    """
+    try:
+        response = await supabase.table("collections").insert({
+            "name": name,
+            "description": description,
+            "is_dropped": False
+        }).execute()
+        return response.data[0] if response.data else None
+
+    except Exception as e:
+        print(f"Error creating collection: {e}")
+        raise
+
+
+async def update_collection(collection_id: str, name: str = None, description: str = None) -> bool:
+    """
+    Update collection details.
+    """
+    try:
+        update_data = {}
+        if name is not None:
+            update_data["name"] = name
+        if description is not None:
+            update_data["description"] = description
+
+        if update_data:
+            await supabase.table("collections").update(update_data).eq("id", collection_id).execute()
+        return True
+
+    except Exception as e:
+        print(f"Error updating collection: {e}")
+        return False
+
+
+async def delete_collection(collection_id: str) -> bool:
+    """
+    Delete a collection. Products in the collection are NOT deleted.
+    """
+    try:
+        await supabase.table("collections").delete().eq("id", collection_id).execute()
+        return True
+
+    except Exception as e:
+        print(f"Error deleting collection: {e}")
+        raise
+
+
+async def add_products_to_collection(collection_id: str, product_ids: List[str]) -> bool:
+    """
+    Add multiple products to a collection.
+    """
+    try:
+        await supabase.table("collection_products").insert([
+            {"collection_id": collection_id, "product_id": product_id}
+            for product_id in product_ids
+        ]).execute()
+        return True
+
+    except Exception as e:
+        print(f"Error adding products to collection: {e}")
+        raise
+
+
+async def remove_product_from_collection(collection_id: str, product_id: str) -> bool:
+    """
+    Remove a product from a collection.
+    """
+    try:
+        await supabase.table("collection_products").delete().eq("collection_id", collection_id).eq("product_id", product_id).execute()
+        return True
+
+    except Exception as e:
+        print(f"Error removing product from collection: {e}")
+        return False
+
+
+async def _set_dropped(collection_id: str, dropped: bool) -> None:
+    """Set every product in the collection active (dropped) or inactive, then flag the collection."""
+    products_response = await supabase.table("collection_products").select("product_id").eq("collection_id", collection_id).execute()
+    product_ids = [item["product_id"] for item in products_response.data]
+
+    if product_ids:
+        await supabase.table("products").update({"is_active": dropped}).in_("id", product_ids).execute()
+        invalidate_catalog()
+
+    await supabase.table("collections").update({
+        "is_dropped": dropped,
+        "dropped_at": datetime.utcnow().isoformat() if dropped else None
+    }).eq("id", collection_id).execute()
+
+
+async def drop_collection(collection_id: str) -> bool:
+    """
+    "Drop" a collection - mark it as dropped and set all products to active.
+    """
+    try:
+        await _set_dropped(collection_id, True)
+        return True
+
+    except Exception as e:
+        print(f"Error dropping collection: {e}")
+        return False
+
+
+async def undrop_collection(collection_id: str) -> bool:
+    """
+    "Undrop" a collection - mark it as not dropped and set all products to inactive.
+    """
+    try:
+        await _set_dropped(collection_id, False)
+        return True
+
+    except Exception as e:
+        print(f"Error undropping collection: {e}")
+        return False
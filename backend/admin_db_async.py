@@ -0,0 +1,497 @@
+"""
+Admin database queries for orders, products, customers, and analytics
+Awaited on the pooled async Supabase client; query shapes and row helpers
+come from admin_db.py. Independent queries run concurrently.
+"""
+import asyncio
+import uuid
+from typing import Callable, List, Dict, Optional
+from datetime import datetime
+
+from supabase_async import async_supabase as supabase
+from catalog_cache import invalidate_catalog
+from stock_feed import record_stock_change
+from single_flight import async_single_flight
+from upstream import run_blocking
+from database_async import call_rpc
+from pagination import page_result
+import direct_db
+from direct_db import DIRECT_DB_ENABLED, DirectUnavailable, order_stats_from_counts
+from admin_db import (
+    analytics_daily_query,
+    attach_variants,
+    customer_count_query,
+    customer_details,
+    customer_details_queries,
+    customer_sort_column,
+    customers_page_query,
+    order_details_query,
+    order_status_update,
+    orders_page_query,
+    product_costs_query,
+    product_sales_query,
+    recent_orders_query,
+    search_customers_params,
+    search_orders_params,
+    search_page,
+    size_distribution_queries,
+    stock_adjustment_row
+)
+
+
+async def _try_direct(fn: Callable):
+    """Run fn on the direct Postgres pool; None if direct mode is off or unreachable."""
+    if DIRECT_DB_ENABLED:
+        try:
+            return await run_blocking("postgres", fn)
+        except DirectUnavailable as e:
+            print(f"[DIRECT DB] {e} - using PostgREST")
+    return None
+
+
+# ============== ORDERS ==============
+
+async def get_all_orders(
+    limit: int = 20,
+    offset: int = 0,
+    status_filter: str = None,
+    search: str = None,
+    cursor: str = None,
+    count: Optional[str] = "exact"
+) -> Dict:
+    """
+    Get paginated list of orders with filtering, newest first.
+    Returns orders with customer and item count. Pass a next_cursor from a
+    previous page as cursor to page by keyset instead of offset; count is a
+    pagination.COUNT_MODES value or None to skip it. With search, returns
+    search_orders() results instead.
+    """
+    try:
+        # Search results are ranked, not in date order
+        if search:
+            if cursor:
+                raise ValueError("Search results are paged with page/offset, not cursor")
+            return await search_orders(search, status_filter=status_filter, limit=limit, offset=offset)
+
+        response = await orders_page_query(supabase, limit, offset, status_filter, cursor, count).execute()
+
+        return page_result(response.data, limit, "created_at", response.count, None if cursor else offset)
+
+    except Exception as e:
+        print(f"Error fetching orders: {e}")
+        raise
+
+
+async def search_orders(search: str, status_filter: str = None, limit: int = 20, offset: int = 0) -> Dict:
+    """
+    Orders matching an order number, customer email or name, or shipping
+    postcode, best match first (migration_search.sql). Same shape as
+    get_all_orders, with a search_rank on each order.
+    """
+    try:
+        result = await call_rpc("search_orders", search_orders_params(search, status_filter, limit, offset))
+        return search_page(result, limit, offset)
+
+    except Exception as e:
+        print(f"Error searching orders: {e}")
+        raise
+
+
+async def get_order_details(order_id: str) -> Optional[Dict]:
+    """
+    Get full order details including items, customer, and address.
+    """
+    try:
+        response = await order_details_query(supabase, order_id).execute()
+
+        return response.data
+
+    except Exception as e:
+        print(f"Error fetching order details: {e}")
+        return None
+
+
+async def update_order_status(order_id: str, status: str) -> bool:
+    """
+    Update order status and set appropriate timestamp.
+    Valid statuses: paid, shipped, delivered, cancelled, refunded
+    """
+    try:
+        await supabase.table("orders").update(order_status_update(status)).eq("id", order_id).execute()
+        return True
+
+    except Exception as e:
+        print(f"Error updating order status: {e}")
+        return False
+
+
+async def fetch_size_distribution_data() -> Dict[str, List[Dict]]:
+    """
+    Rows needed by compute_size_distribution. Raises on failure.
+    """
+    order_items_query, variants_query = size_distribution_queries(supabase)
+    order_items_response, variants_response = await asyncio.gather(
+        order_items_query.execute(),
+        variants_query.execute()
+    )
+
+    return {"order_items": order_items_response.data, "variants": variants_response.data}
+
+
+async def get_order_stats() -> Dict:
+    """
+    Get order count by status for dashboard.
+    Statuses: paid (payment received), shipped, delivered, cancelled, refunded,
+    plus any other status orders currently have.
+    """
+    try:
+        counts = await _try_direct(direct_db.fetch_order_stats)
+        if counts is not None:
+            return counts
+
+        # All statuses in one grouped query (migration_order_status_counts.sql)
+        response = await supabase.rpc("get_order_status_counts", {}).execute()
+        return order_stats_from_counts(response.data)
+
+    except Exception as e:
+        print(f"Error fetching order stats: {e}")
+        return order_stats_from_counts([])
+
+
+# ============== PRODUCTS & STOCK ==============
+
+async def get_all_products_admin() -> List[Dict]:
+    """
+    Get all products with variants for admin (includes inactive products).
+    """
+    try:
+        products_response, variants_response = await asyncio.gather(
+            supabase.table("products").select("*").execute(),
+            # RPC to bypass PostgREST cache issues
+            supabase.rpc("get_all_product_variants", {}).execute()
+        )
+
+        return attach_variants(products_response.data, variants_response.data)
+
+    except Exception as e:
+        print(f"Error fetching products: {e}")
+        raise
+
+
+async def update_variant_stock(variant_id: str, new_stock: int, reason: str = "manual_adjustment", notes: str = "") -> bool:
+    """
+    Update variant stock and create transaction record.
+    """
+    try:
+        # Get current stock using RPC to bypass PostgREST cache
+        variant_response = await supabase.rpc("get_variant_stock", {"variant_id_param": variant_id}).execute()
+        old_stock = variant_response.data[0]["stock_quantity"]
+
+        await supabase.table("product_variants").update({"stock_quantity": new_stock}).eq("id", variant_id).execute()
+        record_stock_change(variant_id, new_stock)
+
+        await supabase.table("stock_transactions").insert(
+            stock_adjustment_row(variant_id, old_stock, new_stock, reason, notes)
+        ).execute()
+
+        invalidate_catalog()
+        return True
+
+    except Exception as e:
+        print(f"Error updating stock: {e}")
+        return False
+
+
+async def get_low_stock_variants(threshold: int = 5) -> List[Dict]:
+    """
+    Get variants with stock below threshold.
+    Only shows variants with stock > 0 but below threshold.
+    """
+    try:
+        response = await supabase.rpc("get_low_stock_variants", {"threshold": threshold}).execute()
+        return response.data
+
+    except Exception as e:
+        print(f"Error fetching low stock variants: {e}")
+        return []
+
+
+async def create_product(name: str, description: str, base_price: int, product_type: str = None, colour: str = None, image_url: str = None, is_active: bool = True, unit_cost: int = 0) -> Optional[Dict]:
+    """
+    Create a new product.
+    ID is auto-generated by Supabase trigger.
+    """
+    try:
+        response = await supabase.table("products").insert({
+            "name": name,
+            "description": description,
+            "base_price": base_price,
+            "product_type": product_type,
+            "colour": colour,
+            "image_url": image_url,
+            "is_active": is_active,
+            "unit_cost": unit_cost
+        }).execute()
+
+        print(f"[PRODUCT DEBUG] Product created successfully: {response.data}")
+        invalidate_catalog()
+        return response.data[0] if response.data else None
+
+    except Exception as e:
+        print(f"[PRODUCT DEBUG] Error creating product: {e}")
+        raise
+
+
+async def create_product_variant(product_id: str, size_name: str, price_adjustment: int = 0, stock_quantity: int = 0) -> Optional[Dict]:
+    """
+    Create a product variant (size).
+    SKU is auto-generated by Supabase trigger based on product_type, colour, and size.
+    """
+    try:
+        response = await supabase.table("product_variants").insert({
+            "product_id": product_id,
+            "size": size_name,
+            "price_adjustment": price_adjustment,
+            "stock_quantity": stock_quantity
+        }).execute()
+
+        print(f"[VARIANT DEBUG] Variant created successfully: {response.data}")
+        invalidate_catalog()
+        return response.data[0] if response.data else None
+
+    except Exception as e:
+        print(f"[VARIANT DEBUG] Error creating variant: {e}")
+        raise
+
+
+async def delete_product(product_id: str) -> dict:
+    """
+    Delete a product if it has no orders, otherwise mark it as inactive.
+    Returns dict with 'action' (deleted/deactivated) and 'message'.
+    """
+    try:
+        # Variants to check for orders, and the image to clean up if we delete
+        variants_response, product_response = await asyncio.gather(
+            supabase.table("product_variants").select("id").eq("product_id", product_id).execute(),
+            supabase.table("products").select("image_url").eq("id", product_id).single().execute()
+        )
+
+        variant_ids = [v["id"] for v in variants_response.data]
+
+        has_orders = False
+        if variant_ids:
+            order_items_response = await supabase.table("order_items")\
+                .select("id")\
+                .in_("product_variant_id", variant_ids)\
+                .limit(1)\
+                .execute()
+
+            has_orders = len(order_items_response.data) > 0
+
+        if has_orders:
+            # Product has been ordered - mark as inactive instead
+            await supabase.table("products").update({"is_active": False}).eq("id", product_id).execute()
+
+            invalidate_catalog()
+            return {
+                "action": "deactivated",
+                "message": "Product has existing orders and was marked as inactive instead of deleted."
+            }
+
+        # Delete the product (variants should cascade)
+        await supabase.table("products").delete().eq("id", product_id).execute()
+        invalidate_catalog()
+
+        product = product_response.data
+        if product and product.get("image_url") and "product-images/" in product["image_url"]:
+            filename = product["image_url"].split("product-images/")[-1]
+            try:
+                await supabase.storage_remove("product-images", [filename])
+            except Exception as img_error:
+                # Don't fail the whole operation if image deletion fails
+                print(f"[DELETE DEBUG] Warning: Failed to delete image: {img_error}")
+
+        print(f"[DELETE DEBUG] Product deleted successfully: {product_id}")
+        return {
+            "action": "deleted",
+            "message": "Product deleted successfully."
+        }
+
+    except Exception as e:
+        print(f"[DELETE DEBUG] Error deleting product: {e}")
+        raise
+
+
+async def upload_product_image(file_bytes: bytes, filename: str) -> Optional[str]:
+    """
+    Upload product image to Supabase Storage.
+    Returns the public URL of the uploaded image.
+    """
+    try:
+        bucket_name = "product-images"
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        unique_filename = f"{timestamp}_{uuid.uuid4().hex[:8]}_{filename}"
+
+        await supabase.storage_upload(bucket_name, unique_filename, file_bytes, "image/jpeg")
+
+        return supabase.storage_public_url(bucket_name, unique_filename)
+
+    except Exception as e:
+        print(f"Error uploading image: {e}")
+        raise
+
+
+# ============== CUSTOMERS ==============
+
+async def get_all_customers(
+    limit: int = 50,
+    offset: int = 0,
+    search: str = None,
+    sort: str = "created_at",
+    cursor: str = None,
+    count: Optional[str] = "exact"
+) -> Dict:
+    """
+    Get paginated list of customers with order count and total spent.
+    sort: one of CUSTOMER_SORTS, newest / highest first. cursor and count
+    work as in get_all_orders. With search, returns search_customers()
+    results instead.
+    """
+    try:
+        column = customer_sort_column(sort)
+
+        # Search results are ranked, not in sort order
+        if search:
+            if cursor:
+                raise ValueError("Search results are paged with page/offset, not cursor")
+            return await search_customers(search, limit=limit, offset=offset)
+
+        response = await customers_page_query(supabase, column, limit, offset, cursor, count).execute()
+
+        return page_result(response.data, limit, column, response.count, None if cursor else offset)
+
+    except Exception as e:
+        print(f"Error fetching customers: {e}")
+        raise
+
+
+async def search_customers(search: str, limit: int = 50, offset: int = 0) -> Dict:
+    """
+    Customers matching an email or name, best match first
+    (migration_search.sql). Same shape as get_all_customers, with a
+    search_rank on each customer.
+    """
+    try:
+        result = await call_rpc("search_customers", search_customers_params(search, limit, offset))
+        return search_page(result, limit, offset)
+
+    except Exception as e:
+        print(f"Error searching customers: {e}")
+        raise
+
+
+async def get_customer_details(customer_id: str) -> Optional[Dict]:
+    """
+    Get customer with full order history.
+    """
+    try:
+        customer_query, orders_query, addresses_query = customer_details_queries(supabase, customer_id)
+        customer_response, orders_response, addresses_response = await asyncio.gather(
+            customer_query.execute(),
+            orders_query.execute(),
+            addresses_query.execute()
+        )
+
+        return customer_details(customer_response.data, orders_response.data, addresses_response.data)
+
+    except Exception as e:
+        print(f"Error fetching customer details: {e}")
+        return None
+
+
+# ============== ANALYTICS ==============
+
+async def fetch_analytics_daily() -> List[Dict]:
+    """Per-day order totals from the analytics rollup (cancelled and refunded excluded)."""
+    days = await _try_direct(direct_db.fetch_analytics_daily)
+    if days is not None:
+        return days
+
+    response = await analytics_daily_query(supabase).execute()
+    return response.data
+
+
+async def fetch_product_sales() -> List[Dict]:
+    """Units sold per product name from the analytics rollup, for top products and COGS."""
+    sales = await _try_direct(direct_db.fetch_product_sales)
+    if sales is not None:
+        return sales
+
+    response = await product_sales_query(supabase).execute()
+    return response.data
+
+
+async def fetch_recent_orders() -> List[Dict]:
+    """Newest orders for the dashboard, excluding cancelled and refunded."""
+    orders = await _try_direct(direct_db.fetch_recent_orders)
+    if orders is not None:
+        return orders
+
+    response = await recent_orders_query(supabase).execute()
+    return response.data
+
+
+async def fetch_product_costs() -> List[Dict]:
+    """Product costs and stock on hand, for COGS and inventory value."""
+    products = await _try_direct(direct_db.fetch_product_costs)
+    if products is not None:
+        return products
+
+    response = await product_costs_query(supabase).execute()
+    return response.data
+
+
+async def count_customers() -> int:
+    count = await _try_direct(direct_db.count_customers)
+    if count is not None:
+        return count
+
+    response = await customer_count_query(supabase).execute()
+    return response.count or 0
+
+
+@async_single_flight
+async def fetch_analytics_data() -> Dict:
+    """
+    Rows needed by compute_analytics_overview, fetched concurrently. Raises on failure.
+    """
+    daily, product_sales, products, recent_orders, order_stats, total_customers = await asyncio.gather(
+        fetch_analytics_daily(),
+        fetch_product_sales(),
+        fetch_product_costs(),
+        fetch_recent_orders(),
+        get_order_stats(),
+        count_customers()
+    )
+
+    return {
+        "daily": daily,
+        "product_sales": product_sales,
+        "products": products,
+        "recent_orders": recent_orders,
+        "order_stats": order_stats,
+        "total_customers": total_customers
+    }
+
+
+async def rebuild_analytics_rollups() -> Dict:
+    """
+    Recompute the analytics rollup tables from every order. The triggers keep
+    them current; this is for backfills and repairs. Returns {"days", "products"}.
+    """
+    try:
+        return await call_rpc("rebuild_analytics_rollups", {})
+
+    except Exception as e:
+        print(f"Error rebuilding analytics rollups: {e}")
+        raise
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Benchmark order confirmation rendering: the old per-order f-string with the
+logo embedded as a base64 data URI vs. the pre-minified templates in
+email_templates with the logo referenced by URL.
+
+Reports render time and the size of the Resend request body per message.
+Nothing is sent.
+
+Usage: python bench_email_templates.py [--number 2000]
+"""
+import argparse
+import base64
+import json
+import os
+import timeit
+from datetime import datetime
+
+import email_templates
+
+LOGO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "public", "img", "logo-green.png")
+
+
+def load_logo_data_uri():
+    try:
+        with open(LOGO_PATH, "rb") as logo_file:
+            return f"data:image/png;base64,{base64.b64encode(logo_file.read()).decode('utf-8')}"
+    except Exception as e:
+        print(f"Warning: Could not load logo image: {e}")
+        return ""
+
+
+def legacy_render(logo_data_uri, order_number, shipping_name, items, total_amount, shipping_cost, shipping_address):
+    """The old stripe_webhook confirmation body, as it was built per order."""
+    items_html = ""
+    for item in items:
+        line_total = item["price"] * item["quantity"]
+        items_html += f"""
+                    <tr>
+                        <td style="padding: 10px; border-bottom: 1px solid #eee;">
+                            {item['name']}<br>
+                            <span style="color: #666; font-size: 12px;">Size: {item['size']}</span>
+                        </td>
+                        <td style="padding: 10px; border-bottom: 1px solid #eee; text-align: center;">{item['quantity']}</td>
+                        <td style="padding: 10px; border-bottom: 1px solid #eee; text-align: right;">£{(line_total / 100):.2f}</td>
+                    </tr>
+                    """
+
+    subtotal = total_amount - shipping_cost
+    free_shipping_note = ""
+    if shipping_cost == 0 and subtotal >= 5000:
+        free_shipping_note = ' <span style="color: #00ff00; font-size: 12px;">(Free on orders over £50)</span>'
+
+    return f"""
+                <html>
+                <body style="font-family: Arial, sans-serif; color: #333; max-width: 600px; margin: 0 auto;">
+                    <div style="background: #000; padding: 30px 20px; text-align: center;">
+                        <img src="{logo_data_uri}" alt="PLAGUED" style="max-width: 200px; height: auto;">
+                    </div>
+                    <div style="padding: 30px 20px;">
+                        <h2 style="color: #00ff00;">Order Confirmed!</h2>
+                        <p>Thanks for your order, {shipping_name}! We'll ship it out soon.</p>
+                        <div style="background: #f5f5f5; padding: 15px; margin: 20px 0; border-left: 4px solid #00ff00;">
+                            <strong>Order Number:</strong> {order_number}<br>
+                            <strong>Order Date:</strong> {datetime.utcnow().strftime('%d %B %Y')}
+                        </div>
+                        <h3 style="margin-top: 30px;">Order Items</h3>
+                        <table style="width: 100%; border-collapse: collapse;">
+                            <thead>
+                                <tr style="background: #f5f5f5;">
+                                    <th style="padding: 10px; text-align: left;">Item</th>
+                                    <th style="padding: 10px; text-align: center;">Qty</th>
+                                    <th style="padding: 10px; text-align: right;">Price</th>
+                                </tr>
+                            </thead>
+                            <tbody>
+                                {items_html}
+                            </tbody>
+                            <tfoot>
+                                <tr>
+                                    <td colspan="2" style="padding: 10px; text-align: right;">Subtotal:</td>
+                                    <td style="padding: 10px; text-align: right;">£{(subtotal / 100):.2f}</td>
+                                </tr>
+                                <tr>
+                                    <td colspan="2" style="padding: 10px; text-align: right;">Shipping:{free_shipping_note}</td>
+                                    <td style="padding: 10px; text-align: right;">£{(shipping_cost / 100):.2f}</td>
+                                </tr>
+                                <tr>
+                                    <td colspan="2" style="padding: 15px 10px; text-align: right; font-weight: bold; border-top: 2px solid #00ff00;">Total:</td>
+                                    <td style="padding: 15px 10px; text-align: right; font-weight: bold; color: #00ff00; font-size: 18px; border-top: 2px solid #00ff00;">£{(total_amount / 100):.2f}</td>
+                                </tr>
+                            </tfoot>
+                        </table>
+                        <h3 style="margin-top: 30px;">Shipping Address</h3>
+                        <div style="background: #f5f5f5; padding: 15px;">
+                            {shipping_name}<br>
+                            {shipping_address.get('line1', '')}<br>
+                            {shipping_address.get('line2', '') + '<br>' if shipping_address.get('line2') else ''}
+                            {shipping_address.get('city', '')}, {shipping_address.get('postal_code', '')}<br>
+                            {shipping_address.get('country', 'GB')}
+                        </div>
+                        <p style="margin-top: 30px; color: #666; font-size: 14px;">
+                            You'll receive another email with tracking information once your order ships.
+                        </p>
+                        <p style="margin-top: 20px;">
+                            Questions? Email us at <a href="mailto:contact@plagueduk.com" style="color: #00ff00;">contact@plagueduk.com</a>
+                        </p>
+                    </div>
+                    <div style="background: #f5f5f5; padding: 20px; text-align: center; font-size: 12px; color: #666;">
+                        <p style="margin: 0;">Plagued - Death Metal from the UK</p>
+                        <p style="margin: 5px 0 0 0;">contact@plagueduk.com</p>
+                    </div>
+                </body>
+                </html>
+                """
+
+
+def make_items(lines):
+    return [
+        {"id": f"product-{i}", "name": f"Malediction Tour Shirt {i}", "size": "L", "price": 2000, "quantity": 1}
+        for i in range(lines)
+    ]
+
+
+def request_bytes(html):
+    """Size of the Resend request body carrying this message."""
+    return len(json.dumps({
+        "from": "contact@plagueduk.com",
+        "to": ["customer@example.com"],
+        "subject": "Order Confirmation - ORD-2024-0001",
+        "html": html
+    }).encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=2000, help="Renders per timing (default 2000)")
+    args = parser.parse_args()
+
+    logo_data_uri = load_logo_data_uri()
+    address = {"line1": "1 Grave Lane", "line2": "Flat 6", "city": "London", "postal_code": "E1 6AN", "country": "GB"}
+
+    print(f"Logo data URI: {len(logo_data_uri):,} bytes, {args.number} renders per case\n")
+    print(f"{'lines':>5}  {'legacy us':>9}  {'template us':>11}  {'legacy bytes':>12}  {'template bytes':>14}")
+
+    for lines in (1, 5, 20):
+        items = make_items(lines)
+        total = 2000 * lines + 499
+
+        def legacy():
+            return legacy_render(logo_data_uri, "ORD-2024-0001", "Jane Doe", items, total, 499, address)
+
+        def templated():
+            return email_templates.render_order_confirmation(
+                order_number="ORD-2024-0001",
+                customer_name="Jane Doe",
+                items=items,
+                total_amount=total,
+                shipping_amount=499,
+                shipping_address=address
+            )
+
+        legacy_us = min(timeit.repeat(legacy, number=args.number, repeat=3)) / args.number * 1e6
+        template_us = min(timeit.repeat(templated, number=args.number, repeat=3)) / args.number * 1e6
+        print(
+            f"{lines:>5}  {legacy_us:>9.1f}  {template_us:>11.1f}  "
+            f"{request_bytes(legacy()):>12,}  {request_bytes(templated()):>14,}"
+        )
+
+
+if __name__ == "__main__":
+    main()
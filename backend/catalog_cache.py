@@ -0,0 +1,253 @@
+"""
+In-process cache for the storefront merch catalog
+Holds the built /api/merch response in memory and is invalidated whenever
+stock or product visibility changes.
+
+When the background refresher is running, requests are always served the
+last good snapshot (stale-while-revalidate) and a failed Supabase refresh
+keeps the previous snapshot instead of failing the request.
+"""
+import asyncio
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+from single_flight import single_flight
+from stock_feed import sync_from_catalog
+from upstream import run_blocking
+
+# Seconds a built catalog is served before it is rebuilt (when the refresher isn't running)
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "30"))
+
+# Seconds between background refreshes (0 disables the refresher)
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "15"))
+
+# Distinguishes catalog versions across restarts / workers (versions restart at 0)
+CATALOG_INSTANCE_ID = uuid.uuid4().hex[:8]
+
+_lock = threading.Lock()
+
+# Last good snapshot - kept across invalidations and failed refreshes
+_catalog: Optional[List[Dict]] = None
+_loaded_at = 0.0
+_dirty = True
+
+# Generation the snapshot was loaded at - an older load never replaces it
+_snapshot_generation = -1
+
+# Bumped on every invalidation - detects writes that land mid-load
+_generation = 0
+
+# Bumped whenever the catalog content actually changes - used for ETags
+_version = 0
+
+# Refresher state and stats
+_refresher_running = False
+_wake: Optional[asyncio.Event] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_stats = {
+    "refreshes": 0,
+    "refresh_failures": 0,
+    "last_refresh_ms": None,
+    "max_refresh_ms": None,
+    "last_error": None,
+    "last_refresh_failed": False,
+}
+
+
+@single_flight
+def _load_generation(generation: int, loader: Callable[[], List[Dict]]) -> List[Dict]:
+    """
+    Call loader() once for concurrent loads of the same generation. Keyed on
+    the generation so a caller arriving after an invalidation starts a fresh
+    load instead of joining one that may have read the data before the write.
+    """
+    return loader()
+
+
+def _load(loader: Callable[[], List[Dict]]) -> Tuple[List[Dict], int]:
+    """
+    Call loader() and store the result. On failure, fall back to the last good
+    snapshot if there is one.
+    """
+    global _catalog, _loaded_at, _dirty, _version, _snapshot_generation
+
+    with _lock:
+        generation_at_load = _generation
+
+    started = time.perf_counter()
+    try:
+        catalog = _load_generation(generation_at_load, loader)
+    except Exception as e:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with _lock:
+            _stats["refresh_failures"] += 1
+            _stats["last_refresh_ms"] = round(elapsed_ms, 1)
+            _stats["last_error"] = f"{type(e).__name__}: {e}"
+            _stats["last_refresh_failed"] = True
+            if _catalog is not None:
+                print(f"[CATALOG] Refresh failed, serving stale snapshot: {e}")
+                return _catalog, _version
+        raise
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    with _lock:
+        _stats["refreshes"] += 1
+        _stats["last_refresh_ms"] = round(elapsed_ms, 1)
+        _stats["max_refresh_ms"] = round(max(elapsed_ms, _stats["max_refresh_ms"] or 0), 1)
+        _stats["last_refresh_failed"] = False
+
+        # A load that started after this one already stored a newer snapshot
+        if generation_at_load < _snapshot_generation:
+            return _catalog, _version
+
+        if catalog != _catalog:
+            _version += 1
+
+        # Keep the load even if a write landed while we were loading (it is
+        # still the newest we have), but stay dirty so it gets rebuilt
+        _catalog = catalog
+        _loaded_at = time.monotonic()
+        _snapshot_generation = generation_at_load
+        _dirty = _generation != generation_at_load
+        version = _version
+        raced = _dirty
+
+    # Skip raced loads - they may carry stock levels older than a recorded write
+    if not raced:
+        sync_from_catalog(catalog)
+
+    return catalog, version
+
+
+def _servable_snapshot() -> Optional[Tuple[List[Dict], int]]:
+    """
+    (catalog, version) if the snapshot can be served as is, None if it needs a load.
+    While the background refresher is running the last good snapshot is always
+    served - invalidations wake the refresher instead of blocking the request.
+    """
+    with _lock:
+        if _catalog is not None:
+            if _refresher_running:
+                return _catalog, _version
+            if not _dirty and time.monotonic() - _loaded_at < CATALOG_CACHE_TTL:
+                return _catalog, _version
+    return None
+
+
+def get_catalog_snapshot(loader: Callable[[], List[Dict]]) -> Tuple[List[Dict], int]:
+    """
+    Return (catalog, version).
+    Rebuilds inline when invalidated or older than CATALOG_CACHE_TTL (unless
+    the background refresher is running).
+    """
+    return _servable_snapshot() or _load(loader)
+
+
+async def get_catalog_snapshot_async(loader: Callable[[], List[Dict]]) -> Tuple[List[Dict], int]:
+    """
+    get_catalog_snapshot for async routes. A servable snapshot is returned on
+    the event loop; only an inline rebuild goes to the Supabase thread pool.
+    """
+    snapshot = _servable_snapshot()
+    if snapshot is not None:
+        return snapshot
+    return await run_blocking("supabase", _load, loader)
+
+
+def get_catalog(loader: Callable[[], List[Dict]]) -> List[Dict]:
+    """
+    Return the cached catalog, rebuilding it with loader() when stale.
+    """
+    return get_catalog_snapshot(loader)[0]
+
+
+def invalidate_catalog() -> None:
+    """
+    Mark the cached catalog stale. Call after any write that changes stock
+    levels or which products are visible on the storefront.
+    """
+    global _dirty, _generation
+
+    with _lock:
+        _dirty = True
+        _generation += 1
+
+    # Wake the refresher so the rebuild doesn't wait for the next interval
+    if _refresher_running and _loop is not None and _wake is not None:
+        _loop.call_soon_threadsafe(_wake.set)
+
+
+def get_catalog_version() -> int:
+    """
+    Counter bumped each time the cached catalog content changes.
+    """
+    return _version
+
+
+def get_catalog_age() -> Optional[float]:
+    """
+    Seconds since the snapshot being served was loaded, or None if never loaded.
+    """
+    if _catalog is None:
+        return None
+    return time.monotonic() - _loaded_at
+
+
+def catalog_etag(version: int) -> str:
+    """
+    ETag for a catalog version.
+    """
+    return f'"merch-{CATALOG_INSTANCE_ID}-{version}"'
+
+
+def get_catalog_stats() -> Dict:
+    """
+    Refresh latency and staleness for the metrics endpoint.
+    """
+    age = get_catalog_age()
+    with _lock:
+        return {
+            **_stats,
+            "version": _version,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "dirty": _dirty,
+            "refresher_running": _refresher_running,
+            "refresh_interval": CATALOG_REFRESH_INTERVAL,
+        }
+
+
+# ============== BACKGROUND REFRESHER ==============
+
+async def run_catalog_refresher(loader: Callable[[], List[Dict]], interval: float = CATALOG_REFRESH_INTERVAL) -> None:
+    """
+    Keep the catalog snapshot warm. Refreshes every `interval` seconds, or
+    immediately after an invalidation. Run as an asyncio task.
+    """
+    global _refresher_running, _wake, _loop
+
+    _loop = asyncio.get_running_loop()
+    _wake = asyncio.Event()
+    _refresher_running = True
+    print(f"[CATALOG] Background refresher started (every {interval}s)")
+
+    try:
+        while True:
+            # Clear before loading so an invalidation mid-load triggers another pass
+            _wake.clear()
+            try:
+                await run_blocking("supabase", _load, loader)
+            except Exception as e:
+                # No snapshot to fall back on yet - requests will retry inline
+                print(f"[CATALOG] Initial refresh failed: {e}")
+
+            try:
+                await asyncio.wait_for(_wake.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        _refresher_running = False
+        print("[CATALOG] Background refresher stopped")
@@ -7,6 +7,23 @@ from datetime import datetime
 from uuid import UUID
 
 from supabase_client import supabase
+from catalog_cache import invalidate_catalog
+from stock_feed import record_stock_change
+from direct_db import DIRECT_DB_ENABLED, DirectUnavailable, direct_pool, fetch_catalog, fetch_variant_stock
+
+
+def call_rpc(function: str, params: Dict):
+    """
+    Call a database function over the direct connection when enabled,
+    otherwise (or if it can't be reached) through PostgREST.
+    """
+    if DIRECT_DB_ENABLED:
+        try:
+            return direct_pool.call(function, params)
+        except DirectUnavailable as e:
+            print(f"[DIRECT DB] {e} - using PostgREST")
+
+    return supabase.rpc(function, params).execute().data
 
 
 # ============== PRODUCTS & VARIANTS ==============
@@ -17,6 +34,12 @@ def get_all_products_with_stock() -> List[Dict]:
     Returns format compatible with frontend expectations.
     """
     try:
+        if DIRECT_DB_ENABLED:
+            try:
+                return build_merch_products(*fetch_catalog())
+            except DirectUnavailable as e:
+                print(f"[DIRECT DB] {e} - using PostgREST")
+
         # Fetch products
         products_response = supabase.table("products")\
             .select("*")\
@@ -32,195 +55,133 @@ def get_all_products_with_stock() -> List[Dict]:
 
         variants = variants_response.data
 
-        # Group variants by product_id
-        variants_by_product = {}
-        for variant in variants:
-            product_id = variant["product_id"]
-            if product_id not in variants_by_product:
-                variants_by_product[product_id] = []
-            variants_by_product[product_id].append(variant)
-
-        # Transform to frontend format
-        result = []
-        for product in products:
-            product_variants = variants_by_product.get(product["id"], [])
-
-            # Build sizes array with stock info
-            sizes = []
-            has_any_stock = False
-            for variant in product_variants:
-                size_info = {
-                    "size": variant["size"],
-                    "stock": variant["stock_quantity"],
-                    "variant_id": variant["id"],
-                    "available": variant["stock_quantity"] > 0
-                }
-                sizes.append(size_info)
-                if variant["stock_quantity"] > 0:
-                    has_any_stock = True
-
-            result.append({
-                "id": product["id"],
-                "name": product["name"],
-                "description": product["description"],
-                "price": product["base_price"],
-                "image": product["image_url"],
-                "sizes": sizes,
-                "inStock": has_any_stock
-            })
-
-        return result
+        return build_merch_products(products, variants)
 
     except Exception as e:
         print(f"Error fetching products: {e}")
         raise
 
 
-def check_stock_availability(items: List[Dict]) -> Tuple[bool, Optional[str]]:
+def build_merch_products(products: List[Dict], variants: List[Dict]) -> List[Dict]:
     """
-    Validate stock availability for cart items.
-    Returns (is_available, error_message)
+    Join products with their variants in the frontend merch format.
     """
-    try:
-        for item in items:
-            # Find variant by product_id and size
-            response = supabase.table("product_variants")\
-                .select("stock_quantity, size")\
-                .eq("product_id", item["id"])\
-                .eq("size", item["size"])\
-                .single()\
-                .execute()
-
-            if not response.data:
-                return False, f"{item['name']} (Size: {item['size']}) is no longer available"
-
-            variant = response.data
-            if variant["stock_quantity"] < item["quantity"]:
-                return False, f"Insufficient stock for {item['name']} (Size: {item['size']}). Only {variant['stock_quantity']} remaining."
+    # Group variants by product_id
+    variants_by_product = {}
+    for variant in variants:
+        product_id = variant["product_id"]
+        if product_id not in variants_by_product:
+            variants_by_product[product_id] = []
+        variants_by_product[product_id].append(variant)
+
+    # Transform to frontend format
+    result = []
+    for product in products:
+        product_variants = variants_by_product.get(product["id"], [])
+
+        # Build sizes array with stock info
+        sizes = []
+        has_any_stock = False
+        for variant in product_variants:
+            size_info = {
+                "size": variant["size"],
+                "stock": variant["stock_quantity"],
+                "variant_id": variant["id"],
+                "available": variant["stock_quantity"] > 0
+            }
+            sizes.append(size_info)
+            if variant["stock_quantity"] > 0:
+                has_any_stock = True
 
-        return True, None
+        result.append({
+            "id": product["id"],
+            "name": product["name"],
+            "description": product["description"],
+            "price": product["base_price"],
+            "image": product["image_url"],
+            "sizes": sizes,
+            "inStock": has_any_stock
+        })
 
-    except Exception as e:
-        print(f"Error checking stock: {e}")
-        return False, "Unable to verify stock availability"
+    return result
 
 
-def decrement_stock(items: List[Dict], order_id: UUID) -> bool:
+def variant_stock_query(client, product_ids: List[str]):
     """
-    Decrement stock for purchased items and record transaction.
-    Uses atomic operations to prevent overselling.
+    Stock rows (product_id, size, stock_quantity) for the given products.
+    Takes the sync or async client; callers execute it.
     """
-    try:
-        for item in items:
-            # Get current stock
-            variant_response = supabase.table("product_variants")\
-                .select("id, stock_quantity")\
-                .eq("product_id", item["id"])\
-                .eq("size", item["size"])\
-                .single()\
-                .execute()
-
-            if not variant_response.data:
-                raise ValueError(f"Variant not found: {item['id']} - {item['size']}")
-
-            variant = variant_response.data
-            variant_id = variant["id"]
-            current_stock = variant["stock_quantity"]
-
-            # Check stock availability
-            if current_stock < item["quantity"]:
-                raise ValueError(f"Insufficient stock for {item['name']} (Size: {item['size']})")
-
-            new_stock = current_stock - item["quantity"]
-
-            # Update stock
-            supabase.table("product_variants")\
-                .update({"stock_quantity": new_stock})\
-                .eq("id", variant_id)\
-                .execute()
-
-            # Record stock transaction
-            supabase.table("stock_transactions")\
-                .insert({
-                    "product_variant_id": variant_id,
-                    "order_id": str(order_id),
-                    "transaction_type": "sale",
-                    "quantity_change": -item["quantity"],
-                    "stock_before": current_stock,
-                    "stock_after": new_stock,
-                    "created_by": "system",
-                    "notes": f"Order {order_id}"
-                })\
-                .execute()
+    return client.table("product_variants")\
+        .select("product_id, size, stock_quantity")\
+        .in_("product_id", product_ids)
 
-        return True
 
-    except Exception as e:
-        print(f"Error decrementing stock: {e}")
-        raise
-
-
-# ============== CUSTOMERS & ADDRESSES ==============
-
-def find_or_create_customer(email: str, name: Optional[str] = None) -> UUID:
+def find_stock_problem(items: List[Dict], variants: List[Dict]) -> Optional[str]:
     """
-    Find existing customer by email or create new one.
+    Check cart items against fetched variant rows (product_id, size, stock_quantity).
+    Returns an error message for the first line that can't be fulfilled, or None.
     """
-    try:
-        # Check if customer exists
-        response = supabase.table("customers")\
-            .select("id")\
-            .eq("email", email)\
-            .limit(1)\
-            .execute()
+    stock_by_variant = {
+        (variant["product_id"], variant["size"]): variant["stock_quantity"]
+        for variant in variants
+    }
 
-        if response.data:
-            return response.data[0]["id"]
+    # The same product/size can appear on more than one cart line
+    requested = {}
+    for item in items:
+        key = (item["id"], item["size"])
+        requested[key] = requested.get(key, 0) + item["quantity"]
 
-        # Create new customer
-        new_customer = supabase.table("customers")\
-            .insert({"email": email, "name": name})\
-            .execute()
+    for item in items:
+        key = (item["id"], item["size"])
+        if key not in stock_by_variant:
+            return f"{item['name']} (Size: {item['size']}) is no longer available"
 
-        return new_customer.data[0]["id"]
+        stock_quantity = stock_by_variant[key]
+        if stock_quantity < requested[key]:
+            return f"Insufficient stock for {item['name']} (Size: {item['size']}). Only {stock_quantity} remaining."
 
-    except Exception as e:
-        print(f"Error finding/creating customer: {e}")
-        raise
+    return None
 
 
-def create_address(customer_id: UUID, shipping_data: Dict) -> UUID:
+def check_stock_availability(items: List[Dict]) -> Tuple[bool, Optional[str]]:
     """
-    Create shipping address record.
+    Validate stock availability for cart items.
+    Returns (is_available, error_message)
     """
     try:
-        address_data = {
-            "customer_id": str(customer_id),
-            "name": shipping_data.get("name", ""),
-            "line1": shipping_data.get("address", {}).get("line1", ""),
-            "line2": shipping_data.get("address", {}).get("line2"),
-            "city": shipping_data.get("address", {}).get("city", ""),
-            "state": shipping_data.get("address", {}).get("state"),
-            "postal_code": shipping_data.get("address", {}).get("postal_code", ""),
-            "country": shipping_data.get("address", {}).get("country", "GB")
-        }
-
-        response = supabase.table("addresses")\
-            .insert(address_data)\
-            .execute()
+        if not items:
+            return True, None
+
+        # Fetch every variant for the cart's products in one round trip
+        product_ids = list({item["id"] for item in items})
+        variants = None
+        if DIRECT_DB_ENABLED:
+            try:
+                variants = fetch_variant_stock(product_ids)
+            except DirectUnavailable as e:
+                print(f"[DIRECT DB] {e} - using PostgREST")
 
-        return response.data[0]["id"]
+        if variants is None:
+            variants = variant_stock_query(supabase, product_ids).execute().data
+
+        error_message = find_stock_problem(items, variants)
+        if error_message:
+            return False, error_message
+
+        return True, None
 
     except Exception as e:
-        print(f"Error creating address: {e}")
-        raise
+        print(f"Error checking stock: {e}")
+        return False, "Unable to verify stock availability"
 
 
 # ============== ORDERS ==============
 
-def create_order(
-    customer_id: UUID,
-    address_id: UUID,
+def place_order(
+    customer_email: str,
+    customer_name: str,
+    shipping: Dict,
     items: List[Dict],
     total_amount: int,
     stripe_payment_intent_id: str,
@@ -228,87 +189,52 @@ def create_order(
     discount_code_id: Optional[UUID] = None
 ) -> Dict:
     """
-    Create order with items.
-    Returns order record with order_number.
+    Create customer, address, order, order items, discount usage and stock
+    decrement in a single transactional RPC (see migration_place_order.sql).
+    Returns the order record with "already_exists" set if an order for this
+    payment intent was already placed. Raises (with nothing written) on failure.
     """
     try:
-        # Calculate subtotal
-        subtotal = sum(item["price"] * item["quantity"] for item in items)
-
-        # Generate order number
-        order_number_response = supabase.rpc("generate_order_number").execute()
-        order_number = order_number_response.data
-
-        # Create order
-        order_data = {
-            "order_number": order_number,
-            "customer_id": str(customer_id),
-            "shipping_address_id": str(address_id),
-            "status": "paid",  # Orders are created when payment succeeds (webhook fires)
-            "subtotal_amount": subtotal,
-            "shipping_amount": shipping_amount,
-            "total_amount": total_amount,
-            "currency": "gbp",
-            "stripe_payment_intent_id": stripe_payment_intent_id,
-            "paid_at": datetime.utcnow().isoformat()
-        }
-
-        # Add discount code if provided
-        if discount_code_id:
-            order_data["discount_code_id"] = str(discount_code_id)
-
-        order_response = supabase.table("orders")\
-            .insert(order_data)\
-            .execute()
-
-        order = order_response.data[0]
-        order_id = order["id"]
-
-        # Create order items
-        for item in items:
-            # Get variant details
-            variant_response = supabase.table("product_variants")\
-                .select("id")\
-                .eq("product_id", item["id"])\
-                .eq("size", item["size"])\
-                .single()\
-                .execute()
-
-            variant_id = variant_response.data["id"]
-
-            order_item_data = {
-                "order_id": order_id,
-                "product_variant_id": variant_id,
-                "product_name": item["name"],
-                "product_size": item["size"],
-                "product_image_url": item.get("image"),
-                "quantity": item["quantity"],
-                "unit_price": item["price"],
-                "line_total": item["price"] * item["quantity"]
-            }
-
-            supabase.table("order_items")\
-                .insert(order_item_data)\
-                .execute()
+        order = call_rpc("place_order", {
+            "p_payment_intent_id": stripe_payment_intent_id,
+            "p_customer_email": customer_email,
+            "p_customer_name": customer_name,
+            "p_shipping": shipping or {},
+            "p_items": items,
+            "p_total_amount": total_amount,
+            "p_shipping_amount": shipping_amount,
+            "p_discount_code_id": str(discount_code_id) if discount_code_id else None
+        })
+
+        stock_changes = order.pop("stock_changes", None) or []
+
+        for row in stock_changes:
+            record_stock_change(row["product_variant_id"], row["stock_after"])
+        if stock_changes:
+            invalidate_catalog()
 
         return order
 
     except Exception as e:
-        print(f"Error creating order: {e}")
+        print(f"Error placing order: {e}")
         raise
 
 
+def order_by_payment_intent_query(client, payment_intent_id: str):
+    """Order placed for a Stripe payment intent, if any (sync or async client)."""
+    return client.table("orders")\
+        .select("*")\
+        .eq("stripe_payment_intent_id", payment_intent_id)\
+        .limit(1)
+
+
 def get_order_by_payment_intent(payment_intent_id: str) -> Optional[Dict]:
     """
     Find order by Stripe payment intent ID.
     Used to prevent duplicate order creation.
     """
     try:
-        response = supabase.table("orders")\
-            .select("*")\
-            .eq("stripe_payment_intent_id", payment_intent_id)\
-            .limit(1)\
-            .execute()
+        response = order_by_payment_intent_query(supabase, payment_intent_id).execute()
 
         if response.data:
             return response.data[0]
@@ -366,6 +292,41 @@ def mark_confirmation_email_sent(order_id: UUID) -> bool:
 
 # ============== DISCOUNT CODES ==============
 
+def discount_is_current(discount: Dict) -> bool:
+    """
+    Whether now falls inside the discount's valid_from/valid_until window.
+    """
+    # Check if code has expired
+    if discount.get("valid_until"):
+        valid_until = datetime.fromisoformat(discount["valid_until"].replace("Z", "+00:00"))
+        if datetime.utcnow().replace(tzinfo=valid_until.tzinfo) > valid_until:
+            return False
+
+    # Check if not yet valid
+    if discount.get("valid_from"):
+        valid_from = datetime.fromisoformat(discount["valid_from"].replace("Z", "+00:00"))
+        if datetime.utcnow().replace(tzinfo=valid_from.tzinfo) < valid_from:
+            return False
+
+    return True
+
+
+def discount_code_query(client, code: str):
+    """Discount code row by code string, case-insensitive (sync or async client)."""
+    return client.table("discount_codes")\
+        .select("*")\
+        .eq("code", code.upper())
+
+
+def discount_usage_query(client, discount_code_id: str, customer_email: str):
+    """Whether a customer has already used a discount code (sync or async client)."""
+    return client.table("discount_code_usage")\
+        .select("id")\
+        .eq("discount_code_id", discount_code_id)\
+        .eq("customer_email", customer_email.lower())\
+        .limit(1)
+
+
 def validate_discount_code(code: str, customer_email: str) -> Optional[Dict]:
     """
     Validate a discount code and check if customer can use it.
@@ -373,36 +334,18 @@ def validate_discount_code(code: str, customer_email: str) -> Optional[Dict]:
     """
     try:
         # Fetch discount code
-        response = supabase.table("discount_codes")\
-            .select("*")\
-            .eq("code", code.upper())\
-            .eq("active", True)\
-            .execute()
+        response = discount_code_query(supabase, code).eq("active", True).execute()
 
         if not response.data:
             return None
 
         discount = response.data[0]
-
-        # Check if code has expired
-        if discount.get("valid_until"):
-            valid_until = datetime.fromisoformat(discount["valid_until"].replace("Z", "+00:00"))
-            if datetime.utcnow().replace(tzinfo=valid_until.tzinfo) > valid_until:
-                return None
-
-        # Check if not yet valid
-        if discount.get("valid_from"):
-            valid_from = datetime.fromisoformat(discount["valid_from"].replace("Z", "+00:00"))
-            if datetime.utcnow().replace(tzinfo=valid_from.tzinfo) < valid_from:
-                return None
+        if not discount_is_current(discount):
+            return None
 
         # If single use per customer, check if customer has already used it
         if discount.get("single_use_per_customer", True):
-            usage_response = supabase.table("discount_code_usage")\
-                .select("*")\
-                .eq("discount_code_id", discount["id"])\
-                .eq("customer_email", customer_email.lower())\
-                .execute()
+            usage_response = discount_usage_query(supabase, discount["id"], customer_email).execute()
 
             if usage_response.data:
                 return None  # Customer has already used this code
@@ -414,33 +357,12 @@ def validate_discount_code(code: str, customer_email: str) -> Optional[Dict]:
         return None
 
 
-def record_discount_code_usage(discount_code_id: UUID, customer_email: str, order_id: UUID) -> bool:
-    """
-    Record that a customer has used a discount code on an order.
-    """
-    try:
-        supabase.table("discount_code_usage").insert({
-            "discount_code_id": str(discount_code_id),
-            "customer_email": customer_email.lower(),
-            "order_id": str(order_id)
-        }).execute()
-
-        return True
-
-    except Exception as e:
-        print(f"Error recording discount code usage: {e}")
-        return False
-
-
 def get_discount_code_by_code(code: str) -> Optional[Dict]:
     """
     Get discount code details by code string.
     """
     try:
-        response = supabase.table("discount_codes")\
-            .select("*")\
-            .eq("code", code.upper())\
-            .execute()
+        response = discount_code_query(supabase, code).execute()
 
         if response.data:
             return response.data[0]
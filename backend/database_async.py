@@ -0,0 +1,135 @@
+"""
+Async database reads for the async request handlers
+Same return values as the matching database.py functions, awaited on the
+pooled async Supabase client instead of blocking a thread per query. Order
+placement and other writes live only in database.py (the webhook worker is
+sync); query shapes come from database.py so the two can't drift.
+"""
+from typing import List, Dict, Optional, Tuple
+
+from supabase_async import async_supabase as supabase
+from upstream import run_blocking
+from direct_db import DIRECT_DB_ENABLED, DirectUnavailable, direct_pool, fetch_variant_stock
+from database import (
+    discount_code_query,
+    discount_is_current,
+    discount_usage_query,
+    find_stock_problem,
+    order_by_payment_intent_query,
+    variant_stock_query
+)
+
+
+async def call_rpc(function: str, params: Dict):
+    """
+    Call a database function over the direct connection when enabled,
+    otherwise (or if it can't be reached) through PostgREST.
+    """
+    if DIRECT_DB_ENABLED:
+        try:
+            return await run_blocking("postgres", direct_pool.call, function, params)
+        except DirectUnavailable as e:
+            print(f"[DIRECT DB] {e} - using PostgREST")
+
+    response = await supabase.rpc(function, params).execute()
+    return response.data
+
+
+# ============== PRODUCTS & VARIANTS ==============
+
+async def check_stock_availability(items: List[Dict]) -> Tuple[bool, Optional[str]]:
+    """
+    Validate stock availability for cart items.
+    Returns (is_available, error_message)
+    """
+    try:
+        if not items:
+            return True, None
+
+        # Fetch every variant for the cart's products in one round trip
+        product_ids = list({item["id"] for item in items})
+        variants = None
+        if DIRECT_DB_ENABLED:
+            try:
+                variants = await run_blocking("postgres", fetch_variant_stock, product_ids)
+            except DirectUnavailable as e:
+                print(f"[DIRECT DB] {e} - using PostgREST")
+
+        if variants is None:
+            response = await variant_stock_query(supabase, product_ids).execute()
+            variants = response.data
+
+        error_message = find_stock_problem(items, variants)
+        if error_message:
+            return False, error_message
+
+        return True, None
+
+    except Exception as e:
+        print(f"Error checking stock: {e}")
+        return False, "Unable to verify stock availability"
+
+
+# ============== ORDERS ==============
+
+async def get_order_by_payment_intent(payment_intent_id: str) -> Optional[Dict]:
+    """
+    Find order by Stripe payment intent ID.
+    """
+    try:
+        response = await order_by_payment_intent_query(supabase, payment_intent_id).execute()
+
+        if response.data:
+            return response.data[0]
+        return None
+
+    except Exception as e:
+        print(f"Error fetching order: {e}")
+        return None
+
+
+# ============== DISCOUNT CODES ==============
+
+async def validate_discount_code(code: str, customer_email: str) -> Optional[Dict]:
+    """
+    Validate a discount code and check if customer can use it.
+    Returns discount code details if valid, None if invalid.
+    """
+    try:
+        response = await discount_code_query(supabase, code).eq("active", True).execute()
+
+        if not response.data:
+            return None
+
+        discount = response.data[0]
+        if not discount_is_current(discount):
+            return None
+
+        # If single use per customer, check if customer has already used it
+        if discount.get("single_use_per_customer", True):
+            usage_response = await discount_usage_query(supabase, discount["id"], customer_email).execute()
+
+            if usage_response.data:
+                return None  # Customer has already used this code
+
+        return discount
+
+    except Exception as e:
+        print(f"Error validating discount code: {e}")
+        return None
+
+
+async def get_discount_code_by_code(code: str) -> Optional[Dict]:
+    """
+    Get discount code details by code string.
+    """
+    try:
+        response = await discount_code_query(supabase, code).execute()
+
+        if response.data:
+            return response.data[0]
+        return None
+
+    except Exception as e:
+        print(f"Error fetching discount code: {e}")
+        return None
@@ -0,0 +1,343 @@
+"""
+Direct Postgres access for hot-path queries
+An optional alternative to PostgREST for the catalog read, stock check, order
+placement, stock decrement and analytics aggregates: a bounded psycopg2
+connection pool, with each statement PREPAREd once per connection so repeat
+calls skip parsing and planning.
+
+Off unless DIRECT_DB_ENABLED=true and DATABASE_URL is set. When the database
+can't be reached the callers fall back to PostgREST (DirectUnavailable).
+Prepared statements need a session-level connection - use the direct
+connection or the Supabase pooler in session mode (port 5432), not
+transaction mode (6543), or set DIRECT_DB_PREPARE=false.
+"""
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+    import psycopg2.extras
+    import psycopg2.pool
+except ImportError:  # Optional - direct mode stays off without it
+    psycopg2 = None
+
+from admin_analytics import EXCLUDED_STATUSES, RECENT_ORDER_DAYS, RECENT_ORDER_LIMIT
+
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+DIRECT_DB_ENABLED = (
+    os.getenv("DIRECT_DB_ENABLED", "false").lower() == "true"
+    and bool(DATABASE_URL)
+    and psycopg2 is not None
+)
+DIRECT_DB_POOL_MIN = int(os.getenv("DIRECT_DB_POOL_MIN", "1"))
+DIRECT_DB_POOL_MAX = int(os.getenv("DIRECT_DB_POOL_MAX", "10"))
+DIRECT_DB_PREPARE = os.getenv("DIRECT_DB_PREPARE", "true").lower() == "true"
+# Seconds to wait for a free connection before falling back to PostgREST
+DIRECT_DB_ACQUIRE_TIMEOUT = float(os.getenv("DIRECT_DB_ACQUIRE_TIMEOUT", "5"))
+# Seconds before retrying after the database couldn't be reached
+DIRECT_DB_RETRY_SECONDS = float(os.getenv("DIRECT_DB_RETRY_SECONDS", "30"))
+
+# Always present in order stats, zero if no orders have them
+ORDER_STATUSES = ("paid", "shipped", "delivered", "cancelled", "refunded")
+
+
+class DirectUnavailable(Exception):
+    """No direct connection could be obtained; nothing was executed."""
+
+
+# ============== STATEMENTS ==============
+
+CATALOG_PRODUCTS = """
+    SELECT id, name, description, base_price, image_url
+    FROM products
+    WHERE is_active
+"""
+
+CATALOG_VARIANTS = """
+    SELECT id::text, product_id, size, stock_quantity
+    FROM product_variants
+"""
+
+VARIANT_STOCK = """
+    SELECT product_id, size, stock_quantity
+    FROM product_variants
+    WHERE product_id = ANY(%s::text[])
+"""
+
+ANALYTICS_DAILY = """
+    SELECT day, orders, total_amount, subtotal_amount, shipping_amount
+    FROM analytics_daily
+"""
+
+ANALYTICS_PRODUCT_SALES = """
+    SELECT product_name, quantity
+    FROM analytics_product_sales
+    WHERE quantity > 0
+"""
+
+RECENT_ORDERS = """
+    SELECT total_amount, subtotal_amount, shipping_amount, created_at, status
+    FROM orders
+    WHERE status <> ALL(%s::text[])
+      AND created_at >= NOW() - make_interval(days => %s)
+    ORDER BY created_at DESC
+    LIMIT %s
+"""
+
+ANALYTICS_PRODUCTS = """
+    SELECT p.id, p.name, p.unit_cost, COALESCE(SUM(v.stock_quantity), 0)::int AS stock_quantity
+    FROM products p
+    LEFT JOIN product_variants v ON v.product_id = p.id
+    GROUP BY p.id
+"""
+
+# Same query as the get_order_status_counts() RPC
+ORDER_STATUS_COUNTS = """
+    SELECT status, COUNT(*)::int AS count
+    FROM orders
+    GROUP BY status
+"""
+
+CUSTOMER_COUNT = """
+    SELECT COUNT(*)::int AS count FROM customers
+"""
+
+
+def _statement_name(sql: str) -> str:
+    return f"direct_{abs(hash(sql)):x}"
+
+
+def _to_positional(sql: str) -> Tuple[str, int]:
+    """Rewrite %s placeholders as $1..$n for PREPARE."""
+    count = 0
+
+    def number(_match):
+        nonlocal count
+        count += 1
+        return f"${count}"
+
+    return re.sub(r"%s", number, sql), count
+
+
+# ============== POOL ==============
+
+if psycopg2 is not None:
+    class _Connection(psycopg2.extensions.connection):
+        """Connection that remembers which statements it has prepared."""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.prepared = set()
+
+
+class DirectPool:
+    """
+    ThreadedConnectionPool plus a semaphore, so callers beyond the pool size
+    wait for a connection instead of getting PoolError.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(DIRECT_DB_POOL_MAX)
+        self._retry_at = 0.0
+        self.queries = 0
+        self.prepares = 0
+        self.errors = 0
+        self.unavailable = 0
+        self.total_time = 0.0
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is not None:
+                return self._pool
+            if time.monotonic() < self._retry_at:
+                raise DirectUnavailable("direct database unavailable, retrying later")
+            try:
+                self._pool = psycopg2.pool.ThreadedConnectionPool(
+                    DIRECT_DB_POOL_MIN,
+                    DIRECT_DB_POOL_MAX,
+                    DATABASE_URL,
+                    connection_factory=_Connection
+                )
+            except psycopg2.Error as e:
+                self._retry_at = time.monotonic() + DIRECT_DB_RETRY_SECONDS
+                raise DirectUnavailable(f"could not connect: {e}") from e
+            print(f"[DIRECT DB] Pool started ({DIRECT_DB_POOL_MIN}-{DIRECT_DB_POOL_MAX} connections, prepare={DIRECT_DB_PREPARE})")
+            return self._pool
+
+    @contextmanager
+    def connection(self):
+        if not DIRECT_DB_ENABLED:
+            raise DirectUnavailable("direct database mode is disabled")
+
+        pool = self._get_pool()
+        if not self._slots.acquire(timeout=DIRECT_DB_ACQUIRE_TIMEOUT):
+            self.unavailable += 1
+            raise DirectUnavailable("timed out waiting for a connection")
+
+        try:
+            try:
+                conn = pool.getconn()
+                conn.autocommit = True
+            except psycopg2.Error as e:
+                self.unavailable += 1
+                raise DirectUnavailable(f"could not connect: {e}") from e
+
+            broken = False
+            try:
+                yield conn
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                broken = True
+                raise
+            finally:
+                pool.putconn(conn, close=broken or bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    def fetch(self, sql: str, *args) -> List[Dict]:
+        """Run one statement and return its rows as dicts."""
+        started = time.perf_counter()
+        with self.connection() as conn:
+            try:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                    if DIRECT_DB_PREPARE:
+                        name = _statement_name(sql)
+                        if name not in conn.prepared:
+                            positional, _ = _to_positional(sql)
+                            cursor.execute(f"PREPARE {name} AS {positional}")
+                            conn.prepared.add(name)
+                            self.prepares += 1
+                        placeholders = ", ".join(["%s"] * len(args))
+                        cursor.execute(f"EXECUTE {name} ({placeholders})" if args else f"EXECUTE {name}", args)
+                    else:
+                        cursor.execute(sql, args)
+                    rows = cursor.fetchall()
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                self.queries += 1
+                self.total_time += time.perf_counter() - started
+        return [dict(row) for row in rows]
+
+    def call(self, function: str, params: Dict[str, Any]) -> Any:
+        """
+        Call a database function with named arguments, like supabase.rpc().
+        Dict and list arguments are sent as JSONB. Returns the function's result.
+        """
+        names = sorted(params)
+        arguments = ", ".join(f"{name} => %s" for name in names)
+        sql = f"SELECT {function}({arguments}) AS result"
+        values = [
+            psycopg2.extras.Json(params[name]) if isinstance(params[name], (dict, list)) else params[name]
+            for name in names
+        ]
+        return self.fetch(sql, *values)[0]["result"]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": DIRECT_DB_ENABLED,
+            "connected": self._pool is not None,
+            "prepare": DIRECT_DB_PREPARE,
+            "pool_max": DIRECT_DB_POOL_MAX,
+            "queries": self.queries,
+            "prepares": self.prepares,
+            "errors": self.errors,
+            "unavailable": self.unavailable,
+            "avg_query_ms": round(self.total_time / self.queries * 1000, 2) if self.queries else 0,
+        }
+
+
+direct_pool = DirectPool()
+
+
+# ============== HOT PATHS ==============
+
+def fetch_catalog() -> Tuple[List[Dict], List[Dict]]:
+    """Active products and all variants, as used by build_merch_products."""
+    return direct_pool.fetch(CATALOG_PRODUCTS), direct_pool.fetch(CATALOG_VARIANTS)
+
+
+def fetch_variant_stock(product_ids: List[str]) -> List[Dict]:
+    """Stock rows (product_id, size, stock_quantity) for check_stock_availability."""
+    return direct_pool.fetch(VARIANT_STOCK, list(product_ids))
+
+
+def order_stats_from_counts(rows: List[Dict]) -> Dict[str, int]:
+    """
+    {status: count} from get_order_status_counts() rows. ORDER_STATUSES are
+    always included; any other status in use is added as it appears.
+    """
+    counts = {status: 0 for status in ORDER_STATUSES}
+    for row in rows or []:
+        counts[row["status"]] = row["count"]
+    return counts
+
+
+def fetch_order_stats() -> Dict[str, int]:
+    return order_stats_from_counts(direct_pool.fetch(ORDER_STATUS_COUNTS))
+
+
+def fetch_analytics_daily() -> List[Dict]:
+    """Per-day order totals from the analytics rollup, days as ISO strings like PostgREST."""
+    days = direct_pool.fetch(ANALYTICS_DAILY)
+    for day in days:
+        day["day"] = day["day"].isoformat()
+    return days
+
+
+def fetch_product_sales() -> List[Dict]:
+    """Units sold per product name from the analytics rollup."""
+    return direct_pool.fetch(ANALYTICS_PRODUCT_SALES)
+
+
+def fetch_recent_orders() -> List[Dict]:
+    """Newest counted orders for the dashboard, created_at as ISO strings like PostgREST."""
+    orders = direct_pool.fetch(RECENT_ORDERS, list(EXCLUDED_STATUSES), RECENT_ORDER_DAYS, RECENT_ORDER_LIMIT)
+    for order in orders:
+        order["created_at"] = order["created_at"].isoformat()
+    return orders
+
+
+def fetch_product_costs() -> List[Dict]:
+    """Unit cost and total stock per product, aggregated in the database."""
+    return [
+        {
+            "id": row["id"],
+            "name": row["name"],
+            "unit_cost": row["unit_cost"] or 0,
+            "product_variants": [{"stock_quantity": row["stock_quantity"]}],
+        }
+        for row in direct_pool.fetch(ANALYTICS_PRODUCTS)
+    ]
+
+
+def count_customers() -> int:
+    return direct_pool.fetch(CUSTOMER_COUNT)[0]["count"]
+
+
+def fetch_analytics_data() -> Dict:
+    """
+    Rows for compute_analytics_overview: the analytics rollups, with stock
+    aggregated in the database instead of shipped row by row.
+    """
+    return {
+        "daily": fetch_analytics_daily(),
+        "product_sales": fetch_product_sales(),
+        "products": fetch_product_costs(),
+        "recent_orders": fetch_recent_orders(),
+        "order_stats": fetch_order_stats(),
+        "total_customers": count_customers()
+    }
@@ -0,0 +1,315 @@
+"""
+Transactional email outbox
+Request handlers and the webhook worker enqueue rendered messages here instead
+of calling Resend inline. Background workers deliver them with bounded
+concurrency, retries with backoff, and Resend batch sends when several
+messages are waiting (sent one by one if Resend rejects the batch). Messages
+are stored in SQLite, so nothing queued is lost across restarts.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import resend
+
+from upstream import run_blocking
+from webhook_queue import WEBHOOK_QUEUE_PATH, IDLE_POLL_SECONDS, prune_rows, retry_delay
+
+EMAIL_OUTBOX_PATH = os.getenv("EMAIL_OUTBOX_PATH", WEBHOOK_QUEUE_PATH)
+# Concurrent Resend requests (Resend's default rate limit is 2 requests/second)
+EMAIL_SEND_CONCURRENCY = int(os.getenv("EMAIL_SEND_CONCURRENCY", "2"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "8"))
+# Resend accepts up to 100 messages per batch request
+EMAIL_BATCH_SIZE = min(int(os.getenv("EMAIL_BATCH_SIZE", "100")), 100)
+# Seconds a claimed batch stays leased to its worker (see WebhookQueue)
+EMAIL_LEASE_SECONDS = float(os.getenv("EMAIL_LEASE_SECONDS", "300"))
+# Days sent messages are kept before prune() deletes them (failed messages are kept)
+EMAIL_RETENTION_DAYS = float(os.getenv("EMAIL_RETENTION_DAYS", "7"))
+
+
+class EmailOutbox:
+    """
+    SQLite-backed outbox of Resend message params.
+    Statuses: pending -> sending -> sent, or failed after EMAIL_MAX_ATTEMPTS.
+    While a message is sending, next_attempt_at is its lease expiry; a message
+    whose worker died is claimed again once the lease runs out, so it may be
+    sent twice if the worker died after Resend accepted it.
+    """
+
+    def __init__(
+        self,
+        path: str = EMAIL_OUTBOX_PATH,
+        max_attempts: int = EMAIL_MAX_ATTEMPTS,
+        lease_seconds: float = EMAIL_LEASE_SECONDS
+    ):
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS email_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                dedupe_key TEXT UNIQUE,
+                kind TEXT NOT NULL,
+                order_id TEXT,
+                message TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                provider_id TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox(status, next_attempt_at)"
+        )
+
+    def enqueue(self, messages: List[Dict]) -> int:
+        """
+        Durably queue messages in one transaction. Each message is a dict with
+        "params" (Resend send params), "kind", and optional "order_id" and
+        "dedupe_key". A message whose dedupe_key is already queued is skipped.
+        Returns the number of messages added.
+        """
+        now = time.time()
+        added = 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for message in messages:
+                    cursor = self._conn.execute(
+                        """
+                        INSERT OR IGNORE INTO email_outbox
+                            (dedupe_key, kind, order_id, message, status, next_attempt_at, created_at, updated_at)
+                        VALUES (?, ?, ?, ?, 'pending', ?, ?, ?)
+                        """,
+                        (
+                            message.get("dedupe_key"),
+                            message["kind"],
+                            str(message["order_id"]) if message.get("order_id") else None,
+                            json.dumps(message["params"]),
+                            now, now, now
+                        )
+                    )
+                    added += cursor.rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def claim_batch(self, limit: int = EMAIL_BATCH_SIZE) -> List[Dict]:
+        """
+        Atomically take up to `limit` due messages (or ones whose lease has
+        expired) and lease them to the caller.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    """
+                    SELECT * FROM email_outbox
+                    WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?
+                    ORDER BY next_attempt_at, id
+                    LIMIT ?
+                    """,
+                    (now, limit)
+                ).fetchall()
+                if rows:
+                    self._conn.executemany(
+                        """
+                        UPDATE email_outbox
+                        SET status = 'sending', attempts = attempts + 1, next_attempt_at = ?, updated_at = ?
+                        WHERE id = ?
+                        """,
+                        [(now + self.lease_seconds, now, row["id"]) for row in rows]
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        batch = []
+        for row in rows:
+            item = dict(row)
+            item["attempts"] += 1
+            item["params"] = json.loads(item.pop("message"))
+            batch.append(item)
+        return batch
+
+    def mark_sent(self, outbox_id: int, provider_id: Optional[str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE email_outbox SET status = 'sent', provider_id = ?, last_error = NULL, updated_at = ? WHERE id = ?",
+                (provider_id, time.time(), outbox_id)
+            )
+
+    def retry(self, outbox_id: int, attempts: int, error: str) -> bool:
+        """
+        Schedule another attempt with backoff.
+        Returns False (and marks the message failed) once attempts are exhausted.
+        Does nothing if the lease expired and the message was claimed again since.
+        """
+        now = time.time()
+        with self._lock:
+            if attempts >= self.max_attempts:
+                self._conn.execute(
+                    "UPDATE email_outbox SET status = 'failed', last_error = ?, updated_at = ? WHERE id = ? AND attempts = ?",
+                    (error, now, outbox_id, attempts)
+                )
+                return False
+
+            self._conn.execute(
+                """
+                UPDATE email_outbox
+                SET status = 'pending', next_attempt_at = ?, last_error = ?, updated_at = ?
+                WHERE id = ? AND attempts = ?
+                """,
+                (now + retry_delay(attempts), error, now, outbox_id, attempts)
+            )
+            return True
+
+    def prune(self, retention_days: float = EMAIL_RETENTION_DAYS) -> int:
+        """
+        Delete sent messages last updated more than retention_days ago. Returns
+        the number deleted. Failed messages are kept for inspection.
+        """
+        cutoff = time.time() - retention_days * 86400
+        return prune_rows(self._conn, self._lock, "email_outbox", "status = 'sent' AND updated_at < ?", (cutoff,))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) AS count FROM email_outbox GROUP BY status"
+            ).fetchall()
+            oldest = self._conn.execute(
+                "SELECT MIN(created_at) FROM email_outbox WHERE status IN ('pending', 'sending')"
+            ).fetchone()[0]
+
+        counts = {"pending": 0, "sending": 0, "sent": 0, "failed": 0}
+        counts.update({row["status"]: row["count"] for row in rows})
+        return {
+            **counts,
+            "oldest_pending_age_seconds": round(time.time() - oldest, 1) if oldest else None,
+        }
+
+
+def deliver_one(item: Dict) -> Optional[str]:
+    """Send one message through Resend. Returns the Resend message ID."""
+    response = resend.Emails.send(item["params"])
+    return response.get("id") if isinstance(response, dict) else None
+
+
+def deliver(batch: List[Dict]) -> List[Optional[str]]:
+    """
+    Send a batch through Resend - one request per call, using the batch API
+    for more than one message. Returns Resend message IDs in batch order.
+    """
+    if len(batch) == 1:
+        return [deliver_one(batch[0])]
+
+    response = resend.Batch.send([item["params"] for item in batch])
+    data = response.get("data", []) if isinstance(response, dict) else []
+    ids = [entry.get("id") for entry in data]
+    return ids + [None] * (len(batch) - len(ids))
+
+
+email_outbox = EmailOutbox()
+_wake: Optional[asyncio.Event] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def notify_email_workers() -> None:
+    """
+    Wake idle email workers after an enqueue. Safe to call from any thread.
+    """
+    if _wake is not None and _loop is not None:
+        _loop.call_soon_threadsafe(_wake.set)
+
+
+async def _retry_message(item: Dict, error: str, worker_id: int) -> None:
+    will_retry = await run_blocking("local", email_outbox.retry, item["id"], item["attempts"], error)
+    if will_retry:
+        print(f"[EMAIL OUTBOX] worker {worker_id}: {item['kind']} #{item['id']} failed (attempt {item['attempts']}), retrying: {error}")
+    else:
+        print(f"[EMAIL OUTBOX] worker {worker_id}: {item['kind']} #{item['id']} FAILED permanently after {item['attempts']} attempts: {error}")
+
+
+async def _mark_sent(item: Dict, provider_id: Optional[str], on_sent: Callable[[Dict], None], worker_id: int) -> None:
+    await run_blocking("local", email_outbox.mark_sent, item["id"], provider_id)
+    try:
+        await run_blocking("supabase", on_sent, item)
+    except Exception as e:
+        print(f"[EMAIL OUTBOX] worker {worker_id}: on_sent failed for #{item['id']}: {e}")
+
+
+async def _deliver_individually(batch: List[Dict], on_sent: Callable[[Dict], None], worker_id: int) -> None:
+    """
+    Send each message of a failed batch on its own, so only the messages
+    that fail again are retried.
+    """
+    sent = 0
+    for item in batch:
+        try:
+            provider_id = await run_blocking("resend", deliver_one, item)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await _retry_message(item, f"{type(e).__name__}: {e}", worker_id)
+            continue
+        await _mark_sent(item, provider_id, on_sent, worker_id)
+        sent += 1
+
+    print(f"[EMAIL OUTBOX] worker {worker_id}: sent {sent} of {len(batch)} message(s) individually")
+
+
+async def run_email_worker(on_sent: Callable[[Dict], None], worker_id: int) -> None:
+    """
+    Deliver queued email forever. Run EMAIL_SEND_CONCURRENCY of these; sends
+    also count against the "resend" upstream limit. on_sent(item) is called on
+    the Supabase pool for each message once Resend has accepted it.
+    """
+    global _wake, _loop
+    if _wake is None:
+        _wake = asyncio.Event()
+        _loop = asyncio.get_running_loop()
+
+    while True:
+        batch = await run_blocking("local", email_outbox.claim_batch)
+        if not batch:
+            _wake.clear()
+            try:
+                await asyncio.wait_for(_wake.wait(), timeout=IDLE_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            provider_ids = await run_blocking("resend", deliver, batch)
+        except asyncio.CancelledError:
+            # Left 'sending' - they are claimed again once their lease expires
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if len(batch) == 1:
+                await _retry_message(batch[0], error, worker_id)
+            else:
+                # Resend rejects the whole batch for one bad message
+                print(f"[EMAIL OUTBOX] worker {worker_id}: batch of {len(batch)} failed, sending individually: {error}")
+                await _deliver_individually(batch, on_sent, worker_id)
+            continue
+
+        for item, provider_id in zip(batch, provider_ids):
+            await _mark_sent(item, provider_id, on_sent, worker_id)
+
+        print(f"[EMAIL OUTBOX] worker {worker_id}: sent {len(batch)} message(s)")
@@ -0,0 +1,267 @@
+"""
+Email templates
+Each template is minified once at import (indentation and blank lines
+stripped) and rendered with str.format_map, so sending an email doesn't
+re-parse or re-indent the markup. The logo is referenced by URL rather than
+embedded as a base64 data URI.
+"""
+import os
+from datetime import datetime
+from html import escape
+from string import Formatter
+from typing import Dict, List, Optional
+
+# Served by the frontend from public/img
+EMAIL_LOGO_URL = os.getenv("EMAIL_LOGO_URL", "https://plagueduk.com/img/logo-green.png")
+
+
+class EmailTemplate:
+    """
+    A str.format-style template ({field} placeholders only), minified once.
+    Values are inserted as-is - escape untrusted input before rendering.
+    """
+
+    def __init__(self, source: str):
+        self.source = "\n".join(line.strip() for line in source.strip().splitlines() if line.strip())
+
+        fields: List[str] = []
+        for _, field, spec, conversion in Formatter().parse(self.source):
+            if field is None:
+                continue
+            if not field.isidentifier() or spec or conversion:
+                raise ValueError(f"Unsupported template field: {field!r}")
+            if field not in fields:
+                fields.append(field)
+        self.fields = tuple(fields)
+
+    def render(self, **values) -> str:
+        """Fill every field; raises KeyError if one is missing."""
+        return self.source.format_map(values)
+
+
+# ============== TEMPLATES ==============
+
+ORDER_ITEM_ROW = EmailTemplate("""
+    <tr>
+        <td style="padding: 10px; border-bottom: 1px solid #eee;">
+            {name}<br>
+            <span style="color: #666; font-size: 12px;">Size: {size}</span>
+        </td>
+        <td style="padding: 10px; border-bottom: 1px solid #eee; text-align: center;">{quantity}</td>
+        <td style="padding: 10px; border-bottom: 1px solid #eee; text-align: right;">{line_total}</td>
+    </tr>
+""")
+
+ORDER_CONFIRMATION = EmailTemplate("""
+    <html>
+    <body style="font-family: Arial, sans-serif; color: #333; max-width: 600px; margin: 0 auto;">
+        <div style="background: #000; padding: 30px 20px; text-align: center;">
+            <img src="{logo_url}" alt="PLAGUED" width="200" style="max-width: 200px; height: auto;">
+        </div>
+
+        <div style="padding: 30px 20px;">
+            <h2 style="color: #00ff00;">Order Confirmed!</h2>
+            <p>Thanks for your order, {customer_name}! We'll ship it out soon.</p>
+
+            <div style="background: #f5f5f5; padding: 15px; margin: 20px 0; border-left: 4px solid #00ff00;">
+                <strong>Order Number:</strong> {order_number}<br>
+                <strong>Order Date:</strong> {order_date}
+            </div>
+
+            <h3 style="margin-top: 30px;">Order Items</h3>
+            <table style="width: 100%; border-collapse: collapse;">
+                <thead>
+                    <tr style="background: #f5f5f5;">
+                        <th style="padding: 10px; text-align: left;">Item</th>
+                        <th style="padding: 10px; text-align: center;">Qty</th>
+                        <th style="padding: 10px; text-align: right;">Price</th>
+                    </tr>
+                </thead>
+                <tbody>
+                    {item_rows}
+                </tbody>
+                <tfoot>
+                    <tr>
+                        <td colspan="2" style="padding: 10px; text-align: right;">Subtotal:</td>
+                        <td style="padding: 10px; text-align: right;">{subtotal}</td>
+                    </tr>
+                    <tr>
+                        <td colspan="2" style="padding: 10px; text-align: right;">Shipping:{free_shipping_note}</td>
+                        <td style="padding: 10px; text-align: right;">{shipping}</td>
+                    </tr>
+                    <tr>
+                        <td colspan="2" style="padding: 15px 10px; text-align: right; font-weight: bold; border-top: 2px solid #00ff00;">Total:</td>
+                        <td style="padding: 15px 10px; text-align: right; font-weight: bold; color: #00ff00; font-size: 18px; border-top: 2px solid #00ff00;">{total}</td>
+                    </tr>
+                </tfoot>
+            </table>
+
+            <h3 style="margin-top: 30px;">Shipping Address</h3>
+            <div style="background: #f5f5f5; padding: 15px;">
+                {address}
+            </div>
+
+            <p style="margin-top: 30px; color: #666; font-size: 14px;">
+                You'll receive another email with tracking information once your order ships.
+            </p>
+
+            <p style="margin-top: 20px;">
+                Questions? Email us at <a href="mailto:contact@plagueduk.com" style="color: #00ff00;">contact@plagueduk.com</a>
+            </p>
+        </div>
+
+        <div style="background: #f5f5f5; padding: 20px; text-align: center; font-size: 12px; color: #666;">
+            <p style="margin: 0;">Plagued - Death Metal from the UK</p>
+            <p style="margin: 5px 0 0 0;">contact@plagueduk.com</p>
+        </div>
+    </body>
+    </html>
+""")
+
+ORDER_NOTIFICATION = EmailTemplate("""
+    <html>
+    <body style="font-family: Arial, sans-serif;">
+        <h2 style="color: #00ff00;">New Order Received!</h2>
+        <p><strong>Order Number:</strong> {order_number}</p>
+        <p><strong>Customer:</strong> {customer_name} ({customer_email})</p>
+        <p><strong>Total:</strong> {total}</p>
+
+        <p><strong>Items:</strong></p>
+        <ul>
+            {item_list}
+        </ul>
+        <p><strong>Shipping Address:</strong><br>
+        {address}
+        </p>
+        <p><a href="https://dashboard.stripe.com/payments/{payment_intent_id}" style="color: #00ff00;">View in Stripe Dashboard</a></p>
+    </body>
+    </html>
+""")
+
+CONTACT_SUBMISSION = EmailTemplate("""
+    <html>
+    <body style="font-family: Arial, sans-serif; color: #333;">
+        <h2 style="color: #00ff00;">New Contact Form Submission</h2>
+        <p><strong>From:</strong> plagueduk.com</p>
+        <hr style="border: 1px solid #eee;">
+
+        <p><strong>Name:</strong> {name}</p>
+        <p><strong>Email:</strong> {email}</p>
+        <p><strong>Subject:</strong> {subject}</p>
+
+        <h3>Message:</h3>
+        <p style="background: #f5f5f5; padding: 15px; border-radius: 5px;">
+            {message}
+        </p>
+
+        <hr style="border: 1px solid #eee;">
+        <p style="color: #666; font-size: 12px;">
+            Submitted at: {submitted_at}<br>
+            IP Address: {ip_address}
+        </p>
+    </body>
+    </html>
+""")
+
+
+# ============== RENDERING ==============
+
+def format_pence(amount: int) -> str:
+    return f"£{amount / 100:.2f}"
+
+
+def _address_html(name: str, address: Dict) -> str:
+    lines = [name, address.get("line1", "")]
+    if address.get("line2"):
+        lines.append(address["line2"])
+    lines.append(f"{address.get('city', '')}, {address.get('postal_code', '')}")
+    lines.append(address.get("country") or "GB")
+    return "<br>".join(escape(line) for line in lines)
+
+
+def render_order_confirmation(
+    order_number: str,
+    customer_name: str,
+    items: List[Dict],
+    total_amount: int,
+    shipping_amount: int,
+    shipping_address: Dict,
+    order_date: Optional[datetime] = None
+) -> str:
+    """Customer order confirmation. Amounts are in pence."""
+    subtotal = total_amount - shipping_amount
+    free_shipping_note = ""
+    if shipping_amount == 0 and subtotal >= 5000:  # £50 or more
+        free_shipping_note = ' <span style="color: #00ff00; font-size: 12px;">(Free on orders over £50)</span>'
+
+    render_row = ORDER_ITEM_ROW.render
+    item_rows = "".join([
+        render_row(
+            name=escape(item["name"]),
+            size=escape(item["size"]),
+            quantity=item["quantity"],
+            line_total=f"£{item['price'] * item['quantity'] / 100:.2f}"
+        )
+        for item in items
+    ])
+
+    return ORDER_CONFIRMATION.render(
+        logo_url=EMAIL_LOGO_URL,
+        customer_name=escape(customer_name),
+        order_number=escape(order_number),
+        order_date=(order_date or datetime.utcnow()).strftime("%d %B %Y"),
+        item_rows=item_rows,
+        subtotal=format_pence(subtotal),
+        free_shipping_note=free_shipping_note,
+        shipping=format_pence(shipping_amount),
+        total=format_pence(total_amount),
+        address=_address_html(customer_name, shipping_address)
+    )
+
+
+def render_order_notification(
+    order_number: str,
+    customer_name: str,
+    customer_email: str,
+    items: List[Dict],
+    total_amount: int,
+    shipping_address: Dict,
+    payment_intent_id: str
+) -> str:
+    """New order notification for the band"""
+    item_list = "".join([
+        f'<li>{escape(item["name"])} - Size {escape(item["size"])} x {item["quantity"]}</li>'
+        for item in items
+    ])
+
+    return ORDER_NOTIFICATION.render(
+        order_number=escape(order_number),
+        customer_name=escape(customer_name),
+        customer_email=escape(customer_email),
+        total=format_pence(total_amount),
+        item_list=item_list,
+        address=_address_html(customer_name, shipping_address),
+        payment_intent_id=escape(payment_intent_id)
+    )
+
+
+def render_contact_submission(
+    name: str,
+    email: str,
+    subject: str,
+    message: str,
+    ip_address: str,
+    submitted_at: Optional[datetime] = None
+) -> str:
+    """
+    Contact form notification. Fields are expected to be sanitized already
+    (see ContactForm validators).
+    """
+    return CONTACT_SUBMISSION.render(
+        name=name,
+        email=email,
+        subject=subject,
+        message=message.replace("\n", "<br>"),
+        submitted_at=(submitted_at or datetime.utcnow()).isoformat(),
+        ip_address=ip_address
+    )
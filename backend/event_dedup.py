@@ -0,0 +1,67 @@
+"""
+Stripe event-ID deduplication
+Rejects replayed webhook deliveries before they reach the queue database.
+Recently accepted IDs are held in a bounded in-memory LRU; the durable check
+is WebhookQueue.enqueue, which records the ID and queues the event in one
+transaction, so an event can't be marked seen without being queued.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict
+
+EVENT_DEDUP_LRU_SIZE = int(os.getenv("EVENT_DEDUP_LRU_SIZE", "10000"))
+
+
+class EventDeduplicator:
+    """
+    In-memory LRU of Stripe event IDs the queue has accepted or rejected.
+    Only a fast path - a miss here still goes through WebhookQueue.enqueue.
+    """
+
+    def __init__(self, max_memory: int = EVENT_DEDUP_LRU_SIZE):
+        self.max_memory = max_memory
+        self._lock = threading.Lock()
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def seen(self, event_id: str) -> bool:
+        """
+        Return True if this event ID was recently handed to the queue.
+        """
+        with self._lock:
+            if event_id in self._recent:
+                self._recent.move_to_end(event_id)
+                self.memory_hits += 1
+                return True
+            return False
+
+    def remember(self, event_id: str, queued: bool) -> None:
+        """
+        Record the queue's answer for an event: queued (new) or rejected as a duplicate.
+        """
+        with self._lock:
+            if queued:
+                self.misses += 1
+            else:
+                self.store_hits += 1
+
+            self._recent[event_id] = None
+            self._recent.move_to_end(event_id)
+            while len(self._recent) > self.max_memory:
+                self._recent.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "lru_size": len(self._recent),
+                "lru_capacity": self.max_memory,
+            }
+
+
+event_deduplicator = EventDeduplicator()
@@ -0,0 +1,180 @@
+"""
+HTTP caching helpers for public read endpoints
+- Conditional GET (ETag / If-None-Match)
+- Pre-serialized, precompressed static payloads
+"""
+import gzip
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import brotli
+except ImportError:  # Optional - falls back to gzip only
+    brotli = None
+
+# Cache-Control policies for public routes
+# Static content only changes on deploy; merch must always revalidate so stock stays accurate
+CACHE_CONTROL_STATIC = "public, max-age=300"
+CACHE_CONTROL_CONFIG = "public, max-age=60"
+CACHE_CONTROL_REVALIDATE = "no-cache"
+
+
+def serialize_json(content: Any) -> bytes:
+    """
+    Serialize content to compact JSON bytes (the form hashed for ETags).
+    """
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def compute_etag(body: bytes) -> str:
+    """
+    Strong ETag from a SHA-256 content hash.
+    """
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Check the request's If-None-Match header against an ETag.
+    Uses weak comparison as required by RFC 9110 for If-None-Match.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+
+    if header.strip() == "*":
+        return True
+
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+
+    return False
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    """
+    Empty 304 response carrying the validator headers.
+    """
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def conditional_json_response(
+    request: Request,
+    content: Any,
+    etag: Optional[str],
+    cache_control: str,
+    extra_headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    Return 304 if the client already holds this ETag, otherwise the JSON body
+    with ETag and Cache-Control set. Pass etag=None to skip validation.
+    """
+    if etag and etag_matches(request, etag):
+        response = not_modified(etag, cache_control)
+        response.headers.update(extra_headers or {})
+        return response
+
+    headers = {"Cache-Control": cache_control, **(extra_headers or {})}
+    if etag:
+        headers["ETag"] = etag
+
+    return JSONResponse(content=content, headers=headers)
+
+
+# ============== PRECOMPRESSED STATIC PAYLOADS ==============
+
+class StaticPayload:
+    """
+    A JSON body serialized once, with gzip/brotli variants built up front.
+    Compressed variants are only kept if they're smaller than the raw body.
+    """
+
+    def __init__(self, content: Any):
+        self.body = serialize_json(content)
+        self.etag = compute_etag(self.body)
+
+        # encoding -> compressed bytes, in server preference order
+        self.encoded: Dict[str, bytes] = {}
+        if brotli is not None:
+            compressed = brotli.compress(self.body, quality=11)
+            if len(compressed) < len(self.body):
+                self.encoded["br"] = compressed
+        compressed = gzip.compress(self.body, compresslevel=9, mtime=0)
+        if len(compressed) < len(self.body):
+            self.encoded["gzip"] = compressed
+
+    def etag_for(self, encoding: Optional[str]) -> str:
+        """
+        Each encoding is a separate representation, so it gets its own strong ETag.
+        """
+        if not encoding:
+            return self.etag
+        return f'{self.etag[:-1]}-{encoding}"'
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """
+    Parse Accept-Encoding into {coding: qvalue}.
+    """
+    accepted = {}
+    if not header:
+        return accepted
+
+    for part in header.split(","):
+        pieces = part.strip().split(";")
+        coding = pieces[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in pieces[1:]:
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+
+    return accepted
+
+
+def negotiate_encoding(request: Request, payload: StaticPayload) -> Optional[str]:
+    """
+    Pick the best available encoding the client accepts, or None for identity.
+    """
+    accepted = parse_accept_encoding(request.headers.get("accept-encoding"))
+    wildcard = accepted.get("*", 0.0)
+
+    for encoding in payload.encoded:
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+
+    return None
+
+
+def static_response(request: Request, payload: StaticPayload, cache_control: str) -> Response:
+    """
+    Serve a precompressed payload with content negotiation and conditional GET.
+    """
+    encoding = negotiate_encoding(request, payload)
+    etag = payload.etag_for(encoding)
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+
+    # Accept a validator for any representation of this payload
+    representations = [None, *payload.encoded]
+    if any(etag_matches(request, payload.etag_for(r)) for r in representations):
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return Response(content=payload.encoded[encoding], media_type="application/json", headers=headers)
+
+    return Response(content=payload.body, media_type="application/json", headers=headers)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Load test: concurrent-request throughput with blocking SDK calls made inline
+in async handlers (before) vs. offloaded through upstream.run_blocking (after).
+
+Each simulated request makes one blocking upstream call that sleeps for
+--latency-ms, like a supabase-py query. A probe meanwhile hits a route that
+needs no upstream (like /api/band) to show how much the event loop stalls.
+Nothing touches the network.
+
+Usage: python loadtest_upstream.py [--requests 200] [--concurrency 50] [--latency-ms 50]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import upstream
+
+
+def blocking_query(latency):
+    """Stand-in for a synchronous supabase-py call."""
+    time.sleep(latency)
+    return {"ok": True}
+
+
+async def handler_inline(latency):
+    return blocking_query(latency)
+
+
+async def handler_offloaded(latency):
+    return await upstream.run_blocking("supabase", blocking_query, latency)
+
+
+async def static_handler():
+    return {"name": "Plagued"}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_case(handler, requests, concurrency, latency):
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+    probe_latencies = []
+    done = asyncio.Event()
+
+    async def client():
+        async with gate:
+            started = time.perf_counter()
+            await handler(latency)
+            latencies.append(time.perf_counter() - started)
+
+    async def probe():
+        while not done.is_set():
+            started = time.perf_counter()
+            await static_handler()
+            # Time until the loop gets back to us measures how blocked it is
+            await asyncio.sleep(0)
+            probe_latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(0.005)
+
+    probe_task = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe_task
+
+    return {
+        "throughput": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "probe_p95_ms": percentile(probe_latencies, 95) * 1000 if probe_latencies else float("nan"),
+        "probe_max_ms": max(probe_latencies) * 1000 if probe_latencies else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Total requests per case (default 200)")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent clients (default 50)")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Simulated upstream latency (default 50ms)")
+    args = parser.parse_args()
+
+    latency = args.latency_ms / 1000
+    print(
+        f"{args.requests} requests, {args.concurrency} concurrent, {args.latency_ms:.0f}ms upstream latency, "
+        f"supabase limit {upstream.UPSTREAM_LIMITS['supabase']}\n"
+    )
+    print(f"{'case':<10}  {'req/s':>8}  {'p50 ms':>8}  {'p95 ms':>8}  {'probe p95 ms':>12}  {'probe max ms':>12}")
+
+    for label, handler in (("inline", handler_inline), ("offloaded", handler_offloaded)):
+        result = asyncio.run(run_case(handler, args.requests, args.concurrency, latency))
+        print(
+            f"{label:<10}  {result['throughput']:>8.1f}  {result['p50_ms']:>8.1f}  {result['p95_ms']:>8.1f}  "
+            f"{result['probe_p95_ms']:>12.1f}  {result['probe_max_ms']:>12.1f}"
+        )
+
+    print(f"\nUpstream counters: {upstream.get_upstream_stats()['upstreams']['supabase']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,7 @@ Plagued Band Website - FastAPI Backend
 """
 import os
 import json
-import base64
-from datetime import datetime
+import asyncio
 from typing import Optional, List
 from uuid import UUID
 
@@ -12,6 +11,7 @@ import stripe
 import resend
 from fastapi import FastAPI, HTTPException, Request, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, EmailStr, validator, Field
 from dotenv import load_dotenv
 from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -25,39 +25,90 @@ from security_middleware import (
     validate_email_content
 )
 
+import database
 from database import (
     get_all_products_with_stock,
+    place_order,
+    mark_confirmation_email_sent
+)
+from database_async import (
     check_stock_availability,
-    find_or_create_customer,
-    create_address,
-    create_order,
-    decrement_stock,
     get_order_by_payment_intent,
-    mark_confirmation_email_sent,
     validate_discount_code,
-    record_discount_code_usage,
     get_discount_code_by_code
 )
-
-from admin_auth import verify_admin_token
-from admin_db import (
+from supabase_async import async_supabase
+from direct_db import direct_pool
+
+from catalog_cache import (
+    CATALOG_REFRESH_INTERVAL,
+    get_catalog_snapshot_async,
+    get_catalog_age,
+    get_catalog_stats,
+    catalog_etag,
+    run_catalog_refresher
+)
+from single_flight import get_single_flight_stats
+from upstream import run_blocking, run_cpu, get_upstream_stats, shutdown_process_pool
+from query_graph import QueryGraph
+from stock_feed import get_stock_changes, parse_stock_version
+from stock_broadcast import stock_broadcaster
+from webhook_queue import (
+    WEBHOOK_WORKERS,
+    webhook_queue,
+    notify_workers,
+    run_webhook_worker
+)
+from event_dedup import event_deduplicator
+from email_templates import (
+    render_order_confirmation,
+    render_order_notification,
+    render_contact_submission
+)
+from email_outbox import (
+    EMAIL_SEND_CONCURRENCY,
+    email_outbox,
+    notify_email_workers,
+    run_email_worker
+)
+from http_cache import (
+    CACHE_CONTROL_STATIC,
+    CACHE_CONTROL_CONFIG,
+    CACHE_CONTROL_REVALIDATE,
+    StaticPayload,
+    static_response,
+    conditional_json_response
+)
+from admin_auth import verify_admin_token, get_admin_auth_stats
+from admin_db_async import (
     get_all_orders,
     get_order_details,
     update_order_status,
     get_order_stats,
-    get_size_distribution_by_type,
+    fetch_size_distribution_data,
     get_all_products_admin,
     update_variant_stock,
     get_low_stock_variants,
     get_all_customers,
     get_customer_details,
-    get_analytics_overview,
+    fetch_analytics_data,
+    fetch_analytics_daily,
+    fetch_product_sales,
+    fetch_product_costs,
+    fetch_recent_orders,
+    count_customers,
     create_product,
     create_product_variant,
     delete_product,
     upload_product_image
 )
-from admin_collections import (
+from admin_db import CUSTOMER_SORTS
+from admin_analytics import (
+    compute_analytics_overview,
+    compute_size_distribution,
+    empty_analytics_overview
+)
+from admin_collections_async import (
     get_all_collections,
     get_collection_details,
     create_collection,
@@ -129,17 +180,6 @@ CONTACT_EMAIL = os.getenv("CONTACT_EMAIL", "plagueduk@gmail.com")
 # Feature flags
 ENABLE_DISCOUNT_CODES = os.getenv("ENABLE_DISCOUNT_CODES", "false").lower() == "true"
 
-# Load logo image for emails
-LOGO_DATA_URI = ""
-try:
-    logo_path = os.path.join(os.path.dirname(__file__), "..", "frontend", "public", "img", "logo-green.png")
-    with open(logo_path, "rb") as logo_file:
-        logo_base64 = base64.b64encode(logo_file.read()).decode("utf-8")
-        LOGO_DATA_URI = f"data:image/png;base64,{logo_base64}"
-except Exception as e:
-    print(f"Warning: Could not load logo image: {e}")
-    LOGO_DATA_URI = ""  # Fallback to no image
-
 
 # ============== MODELS ==============
 
@@ -273,6 +313,100 @@ SHOWS = [
 ]
 
 
+# Band info
+BAND_INFO = {
+    "name": "Plagued",
+    "location": "United Kingdom",
+    "genre": "Death Metal",
+    "formed": 2024,
+    "members": BAND_MEMBERS,
+    "bio": "Plagued is a death metal band from the United Kingdom, delivering crushing riffs and unrelenting brutality.",
+    "social": {
+        "instagram": "https://instagram.com/plagueduk",
+        "facebook": "",
+        "youtube": "",
+    },
+}
+
+# Public config
+PUBLIC_CONFIG = {
+    "discount_codes_enabled": ENABLE_DISCOUNT_CODES
+}
+
+# Static responses - serialized, hashed and compressed once at startup
+BAND_PAYLOAD = StaticPayload(BAND_INFO)
+RELEASES_PAYLOAD = StaticPayload(RELEASES)
+RELEASE_PAYLOADS = {release["id"]: StaticPayload(release) for release in RELEASES}
+SHOWS_PAYLOAD = StaticPayload(SHOWS)
+CONFIG_PAYLOAD = StaticPayload(PUBLIC_CONFIG)
+
+
+# ============== BACKGROUND TASKS ==============
+
+background_tasks: List[asyncio.Task] = []
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    """Start the merch catalog refresher, webhook queue and email outbox workers"""
+    if CATALOG_REFRESH_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(
+            run_catalog_refresher(get_all_products_with_stock, CATALOG_REFRESH_INTERVAL)
+        ))
+
+    # Events and emails a dead worker was mid-way through are claimed again
+    # once their lease expires - no startup recovery needed
+    for worker_id in range(WEBHOOK_WORKERS):
+        background_tasks.append(asyncio.create_task(
+            run_webhook_worker(process_stripe_event, worker_id)
+        ))
+
+    for worker_id in range(EMAIL_SEND_CONCURRENCY):
+        background_tasks.append(asyncio.create_task(
+            run_email_worker(on_email_sent, worker_id)
+        ))
+
+    background_tasks.append(asyncio.create_task(run_queue_retention()))
+
+
+# Seconds between prunes of processed webhook events, sent emails and old dedup IDs
+QUEUE_RETENTION_INTERVAL = 3600
+
+
+async def run_queue_retention():
+    """Prune finished rows from the local SQLite queues, at startup and then hourly"""
+    while True:
+        try:
+            events = await run_blocking("local", webhook_queue.prune)
+            emails = await run_blocking("local", email_outbox.prune)
+            event_ids = await run_blocking("local", webhook_queue.prune_event_ids)
+            if events or emails or event_ids:
+                print(f"[RETENTION] Pruned {events} webhook events, {emails} emails, {event_ids} dedup IDs")
+        except Exception as e:
+            print(f"[RETENTION] Prune failed: {e}")
+
+        await asyncio.sleep(QUEUE_RETENTION_INTERVAL)
+
+
+def on_email_sent(item: dict) -> None:
+    """Called by the email outbox once Resend has accepted a message"""
+    if item["kind"] == "order_confirmation" and item["order_id"]:
+        mark_confirmation_email_sent(item["order_id"])
+        print(f"[EMAIL] ✅ Confirmation email delivered for order {item['order_id']}")
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    """Cancel background tasks and close upstream clients"""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    shutdown_process_pool()
+    await async_supabase.aclose()
+    direct_pool.close()
+
+
 # ============== ENDPOINTS ==============
 
 @app.get("/")
@@ -281,49 +415,130 @@ async def root():
 
 
 @app.get("/api/band")
-async def get_band_info():
+async def get_band_info(request: Request):
     """Get band information and members"""
-    return {
-        "name": "Plagued",
-        "location": "United Kingdom",
-        "genre": "Death Metal",
-        "formed": 2024,
-        "members": BAND_MEMBERS,
-        "bio": "Plagued is a death metal band from the United Kingdom, delivering crushing riffs and unrelenting brutality.",
-        "social": {
-            "instagram": "https://instagram.com/plagueduk",
-            "facebook": "",
-            "youtube": "",
-        },
-    }
+    return static_response(request, BAND_PAYLOAD, CACHE_CONTROL_STATIC)
 
 
 @app.get("/api/releases")
-async def get_releases():
+async def get_releases(request: Request):
     """Get all releases"""
-    return RELEASES
+    return static_response(request, RELEASES_PAYLOAD, CACHE_CONTROL_STATIC)
 
 
 @app.get("/api/releases/{release_id}")
-async def get_release(release_id: str):
+async def get_release(release_id: str, request: Request):
     """Get a specific release"""
-    for release in RELEASES:
-        if release["id"] == release_id:
-            return release
+    payload = RELEASE_PAYLOADS.get(release_id)
+    if payload:
+        return static_response(request, payload, CACHE_CONTROL_STATIC)
     raise HTTPException(status_code=404, detail="Release not found")
 
 
 @app.get("/api/merch")
-async def get_merch():
-    """Get all merchandise with real-time stock levels from Supabase"""
+async def get_merch(request: Request):
+    """
+    Get all merchandise with stock levels.
+    Served from the in-memory catalog snapshot; if Supabase is failing the last
+    good snapshot is returned and the Age header shows how stale it is.
+    """
     try:
-        products = get_all_products_with_stock()
-        return products
+        products, version = await get_catalog_snapshot_async(get_all_products_with_stock)
+        age = get_catalog_age() or 0
+        return conditional_json_response(
+            request,
+            products,
+            catalog_etag(version),
+            CACHE_CONTROL_REVALIDATE,
+            extra_headers={"Age": str(int(age))}
+        )
     except Exception as e:
         print(f"Error fetching merch: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch products")
 
 
+@app.get("/api/merch/stock")
+async def get_merch_stock(since: Optional[str] = None):
+    """
+    Get stock levels that changed since a version token, as compact
+    [variant_id, stock, available] rows. Omit `since` (or pass a token from a
+    previous deploy) to get every variant with full=true.
+    Poll with the returned `version` as the next `since`.
+    """
+    try:
+        products, _ = await get_catalog_snapshot_async(get_all_products_with_stock)
+        changes = get_stock_changes(since, products)
+        return JSONResponse(content=changes, headers={"Cache-Control": CACHE_CONTROL_REVALIDATE})
+    except Exception as e:
+        print(f"Error fetching stock changes: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch stock levels")
+
+
+# Seconds between keep-alive comments on idle streams
+SSE_HEARTBEAT_SECONDS = 15
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Format a Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+@app.get("/api/merch/stream")
+async def stream_merch_stock(request: Request):
+    """
+    Server-Sent Events stream of live stock levels.
+    Sends a `snapshot` event with every variant on connect, then `stock`
+    events with [variant_id, stock, available] rows as stock changes.
+    """
+    subscriber = stock_broadcaster.subscribe()
+    if subscriber is None:
+        raise HTTPException(status_code=503, detail="Too many live connections - poll /api/merch/stock instead")
+
+    try:
+        products, _ = await get_catalog_snapshot_async(get_all_products_with_stock)
+    except Exception as e:
+        stock_broadcaster.unsubscribe(subscriber)
+        print(f"Error starting stock stream: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch stock levels")
+
+    # Subscribed before taking the snapshot, so no change can fall in between
+    snapshot = get_stock_changes(None, products)
+    snapshot_version = parse_stock_version(snapshot["version"])
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n"
+            yield format_sse("snapshot", snapshot)
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+
+                if event is None:
+                    # Dropped for falling behind - client reconnects for a fresh snapshot
+                    yield format_sse("dropped", {"reason": "slow consumer"})
+                    break
+
+                # Already reflected in the snapshot
+                if parse_stock_version(event["version"]) <= snapshot_version:
+                    continue
+
+                yield format_sse("stock", event)
+        finally:
+            stock_broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/api/merch/{item_id}")
 async def get_merch_item(item_id: str):
     """Get a specific merch item"""
@@ -334,9 +549,9 @@ async def get_merch_item(item_id: str):
 
 
 @app.get("/api/shows")
-async def get_shows():
+async def get_shows(request: Request):
     """Get all shows"""
-    return SHOWS
+    return static_response(request, SHOWS_PAYLOAD, CACHE_CONTROL_STATIC)
 
 
 @app.post("/api/contact")
@@ -344,33 +559,15 @@ async def get_shows():
 async def submit_contact(request: Request, form: ContactForm):
     """Handle contact form submission"""
     try:
-        # Build email body
-        html_body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; color: #333;">
-            <h2 style="color: #00ff00;">New Contact Form Submission</h2>
-            <p><strong>From:</strong> plagueduk.com</p>
-            <hr style="border: 1px solid #eee;">
-
-            <p><strong>Name:</strong> {form.name}</p>
-            <p><strong>Email:</strong> {form.email}</p>
-            <p><strong>Subject:</strong> {form.subject}</p>
-
-            <h3>Message:</h3>
-            <p style="background: #f5f5f5; padding: 15px; border-radius: 5px;">
-                {form.message.replace('\n', '<br>')}
-            </p>
-
-            <hr style="border: 1px solid #eee;">
-            <p style="color: #666; font-size: 12px;">
-                Submitted at: {datetime.utcnow().isoformat()}<br>
-                IP Address: {get_remote_address(request)}
-            </p>
-        </body>
-        </html>
-        """
-
-        # Send email using Resend
+        html_body = render_contact_submission(
+            name=form.name,
+            email=form.email,
+            subject=form.subject,
+            message=form.message,
+            ip_address=get_remote_address(request)
+        )
+
+        # Queue for delivery via Resend
         if resend.api_key:
             params = {
                 "from": FROM_EMAIL,
@@ -380,7 +577,8 @@ async def submit_contact(request: Request, form: ContactForm):
                 "reply_to": form.email,
             }
 
-            resend.Emails.send(params)
+            await run_blocking("local", email_outbox.enqueue, [{"kind": "contact", "params": params}])
+            notify_email_workers()
         else:
             # Log to console if Resend not configured
             print(f"Contact form submission (Resend not configured):")
@@ -413,7 +611,8 @@ async def create_checkout_session(request: CheckoutRequest):
                 "quantity": item.quantity,
             })
 
-        session = stripe.checkout.Session.create(
+        session = await run_blocking(
+            "stripe", stripe.checkout.Session.create,
             payment_method_types=["card"],
             line_items=line_items,
             mode="payment",
@@ -457,11 +656,9 @@ def calculate_shipping(subtotal_pence: int) -> dict:
 
 
 @app.get("/api/config")
-async def get_config():
+async def get_config(request: Request):
     """Get public configuration settings"""
-    return {
-        "discount_codes_enabled": ENABLE_DISCOUNT_CODES
-    }
+    return static_response(request, CONFIG_PAYLOAD, CACHE_CONTROL_CONFIG)
 
 
 @app.post("/api/validate-discount")
@@ -473,7 +670,7 @@ async def validate_discount(request: DiscountCodeValidationRequest):
     try:
         # If customer email provided, do full validation including usage check
         if request.customer_email:
-            discount = validate_discount_code(request.code, request.customer_email)
+            discount = await validate_discount_code(request.code, request.customer_email)
             if not discount:
                 raise HTTPException(
                     status_code=400,
@@ -481,7 +678,7 @@ async def validate_discount(request: DiscountCodeValidationRequest):
                 )
         else:
             # Just check if code exists and is active
-            discount = get_discount_code_by_code(request.code)
+            discount = await get_discount_code_by_code(request.code)
             if not discount or not discount.get("active"):
                 raise HTTPException(
                     status_code=400,
@@ -506,7 +703,7 @@ async def create_payment_intent(request: PaymentIntentRequest):
     """Create a Stripe PaymentIntent with stock validation and shipping"""
     try:
         # Validate stock availability BEFORE creating payment intent
-        is_available, error_message = check_stock_availability([
+        is_available, error_message = await check_stock_availability([
             {
                 "id": item.id,
                 "name": item.name,
@@ -529,7 +726,7 @@ async def create_payment_intent(request: PaymentIntentRequest):
         discount_amount = 0
         discount_code_id = None
         if ENABLE_DISCOUNT_CODES and request.discount_code:
-            discount = get_discount_code_by_code(request.discount_code)
+            discount = await get_discount_code_by_code(request.discount_code)
             if discount and discount.get("active"):
                 discount_percentage = discount["discount_percentage"]
                 discount_amount = int((subtotal * discount_percentage) / 100)
@@ -568,7 +765,8 @@ async def create_payment_intent(request: PaymentIntentRequest):
             metadata["discount_code_id"] = str(discount_code_id)
             metadata["discount_amount"] = str(discount_amount)
 
-        payment_intent = stripe.PaymentIntent.create(
+        payment_intent = await run_blocking(
+            "stripe", stripe.PaymentIntent.create,
             amount=total_amount,
             currency="gbp",
             payment_method_types=["card"],  # Card includes wallet payments (Apple Pay, Google Pay)
@@ -603,17 +801,14 @@ async def create_payment_intent(request: PaymentIntentRequest):
 
 @app.post("/api/webhook/stripe")
 async def stripe_webhook(request: Request):
-    """Handle Stripe webhooks"""
-    print("\n" + "="*60)
-    print("🔔 WEBHOOK RECEIVED FROM STRIPE")
-    print("="*60)
-
+    """
+    Handle Stripe webhooks.
+    Verifies the signature, durably queues the event and acknowledges at once;
+    background workers process it (see process_stripe_event).
+    """
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
 
-    print(f"[WEBHOOK] Payload size: {len(payload)} bytes")
-    print(f"[WEBHOOK] Signature header present: {bool(sig_header)}")
-
     try:
         event = stripe.Webhook.construct_event(
             payload, sig_header, STRIPE_WEBHOOK_SECRET
@@ -623,6 +818,102 @@ async def stripe_webhook(request: Request):
     except stripe.error.SignatureVerificationError:
         raise HTTPException(status_code=400, detail="Invalid signature")
 
+    # Recent replays stop here without touching the queue database
+    if event_deduplicator.seen(event["id"]):
+        print(f"[WEBHOOK] Duplicate delivery of event {event['id']} ignored")
+        return {"status": "success", "queued": False}
+
+    # Records the event ID and queues the event in one transaction - False for
+    # an event already accepted, including a concurrent duplicate delivery
+    try:
+        queued = await run_blocking(
+            "local", webhook_queue.enqueue, event["id"], event["type"], payload.decode("utf-8")
+        )
+    except Exception as e:
+        # Nothing was written - let Stripe retry the delivery
+        print(f"[WEBHOOK] Failed to queue event {event['id']}: {e}")
+        raise HTTPException(status_code=503, detail="Unable to queue event")
+
+    event_deduplicator.remember(event["id"], queued)
+
+    if queued:
+        notify_workers()
+        print(f"[WEBHOOK] Queued {event['type']} event {event['id']}")
+    else:
+        print(f"[WEBHOOK] Duplicate delivery of event {event['id']} ignored")
+
+    return {"status": "success", "queued": queued}
+
+
+def queue_order_emails(
+    order_id: str,
+    order_number: str,
+    customer_email: str,
+    customer_name: str,
+    items: list,
+    total_amount: int,
+    shipping_amount: int,
+    shipping_address: dict,
+    payment_intent_id: str
+) -> int:
+    """
+    Render and queue the customer confirmation and band notification together.
+    Per-order dedupe keys make a repeat call a no-op.
+    """
+    queued = email_outbox.enqueue([
+        {
+            "kind": "order_confirmation",
+            "order_id": order_id,
+            "dedupe_key": f"order_confirmation:{order_id}",
+            "params": {
+                "from": FROM_EMAIL,
+                "to": [customer_email],
+                "subject": f"Order Confirmation - {order_number}",
+                "html": render_order_confirmation(
+                    order_number=order_number,
+                    customer_name=customer_name,
+                    items=items,
+                    total_amount=total_amount,
+                    shipping_amount=shipping_amount,
+                    shipping_address=shipping_address
+                )
+            }
+        },
+        {
+            "kind": "order_notification",
+            "order_id": order_id,
+            "dedupe_key": f"order_notification:{order_id}",
+            "params": {
+                "from": FROM_EMAIL,
+                "to": [CONTACT_EMAIL],
+                "subject": f"New Order: {order_number}",
+                "html": render_order_notification(
+                    order_number=order_number,
+                    customer_name=customer_name,
+                    customer_email=customer_email,
+                    items=items,
+                    total_amount=total_amount,
+                    shipping_address=shipping_address,
+                    payment_intent_id=payment_intent_id
+                )
+            }
+        }
+    ])
+    notify_email_workers()
+    print(f"[EMAIL DEBUG] Queued {queued} email(s) for order {order_number} (customer: {customer_email})")
+    return queued
+
+
+def process_stripe_event(event: dict) -> dict:
+    """
+    Process a verified Stripe event. Runs on a webhook queue worker thread;
+    raising schedules a retry with backoff. Sync code - use the database
+    module here, not database_async.
+    """
+    print("\n" + "="*60)
+    print(f"🔔 PROCESSING STRIPE EVENT {event['id']} ({event['type']})")
+    print("="*60)
+
     # Handle payment_intent.succeeded event
     if event["type"] == "payment_intent.succeeded":
         payment_intent = event["data"]["object"]
@@ -631,11 +922,8 @@ async def stripe_webhook(request: Request):
         print(f"PaymentIntent succeeded: {payment_intent_id}")
 
         try:
-            # Check if order already exists (idempotency)
-            existing_order = get_order_by_payment_intent(payment_intent_id)
-            if existing_order:
-                print(f"Order already exists for PaymentIntent: {payment_intent_id}")
-                return {"status": "success", "message": "Order already processed"}
+            # Duplicate deliveries are rejected by event ID before queueing, and
+            # place_order is idempotent per PaymentIntent, so no lookup is needed here
 
             # Extract order details from metadata
             items_json = payment_intent.get("metadata", {}).get("items", "[]")
@@ -646,7 +934,7 @@ async def stripe_webhook(request: Request):
                 return {"status": "success", "message": "No items to process"}
 
             # Get shipping details
-            shipping = payment_intent.get("shipping", {})
+            shipping = payment_intent.get("shipping") or {}
             shipping_address = shipping.get("address", {})
             shipping_name = shipping.get("name", "")
 
@@ -678,20 +966,7 @@ async def stripe_webhook(request: Request):
 
             print(f"[EMAIL DEBUG] Final customer_email to be used: {customer_email}")
 
-            # Double-check stock availability (race condition protection)
-            is_available, error_message = check_stock_availability(items)
-            if not is_available:
-                print(f"Stock unavailable during order creation: {error_message}")
-                # TODO: Handle this edge case - may need to refund payment or contact customer
-                return {"status": "error", "message": error_message}
-
-            # 1. Find or create customer
-            customer_id = find_or_create_customer(customer_email, shipping_name)
-
-            # 2. Create address
-            address_id = create_address(customer_id, shipping)
-
-            # 3. Extract shipping cost and discount code from metadata
+            # 1. Extract shipping cost and discount code from metadata
             shipping_cost = int(payment_intent.get("metadata", {}).get("shipping_cost", 0))
             discount_code_id = payment_intent.get("metadata", {}).get("discount_code_id")
             discount_code = payment_intent.get("metadata", {}).get("discount_code")
@@ -699,20 +974,27 @@ async def stripe_webhook(request: Request):
             print(f"[DISCOUNT DEBUG] Metadata discount_code_id: {discount_code_id}")
             print(f"[DISCOUNT DEBUG] Metadata discount_code: {discount_code}")
 
-            # 3a. Verify customer hasn't already used the discount code
+            # 1a. Verify customer hasn't already used the discount code
             if discount_code_id and discount_code:
                 print(f"[DISCOUNT DEBUG] Validating discount code {discount_code} for customer {customer_email}")
-                discount_valid = validate_discount_code(discount_code, customer_email)
+                discount_valid = database.validate_discount_code(discount_code, customer_email)
                 if not discount_valid:
                     print(f"[DISCOUNT WARNING] Customer {customer_email} has already used code {discount_code}")
                     discount_code_id = None  # Don't apply discount if already used
                 else:
                     print(f"[DISCOUNT DEBUG] Discount code is valid, will be applied to order")
 
-            # 4. Create order with items
-            order = create_order(
-                customer_id=customer_id,
-                address_id=address_id,
+            # 2. Place order - customer, address, order, items, discount usage and
+            # stock decrement in one transaction. There is no stock pre-check: the
+            # RPC decrements atomically and raises (writing nothing) if a line can't
+            # be fulfilled, and on a retry the order's own decrement would fail a
+            # pre-check before the already_exists branch below could re-queue emails.
+            # An order that can never be fulfilled is retried until it is marked
+            # failed in the webhook queue; refunding it is a manual step.
+            order = place_order(
+                customer_email=customer_email,
+                customer_name=shipping_name,
+                shipping=shipping,
                 items=items,
                 total_amount=payment_intent["amount"],
                 stripe_payment_intent_id=payment_intent_id,
@@ -723,191 +1005,43 @@ async def stripe_webhook(request: Request):
             order_id = order["id"]
             order_number = order["order_number"]
 
-            # 4a. Record discount code usage if applicable
+            if order.get("already_exists"):
+                if order.get("confirmation_email_sent") or not resend.api_key:
+                    print(f"Order already exists for PaymentIntent: {payment_intent_id}")
+                    return {"status": "success", "message": "Order already processed"}
+                # A previous attempt may have failed before queueing the emails -
+                # queue them again (dedupe keys make this a no-op if they were)
+                print(f"Order {order_number} exists without a sent confirmation, queueing emails")
+
             if discount_code_id:
-                print(f"[DISCOUNT DEBUG] Recording discount code usage:")
-                print(f"  - discount_code_id: {discount_code_id}")
-                print(f"  - customer_email: {customer_email}")
-                print(f"  - order_id: {order_id}")
-                usage_recorded = record_discount_code_usage(UUID(discount_code_id), customer_email, UUID(order_id))
-                if usage_recorded:
-                    print(f"[DISCOUNT] ✅ Recorded discount code usage for order {order_number}")
-                else:
-                    print(f"[DISCOUNT] ❌ Failed to record discount code usage for order {order_number}")
-
-            # 4b. Decrement stock
-            decrement_stock(items, order_id)
-
-            # 5. Send order confirmation emails
-            try:
-                # Build items HTML for email
-                items_html = ""
-                for item in items:
-                    line_total = item["price"] * item["quantity"]
-                    items_html += f"""
-                    <tr>
-                        <td style="padding: 10px; border-bottom: 1px solid #eee;">
-                            {item['name']}<br>
-                            <span style="color: #666; font-size: 12px;">Size: {item['size']}</span>
-                        </td>
-                        <td style="padding: 10px; border-bottom: 1px solid #eee; text-align: center;">{item['quantity']}</td>
-                        <td style="padding: 10px; border-bottom: 1px solid #eee; text-align: right;">£{(line_total / 100):.2f}</td>
-                    </tr>
-                    """
-
-                # Calculate amounts
-                total_amount = payment_intent['amount']
-                subtotal = total_amount - shipping_cost
-
-                subtotal_formatted = f"£{(subtotal / 100):.2f}"
-                shipping_formatted = f"£{(shipping_cost / 100):.2f}"
-                total_formatted = f"£{(total_amount / 100):.2f}"
-
-                # Free shipping note
-                free_shipping_note = ""
-                if shipping_cost == 0 and subtotal >= 5000:  # £50 or more
-                    free_shipping_note = ' <span style="color: #00ff00; font-size: 12px;">(Free on orders over £50)</span>'
-
-                html_body = f"""
-                <html>
-                <body style="font-family: Arial, sans-serif; color: #333; max-width: 600px; margin: 0 auto;">
-                    <div style="background: #000; padding: 30px 20px; text-align: center;">
-                        <img src="{LOGO_DATA_URI}" alt="PLAGUED" style="max-width: 200px; height: auto;">
-                    </div>
-
-                    <div style="padding: 30px 20px;">
-                        <h2 style="color: #00ff00;">Order Confirmed!</h2>
-                        <p>Thanks for your order, {shipping_name}! We'll ship it out soon.</p>
-
-                        <div style="background: #f5f5f5; padding: 15px; margin: 20px 0; border-left: 4px solid #00ff00;">
-                            <strong>Order Number:</strong> {order_number}<br>
-                            <strong>Order Date:</strong> {datetime.utcnow().strftime('%d %B %Y')}
-                        </div>
-
-                        <h3 style="margin-top: 30px;">Order Items</h3>
-                        <table style="width: 100%; border-collapse: collapse;">
-                            <thead>
-                                <tr style="background: #f5f5f5;">
-                                    <th style="padding: 10px; text-align: left;">Item</th>
-                                    <th style="padding: 10px; text-align: center;">Qty</th>
-                                    <th style="padding: 10px; text-align: right;">Price</th>
-                                </tr>
-                            </thead>
-                            <tbody>
-                                {items_html}
-                            </tbody>
-                            <tfoot>
-                                <tr>
-                                    <td colspan="2" style="padding: 10px; text-align: right;">Subtotal:</td>
-                                    <td style="padding: 10px; text-align: right;">{subtotal_formatted}</td>
-                                </tr>
-                                <tr>
-                                    <td colspan="2" style="padding: 10px; text-align: right;">Shipping:{free_shipping_note}</td>
-                                    <td style="padding: 10px; text-align: right;">{shipping_formatted}</td>
-                                </tr>
-                                <tr>
-                                    <td colspan="2" style="padding: 15px 10px; text-align: right; font-weight: bold; border-top: 2px solid #00ff00;">Total:</td>
-                                    <td style="padding: 15px 10px; text-align: right; font-weight: bold; color: #00ff00; font-size: 18px; border-top: 2px solid #00ff00;">{total_formatted}</td>
-                                </tr>
-                            </tfoot>
-                        </table>
-
-                        <h3 style="margin-top: 30px;">Shipping Address</h3>
-                        <div style="background: #f5f5f5; padding: 15px;">
-                            {shipping_name}<br>
-                            {shipping_address.get('line1', '')}<br>
-                            {shipping_address.get('line2', '') + '<br>' if shipping_address.get('line2') else ''}
-                            {shipping_address.get('city', '')}, {shipping_address.get('postal_code', '')}<br>
-                            {shipping_address.get('country', 'GB')}
-                        </div>
-
-                        <p style="margin-top: 30px; color: #666; font-size: 14px;">
-                            You'll receive another email with tracking information once your order ships.
-                        </p>
-
-                        <p style="margin-top: 20px;">
-                            Questions? Email us at <a href="mailto:contact@plagueduk.com" style="color: #00ff00;">contact@plagueduk.com</a>
-                        </p>
-                    </div>
-
-                    <div style="background: #f5f5f5; padding: 20px; text-align: center; font-size: 12px; color: #666;">
-                        <p style="margin: 0;">Plagued - Death Metal from the UK</p>
-                        <p style="margin: 5px 0 0 0;">contact@plagueduk.com</p>
-                    </div>
-                </body>
-                </html>
-                """
-
-                # Send customer confirmation email
-                if resend.api_key:
-                    try:
-                        print(f"[EMAIL DEBUG] Sending customer confirmation to: {customer_email}")
-                        customer_response = resend.Emails.send({
-                            "from": FROM_EMAIL,
-                            "to": [customer_email],
-                            "subject": f"Order Confirmation - {order_number}",
-                            "html": html_body
-                        })
-                        print(f"[EMAIL DEBUG] Customer email sent! Response: {customer_response}")
-                    except Exception as customer_email_error:
-                        print(f"[EMAIL ERROR] Failed to send customer email: {customer_email_error}")
-                        print(f"[EMAIL ERROR] Customer email was: {customer_email}")
-
-                    # Send notification to band
-                    notification_html = f"""
-                    <html>
-                    <body style="font-family: Arial, sans-serif;">
-                        <h2 style="color: #00ff00;">New Order Received!</h2>
-                        <p><strong>Order Number:</strong> {order_number}</p>
-                        <p><strong>Customer:</strong> {shipping_name} ({customer_email})</p>
-                        <p><strong>Total:</strong> {total_formatted}</p>
-
-                        <p><strong>Items:</strong></p>
-                        <ul>
-                            {''.join([f'<li>{item["name"]} - Size {item["size"]} x {item["quantity"]}</li>' for item in items])}
-                        </ul>
-                        <p><strong>Shipping Address:</strong><br>
-                        {shipping_name}<br>
-                        {shipping_address.get('line1', '')}<br>
-                        {shipping_address.get('line2', '') + '<br>' if shipping_address.get('line2') else ''}
-                        {shipping_address.get('city', '')}, {shipping_address.get('postal_code', '')}<br>
-                        {shipping_address.get('country', 'GB')}
-                        </p>
-                        <p><a href="https://dashboard.stripe.com/payments/{payment_intent_id}" style="color: #00ff00;">View in Stripe Dashboard</a></p>
-                    </body>
-                    </html>
-                    """
-
-                    try:
-                        print(f"[EMAIL DEBUG] Sending admin notification to: {CONTACT_EMAIL}")
-
-                        email_params = {
-                            "from": FROM_EMAIL,
-                            "to": [CONTACT_EMAIL],
-                            "subject": f"New Order: {order_number}",
-                            "html": notification_html
-                        }
-
-                        admin_response = resend.Emails.send(email_params)
-                        print(f"[EMAIL DEBUG] Admin email sent! Response: {admin_response}")
-                    except Exception as admin_email_error:
-                        print(f"[EMAIL ERROR] Failed to send admin email: {admin_email_error}")
-
-                    # Mark email as sent
-                    mark_confirmation_email_sent(order_id)
-
-                    print(f"[EMAIL DEBUG] ✅ Order confirmation emails completed for order {order_number}")
-
-            except Exception as email_error:
-                print(f"Error sending order confirmation email: {email_error}")
-                # Don't fail the webhook - order is created, just log the email error
+                print(f"[DISCOUNT] ✅ Recorded discount code usage for order {order_number}")
+
+            # 5. Queue order confirmation emails
+            if resend.api_key:
+                try:
+                    queue_order_emails(
+                        order_id=order_id,
+                        order_number=order_number,
+                        customer_email=customer_email,
+                        customer_name=shipping_name,
+                        items=items,
+                        total_amount=payment_intent["amount"],
+                        shipping_amount=shipping_cost,
+                        shipping_address=shipping_address,
+                        payment_intent_id=payment_intent_id
+                    )
+                except Exception as email_error:
+                    print(f"Error queueing order confirmation email: {email_error}")
+                    # Raise so the webhook queue retries - the order already exists, so the
+                    # retry comes back here via already_exists and re-queues the emails
+                    raise
 
             print(f"Order created successfully: {order_number}")
 
         except Exception as e:
             print(f"Error processing order: {type(e).__name__}: {str(e)}")
-            # Return 200 to Stripe to avoid retries, but log error for manual review
-            return {"status": "error", "message": str(e)}
+            # Raise so the webhook queue retries with backoff - place_order is idempotent
+            raise
 
     elif event["type"] == "checkout.session.completed":
         # Handle if you use Checkout Sessions (currently using Payment Intents)
@@ -935,7 +1069,7 @@ async def test_webhook(payment_intent_id: str = None):
         print(f"[TEST WEBHOOK] Fetching PaymentIntent: {payment_intent_id}")
 
         # Fetch the payment intent from Stripe
-        payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id, expand=["latest_charge"])
+        payment_intent = await run_blocking("stripe", stripe.PaymentIntent.retrieve, payment_intent_id, expand=["latest_charge"])
 
         print(f"[TEST WEBHOOK] PaymentIntent status: {payment_intent.status}")
         print(f"[TEST WEBHOOK] Amount: £{payment_intent.amount / 100:.2f}")
@@ -947,7 +1081,7 @@ async def test_webhook(payment_intent_id: str = None):
             }
 
         # Check if order already exists (idempotency)
-        existing_order = get_order_by_payment_intent(payment_intent_id)
+        existing_order = await get_order_by_payment_intent(payment_intent_id)
         if existing_order:
             return {
                 "status": "already_processed",
@@ -987,7 +1121,7 @@ async def test_webhook(payment_intent_id: str = None):
             # If charge is a string ID, we need to retrieve it
             if isinstance(charge, str):
                 print(f"[EMAIL DEBUG] Charge is ID string, retrieving charge object...")
-                charge = stripe.Charge.retrieve(charge)
+                charge = await run_blocking("stripe", stripe.Charge.retrieve, charge)
 
             customer_email = charge.billing_details.email or ""
             if customer_email:
@@ -1016,7 +1150,7 @@ async def test_webhook(payment_intent_id: str = None):
         print(f"{'='*60}\n")
 
         # Validate stock availability
-        is_available, error_message = check_stock_availability(items)
+        is_available, error_message = await check_stock_availability(items)
         if not is_available:
             return {
                 "status": "error",
@@ -1025,14 +1159,6 @@ async def test_webhook(payment_intent_id: str = None):
 
         print("✅ Stock validation passed")
 
-        # Create customer
-        customer_id = find_or_create_customer(customer_email, shipping_name)
-        print(f"✅ Customer created/found: {customer_id}")
-
-        # Create address
-        address_id = create_address(customer_id, shipping)
-        print(f"✅ Address created: {address_id}")
-
         # Extract shipping cost and discount code from metadata
         shipping_cost = int(payment_intent.metadata.get("shipping_cost", 0))
         discount_code_id = payment_intent.metadata.get("discount_code_id")
@@ -1042,17 +1168,19 @@ async def test_webhook(payment_intent_id: str = None):
             print(f"🎟️ Discount code in metadata: {discount_code}")
 
             # Verify customer hasn't already used the discount code
-            discount_valid = validate_discount_code(discount_code, customer_email)
+            discount_valid = await validate_discount_code(discount_code, customer_email)
             if not discount_valid:
                 print(f"[DISCOUNT WARNING] Customer {customer_email} has already used code {discount_code}")
                 discount_code_id = None  # Don't apply discount if already used
             else:
                 print(f"✅ Discount code valid for customer")
 
-        # Create order
-        order = create_order(
-            customer_id=customer_id,
-            address_id=address_id,
+        # Place order (customer, address, order, items, discount usage, stock) in one transaction
+        order = await run_blocking(
+            "supabase", place_order,
+            customer_email=customer_email,
+            customer_name=shipping_name,
+            shipping=shipping,
             items=items,
             total_amount=total_amount,
             stripe_payment_intent_id=payment_intent_id,
@@ -1061,171 +1189,33 @@ async def test_webhook(payment_intent_id: str = None):
         )
         order_id = order["id"]
         order_number = order["order_number"]
-        print(f"✅ Order created: {order_number} (ID: {order_id})")
 
-        # Record discount code usage if applicable
+        if order.get("already_exists"):
+            return {
+                "status": "already_processed",
+                "order_id": order_id,
+                "order_number": order_number,
+                "message": "Order was already created for this payment"
+            }
+
+        print(f"✅ Order placed: {order_number} (ID: {order_id})")
         if discount_code_id:
-            record_discount_code_usage(UUID(discount_code_id), customer_email, UUID(order_id))
             print(f"[DISCOUNT] Recorded discount code usage for order {order_number}")
 
-        # Decrement stock
-        decrement_stock(items, order_id)
-        print(f"✅ Stock decremented")
-
-        # Send confirmation email to customer
-        customer_items_html = "".join([
-            f"""
-            <tr>
-                <td style="padding: 12px; border-bottom: 1px solid #2a2a2a;">
-                    <strong style="color: #00ff00;">{item['name']}</strong><br>
-                    <span style="color: #999; font-size: 12px;">Size: {item['size']} | Qty: {item['quantity']}</span>
-                </td>
-                <td style="padding: 12px; border-bottom: 1px solid #2a2a2a; text-align: right; color: #00ff00;">
-                    £{(item['price'] * item['quantity'] / 100):.2f}
-                </td>
-            </tr>
-            """ for item in items
-        ])
-
-        # Calculate amounts for email
-        subtotal = total_amount - shipping_cost
-        free_shipping_note = ""
-        if shipping_cost == 0 and subtotal >= 5000:  # £50 or more
-            free_shipping_note = '<br><span style="color: #00ff00; font-size: 11px;">(Free on orders over £50)</span>'
-
-        customer_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        </head>
-        <body style="font-family: 'Helvetica Neue', Arial, sans-serif; background-color: #0a0a0a; color: #f5f5f5; margin: 0; padding: 40px 20px;">
-            <div style="max-width: 600px; margin: 0 auto; background-color: #1a1a1a; border: 1px solid #2a2a2a;">
-                <div style="background-color: #000; padding: 30px; text-align: center; border-bottom: 2px solid #00ff00;">
-                    <img src="{LOGO_DATA_URI}" alt="PLAGUED" style="max-width: 200px; height: auto;">
-                </div>
-
-                <div style="padding: 40px 30px;">
-                    <h2 style="color: #00ff00; margin-top: 0;">Order Confirmed</h2>
-                    <p style="color: #999; line-height: 1.6;">
-                        Thanks for your order! We've received your payment and will start processing your items soon.
-                    </p>
-
-                    <div style="background-color: #0a0a0a; padding: 20px; margin: 30px 0; border-left: 3px solid #00ff00;">
-                        <p style="margin: 0; color: #999; font-size: 12px; text-transform: uppercase; letter-spacing: 1px;">Order Number</p>
-                        <p style="margin: 5px 0 0 0; color: #00ff00; font-size: 24px; font-weight: bold;">{order_number}</p>
-                    </div>
-
-                    <h3 style="color: #f5f5f5; border-bottom: 1px solid #2a2a2a; padding-bottom: 10px;">Order Details</h3>
-                    <table style="width: 100%; border-collapse: collapse; margin: 20px 0;">
-                        {customer_items_html}
-                        <tr>
-                            <td style="padding: 12px; text-align: right; color: #999;">
-                                Subtotal
-                            </td>
-                            <td style="padding: 12px; text-align: right; color: #f5f5f5;">
-                                £{(subtotal / 100):.2f}
-                            </td>
-                        </tr>
-                        <tr>
-                            <td style="padding: 12px; text-align: right; color: #999;">
-                                Shipping{free_shipping_note}
-                            </td>
-                            <td style="padding: 12px; text-align: right; color: #f5f5f5;">
-                                £{(shipping_cost / 100):.2f}
-                            </td>
-                        </tr>
-                        <tr>
-                            <td style="padding: 20px 12px 12px 12px; text-align: right; color: #999; border-top: 2px solid #00ff00;">
-                                <strong>TOTAL</strong>
-                            </td>
-                            <td style="padding: 20px 12px 12px 12px; text-align: right; font-size: 20px; color: #00ff00; border-top: 2px solid #00ff00;">
-                                <strong>£{(total_amount / 100):.2f}</strong>
-                            </td>
-                        </tr>
-                    </table>
-
-                    <h3 style="color: #f5f5f5; border-bottom: 1px solid #2a2a2a; padding-bottom: 10px;">Shipping Address</h3>
-                    <p style="color: #999; line-height: 1.6;">
-                        {shipping_name}<br>
-                        {shipping.get('address', {}).get('line1', '')}<br>
-                        {shipping.get('address', {}).get('line2', '') + '<br>' if shipping.get('address', {}).get('line2') else ''}
-                        {shipping.get('address', {}).get('city', '')}, {shipping.get('address', {}).get('postal_code', '')}<br>
-                        {shipping.get('address', {}).get('country', '')}
-                    </p>
-
-                    <p style="color: #666; font-size: 12px; margin-top: 40px;">
-                        If you have any questions, reply to this email or contact us at <a href="mailto:contact@plagueduk.com" style="color: #00ff00;">contact@plagueduk.com</a>
-                    </p>
-                </div>
-
-                <div style="background-color: #0a0a0a; padding: 20px; text-align: center; border-top: 1px solid #2a2a2a;">
-                    <p style="color: #666; font-size: 12px; margin: 0;">
-                        © 2024 Plagued. All rights reserved.
-                    </p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-
-        resend.Emails.send({
-            "from": FROM_EMAIL,
-            "to": customer_email,
-            "subject": f"Order Confirmation - {order_number}",
-            "html": customer_html
-        })
-        print(f"✅ Customer confirmation email sent to: {customer_email}")
-
-        # Send admin notification with shipping label
-        admin_items_list = "\n".join([
-            f"- {item['name']} (Size: {item['size']}) x{item['quantity']} = £{(item['price'] * item['quantity'] / 100):.2f}"
-            for item in items
-        ])
-
-        admin_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-            <h2 style="color: #00ff00;">🎉 New Order Received!</h2>
-
-            <div style="background: #f5f5f5; padding: 15px; margin: 20px 0; border-left: 4px solid #00ff00;">
-                <strong>Order Number:</strong> {order_number}<br>
-                <strong>Total:</strong> £{(total_amount / 100):.2f}<br>
-                <strong>Customer:</strong> {customer_email}
-            </div>
-
-            <h3>Items Ordered:</h3>
-            <pre style="background: #f5f5f5; padding: 15px; border-left: 4px solid #00ff00;">{admin_items_list}</pre>
-
-            <h3>Shipping Address:</h3>
-            <pre style="background: #f5f5f5; padding: 15px; border-left: 4px solid #00ff00;">{shipping_name}
-{shipping.get('address', {}).get('line1', '')}
-{shipping.get('address', {}).get('line2', '')}
-{shipping.get('address', {}).get('city', '')}, {shipping.get('address', {}).get('postal_code', '')}
-{shipping.get('address', {}).get('country', '')}</pre>
-
-            <p style="color: #666; font-size: 12px; margin-top: 40px;">
-                View full order details in your Supabase dashboard.
-            </p>
-        </body>
-        </html>
-        """
-
-        email_params = {
-            "from": FROM_EMAIL,
-            "to": CONTACT_EMAIL,
-            "subject": f"🛍️ New Order: {order_number}",
-            "html": admin_html
-        }
-
-        resend.Emails.send(email_params)
-        print(f"✅ Admin notification email sent to: {CONTACT_EMAIL}")
-
-        # Mark confirmation email as sent
-        mark_confirmation_email_sent(order_id)
-        print(f"✅ Email status updated in database")
+        # Queue confirmation emails; the order is marked confirmed once the customer email is delivered
+        await run_blocking(
+            "local", queue_order_emails,
+            order_id=order_id,
+            order_number=order_number,
+            customer_email=customer_email,
+            customer_name=shipping_name,
+            items=items,
+            total_amount=total_amount,
+            shipping_amount=shipping_cost,
+            shipping_address=shipping.get("address") or {},
+            payment_intent_id=payment_intent_id
+        )
+        print(f"✅ Confirmation emails queued for {customer_email} and {CONTACT_EMAIL}")
 
         print(f"\n{'='*60}")
         print(f"✅ TEST COMPLETE - Order processed successfully!")
@@ -1261,13 +1251,30 @@ async def admin_list_orders(
     limit: int = 20,
     status: str = None,
     search: str = None,
+    cursor: str = None,
+    count: str = "exact",
     admin: dict = Depends(verify_admin_token)
 ):
-    """Get paginated list of orders with filtering"""
+    """
+    Get paginated list of orders with filtering.
+    Pass next_cursor from the previous response as cursor for keyset paging
+    (page is then ignored); count=planned/estimated/none avoids an exact count.
+    search matches order number, customer email or name, or postcode, best
+    match first, paged by page/limit.
+    """
     try:
         offset = (page - 1) * limit
-        result = get_all_orders(limit=limit, offset=offset, status_filter=status, search=search)
+        result = await get_all_orders(
+            limit=limit,
+            offset=offset,
+            status_filter=status,
+            search=search,
+            cursor=cursor,
+            count=count
+        )
         return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error in admin_list_orders: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch orders")
@@ -1280,7 +1287,7 @@ async def admin_get_order(
 ):
     """Get full order details"""
     try:
-        order = get_order_details(order_id)
+        order = await get_order_details(order_id)
         if not order:
             raise HTTPException(status_code=404, detail="Order not found")
         return order
@@ -1303,7 +1310,7 @@ async def admin_update_order_status(
 ):
     """Update order status"""
     try:
-        success = update_order_status(order_id, request.status)
+        success = await update_order_status(order_id, request.status)
         if not success:
             raise HTTPException(status_code=500, detail="Failed to update order status")
         return {"success": True, "order_id": order_id, "status": request.status}
@@ -1320,7 +1327,7 @@ async def admin_list_products(
 ):
     """Get all products with variants"""
     try:
-        products = get_all_products_admin()
+        products = await get_all_products_admin()
         return products
     except Exception as e:
         print(f"Error in admin_list_products: {e}")
@@ -1341,7 +1348,7 @@ async def admin_update_stock(
 ):
     """Update variant stock level"""
     try:
-        success = update_variant_stock(
+        success = await update_variant_stock(
             variant_id=variant_id,
             new_stock=request.stock_quantity,
             reason=request.reason,
@@ -1377,7 +1384,7 @@ async def admin_create_product(
     """Create a new product with variants"""
     try:
         # Create product
-        product = create_product(
+        product = await create_product(
             name=request.name,
             description=request.description,
             base_price=request.base_price,
@@ -1394,7 +1401,7 @@ async def admin_create_product(
         # Create variants for each size
         variants = []
         for size_data in request.sizes:
-            variant = create_product_variant(
+            variant = await create_product_variant(
                 product_id=product["id"],
                 size_name=size_data.get("size_name"),
                 price_adjustment=size_data.get("price_adjustment", 0),
@@ -1431,7 +1438,7 @@ async def admin_upload_product_image(
             raise HTTPException(status_code=400, detail="File must be an image")
 
         # Upload to Supabase
-        image_url = upload_product_image(file_bytes, file.filename)
+        image_url = await upload_product_image(file_bytes, file.filename)
 
         if not image_url:
             raise HTTPException(status_code=500, detail="Failed to upload image")
@@ -1452,7 +1459,7 @@ async def admin_delete_product(
 ):
     """Delete a product if it has no orders, otherwise mark as inactive"""
     try:
-        result = delete_product(product_id)
+        result = await delete_product(product_id)
 
         if not result:
             raise HTTPException(status_code=500, detail="Failed to delete product")
@@ -1475,13 +1482,32 @@ async def admin_list_customers(
     page: int = 1,
     limit: int = 50,
     search: str = None,
+    sort: str = "created_at",
+    cursor: str = None,
+    count: str = "exact",
     admin: dict = Depends(verify_admin_token)
 ):
-    """Get paginated list of customers"""
+    """
+    Get paginated list of customers, sorted by created_at, total_spent or last_order_at.
+    cursor and count work as for /api/admin/orders. search matches email or
+    name and returns ranked results, paged by page only.
+    """
+    if sort not in CUSTOMER_SORTS:
+        raise HTTPException(status_code=400, detail=f"Invalid sort. Must be one of: {', '.join(CUSTOMER_SORTS)}")
+
     try:
         offset = (page - 1) * limit
-        result = get_all_customers(limit=limit, offset=offset, search=search)
+        result = await get_all_customers(
+            limit=limit,
+            offset=offset,
+            search=search,
+            sort=sort,
+            cursor=cursor,
+            count=count
+        )
         return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error in admin_list_customers: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch customers")
@@ -1494,7 +1520,7 @@ async def admin_get_customer(
 ):
     """Get customer with full order history"""
     try:
-        customer = get_customer_details(customer_id)
+        customer = await get_customer_details(customer_id)
         if not customer:
             raise HTTPException(status_code=404, detail="Customer not found")
         return customer
@@ -1505,13 +1531,33 @@ async def admin_get_customer(
         raise HTTPException(status_code=500, detail="Failed to fetch customer")
 
 
+async def load_analytics_overview() -> dict:
+    """Fetch analytics rows concurrently and aggregate them off the event loop"""
+    try:
+        data = await fetch_analytics_data()
+        return await run_cpu(compute_analytics_overview, data)
+    except Exception as e:
+        print(f"Error fetching analytics: {e}")
+        return empty_analytics_overview()
+
+
+async def load_size_distribution() -> dict:
+    """Fetch sold items and variants concurrently and aggregate them off the event loop"""
+    try:
+        data = await fetch_size_distribution_data()
+        return await run_cpu(compute_size_distribution, data["order_items"], data["variants"])
+    except Exception as e:
+        print(f"Error fetching size distribution: {e}")
+        return {}
+
+
 @app.get("/api/admin/analytics/overview")
 async def admin_get_analytics(
     admin: dict = Depends(verify_admin_token)
 ):
     """Get analytics overview for dashboard"""
     try:
-        analytics = get_analytics_overview()
+        analytics = await load_analytics_overview()
         return analytics
     except Exception as e:
         print(f"Error in admin_get_analytics: {e}")
@@ -1524,22 +1570,45 @@ async def admin_get_size_distribution(
 ):
     """Get size distribution by product type for inventory planning"""
     try:
-        distribution = get_size_distribution_by_type()
+        distribution = await load_size_distribution()
         return distribution
     except Exception as e:
         print(f"Error in admin_get_size_distribution: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch size distribution")
 
 
+async def dashboard_analytics(graph: QueryGraph) -> dict:
+    """Analytics overview from the graph's shared rows, aggregated off the event loop"""
+    try:
+        data = await graph.gather("daily", "product_sales", "products", "recent_orders", "order_stats", "total_customers")
+        return await run_cpu(compute_analytics_overview, data)
+    except Exception as e:
+        print(f"Error fetching analytics: {e}")
+        return empty_analytics_overview()
+
+
+# Each query runs once per request; order_stats feeds both the response and the analytics
+DASHBOARD_QUERIES = {
+    "order_stats": lambda graph: get_order_stats(),
+    "low_stock": lambda graph: get_low_stock_variants(threshold=5),
+    "daily": lambda graph: fetch_analytics_daily(),
+    "product_sales": lambda graph: fetch_product_sales(),
+    "products": lambda graph: fetch_product_costs(),
+    "recent_orders": lambda graph: fetch_recent_orders(),
+    "total_customers": lambda graph: count_customers(),
+    "analytics": dashboard_analytics,
+}
+
+
 @app.get("/api/admin/dashboard/stats")
 async def admin_dashboard_stats(
     admin: dict = Depends(verify_admin_token)
 ):
     """Get quick stats for dashboard"""
     try:
-        order_stats = get_order_stats()
-        low_stock = get_low_stock_variants(threshold=5)
-        analytics = get_analytics_overview()
+        graph = QueryGraph(DASHBOARD_QUERIES)
+        results = await graph.gather("order_stats", "low_stock", "analytics")
+        order_stats, low_stock, analytics = results["order_stats"], results["low_stock"], results["analytics"]
 
         return {
             "order_stats": order_stats,
@@ -1573,13 +1642,33 @@ async def admin_dashboard_stats(
             "total_customers": analytics["total_customers"],
             "average_order_value": analytics["average_order_value"],
             "top_products": analytics["top_products"],
-            "recent_orders": analytics["recent_orders"][:5]  # Last 5 orders
+            "recent_orders": analytics["recent_orders"][:5],  # Last 5 orders
+            "query_timings_ms": graph.timings()
         }
     except Exception as e:
         print(f"Error in admin_dashboard_stats: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch dashboard stats")
 
 
+@app.get("/api/admin/metrics")
+async def admin_get_metrics(
+    admin: dict = Depends(verify_admin_token)
+):
+    """Get backend performance counters"""
+    return {
+        "catalog": get_catalog_stats(),
+        "stock_stream": stock_broadcaster.stats(),
+        "webhook_queue": webhook_queue.stats(),
+        "webhook_dedup": event_deduplicator.stats(),
+        "email_outbox": email_outbox.stats(),
+        "single_flight": get_single_flight_stats(),
+        "upstream": get_upstream_stats(),
+        "supabase_async": async_supabase.stats(),
+        "direct_db": direct_pool.stats(),
+        "admin_auth": get_admin_auth_stats()
+    }
+
+
 # ============== COLLECTIONS ==============
 
 class CreateCollectionRequest(BaseModel):
@@ -1602,7 +1691,7 @@ async def admin_list_collections(
 ):
     """Get all collections with product counts"""
     try:
-        collections = get_all_collections()
+        collections = await get_all_collections()
         return collections
     except Exception as e:
         print(f"Error in admin_list_collections: {e}")
@@ -1616,7 +1705,7 @@ async def admin_get_collection(
 ):
     """Get collection details with all products"""
     try:
-        collection = get_collection_details(collection_id)
+        collection = await get_collection_details(collection_id)
         if not collection:
             raise HTTPException(status_code=404, detail="Collection not found")
         return collection
@@ -1634,7 +1723,7 @@ async def admin_create_collection(
 ):
     """Create a new collection"""
     try:
-        collection = create_collection(
+        collection = await create_collection(
             name=request.name,
             description=request.description
         )
@@ -1656,7 +1745,7 @@ async def admin_update_collection(
 ):
     """Update collection details"""
     try:
-        success = update_collection(
+        success = await update_collection(
             collection_id=collection_id,
             name=request.name,
             description=request.description
@@ -1678,7 +1767,7 @@ async def admin_delete_collection(
 ):
     """Delete a collection"""
     try:
-        success = delete_collection(collection_id)
+        success = await delete_collection(collection_id)
         if not success:
             raise HTTPException(status_code=500, detail="Failed to delete collection")
         return {"success": True}
@@ -1697,7 +1786,7 @@ async def admin_add_products_to_collection(
 ):
     """Add products to a collection"""
     try:
-        success = add_products_to_collection(collection_id, request.product_ids)
+        success = await add_products_to_collection(collection_id, request.product_ids)
         if not success:
             raise HTTPException(status_code=500, detail="Failed to add products")
         return {"success": True}
@@ -1716,7 +1805,7 @@ async def admin_remove_product_from_collection(
 ):
     """Remove a product from a collection"""
     try:
-        success = remove_product_from_collection(collection_id, product_id)
+        success = await remove_product_from_collection(collection_id, product_id)
         if not success:
             raise HTTPException(status_code=500, detail="Failed to remove product")
         return {"success": True}
@@ -1734,7 +1823,7 @@ async def admin_drop_collection(
 ):
     """Drop a collection - make all products active"""
     try:
-        success = drop_collection(collection_id)
+        success = await drop_collection(collection_id)
         if not success:
             raise HTTPException(status_code=500, detail="Failed to drop collection")
         return {"success": True, "message": "Collection dropped successfully"}
@@ -1752,7 +1841,7 @@ async def admin_undrop_collection(
 ):
     """Undrop a collection - make all products inactive"""
     try:
-        success = undrop_collection(collection_id)
+        success = await undrop_collection(collection_id)
         if not success:
             raise HTTPException(status_code=500, detail="Failed to undrop collection")
         return {"success": True, "message": "Collection undropped successfully"}
@@ -0,0 +1,235 @@
+-- Incremental analytics rollups
+-- The analytics overview used to pull every counted order and every order item
+-- and re-add them in Python on each call. These tables hold the running totals
+-- instead - one row per UTC day and one per product name - kept current by
+-- triggers on orders and order_items, so every write path (place_order, the
+-- admin status update, manual edits) is covered without changes in the app.
+--
+-- An order counts towards the rollups unless it is cancelled or refunded
+-- (admin_analytics.EXCLUDED_STATUSES). Moving an order into or out of those
+-- statuses subtracts or re-adds it and its items.
+--
+-- rebuild_analytics_rollups() recomputes both tables from history; it runs at
+-- the end of this migration and can be re-run with rebuild_analytics_rollups.py.
+
+CREATE TABLE IF NOT EXISTS analytics_daily (
+    day DATE PRIMARY KEY,
+    orders INTEGER NOT NULL DEFAULT 0,
+    total_amount BIGINT NOT NULL DEFAULT 0,
+    subtotal_amount BIGINT NOT NULL DEFAULT 0,
+    shipping_amount BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS analytics_product_sales (
+    product_name TEXT PRIMARY KEY,
+    quantity BIGINT NOT NULL DEFAULT 0,
+    revenue BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Recent orders for the dashboard are read straight from orders
+CREATE INDEX IF NOT EXISTS idx_orders_created ON orders(created_at DESC);
+
+ALTER TABLE analytics_daily ENABLE ROW LEVEL SECURITY;
+ALTER TABLE analytics_product_sales ENABLE ROW LEVEL SECURITY;
+
+-- Allow service role to do anything (for admin backend)
+CREATE POLICY "Service role has full access to analytics_daily"
+    ON analytics_daily
+    FOR ALL
+    TO service_role
+    USING (true)
+    WITH CHECK (true);
+
+CREATE POLICY "Service role has full access to analytics_product_sales"
+    ON analytics_product_sales
+    FOR ALL
+    TO service_role
+    USING (true)
+    WITH CHECK (true);
+
+
+-- ============================================
+-- DELTA HELPERS
+-- ============================================
+
+CREATE OR REPLACE FUNCTION analytics_order_counts(p_status TEXT)
+RETURNS BOOLEAN AS $$
+    SELECT p_status IS NOT NULL AND p_status NOT IN ('cancelled', 'refunded');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Add (p_sign = 1) or remove (p_sign = -1) one order from its day
+CREATE OR REPLACE FUNCTION analytics_apply_order(p_order orders, p_sign INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO analytics_daily AS d (day, orders, total_amount, subtotal_amount, shipping_amount)
+    VALUES (
+        (p_order.created_at AT TIME ZONE 'UTC')::DATE,
+        p_sign,
+        p_sign * p_order.total_amount,
+        p_sign * p_order.subtotal_amount,
+        p_sign * COALESCE(p_order.shipping_amount, 0)
+    )
+    ON CONFLICT (day) DO UPDATE SET
+        orders = d.orders + EXCLUDED.orders,
+        total_amount = d.total_amount + EXCLUDED.total_amount,
+        subtotal_amount = d.subtotal_amount + EXCLUDED.subtotal_amount,
+        shipping_amount = d.shipping_amount + EXCLUDED.shipping_amount,
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Add or remove units sold for one product
+CREATE OR REPLACE FUNCTION analytics_apply_item(p_product_name TEXT, p_quantity INTEGER, p_line_total INTEGER, p_sign INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO analytics_product_sales AS s (product_name, quantity, revenue)
+    VALUES (p_product_name, p_sign * p_quantity, p_sign * p_line_total)
+    ON CONFLICT (product_name) DO UPDATE SET
+        quantity = s.quantity + EXCLUDED.quantity,
+        revenue = s.revenue + EXCLUDED.revenue,
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Add or remove every item of an order (status moved into or out of the counted set)
+CREATE OR REPLACE FUNCTION analytics_apply_order_items(p_order_id UUID, p_sign INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO analytics_product_sales AS s (product_name, quantity, revenue)
+    SELECT product_name, p_sign * SUM(quantity), p_sign * SUM(line_total)
+    FROM order_items
+    WHERE order_id = p_order_id
+    GROUP BY product_name
+    ON CONFLICT (product_name) DO UPDATE SET
+        quantity = s.quantity + EXCLUDED.quantity,
+        revenue = s.revenue + EXCLUDED.revenue,
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- ============================================
+-- TRIGGERS
+-- ============================================
+
+CREATE OR REPLACE FUNCTION trigger_analytics_orders()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND analytics_order_counts(OLD.status) THEN
+        PERFORM analytics_apply_order(OLD, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND analytics_order_counts(NEW.status) THEN
+        PERFORM analytics_apply_order(NEW, 1);
+    END IF;
+
+    -- Items follow the order in or out of the counted set
+    IF TG_OP = 'UPDATE' AND analytics_order_counts(OLD.status) <> analytics_order_counts(NEW.status) THEN
+        PERFORM analytics_apply_order_items(NEW.id, CASE WHEN analytics_order_counts(NEW.status) THEN 1 ELSE -1 END);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- A deleted order's items are removed before the cascade deletes them
+CREATE OR REPLACE FUNCTION trigger_analytics_orders_before_delete()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF analytics_order_counts(OLD.status) THEN
+        PERFORM analytics_apply_order_items(OLD.id, -1);
+    END IF;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION trigger_analytics_order_items()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_status TEXT;
+BEGIN
+    -- Items of a deleted order were already removed by the order's BEFORE
+    -- DELETE trigger; the order is gone by the time the cascade runs.
+    SELECT status INTO v_status FROM orders
+    WHERE id = CASE WHEN TG_OP = 'DELETE' THEN OLD.order_id ELSE NEW.order_id END;
+
+    IF analytics_order_counts(v_status) THEN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM analytics_apply_item(OLD.product_name, OLD.quantity, OLD.line_total, -1);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM analytics_apply_item(NEW.product_name, NEW.quantity, NEW.line_total, 1);
+        END IF;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS analytics_orders_rollup ON orders;
+CREATE TRIGGER analytics_orders_rollup
+    AFTER INSERT OR UPDATE OF status, created_at, total_amount, subtotal_amount, shipping_amount OR DELETE ON orders
+    FOR EACH ROW EXECUTE FUNCTION trigger_analytics_orders();
+
+DROP TRIGGER IF EXISTS analytics_orders_rollup_delete ON orders;
+CREATE TRIGGER analytics_orders_rollup_delete
+    BEFORE DELETE ON orders
+    FOR EACH ROW EXECUTE FUNCTION trigger_analytics_orders_before_delete();
+
+DROP TRIGGER IF EXISTS analytics_order_items_rollup ON order_items;
+CREATE TRIGGER analytics_order_items_rollup
+    AFTER INSERT OR UPDATE OF product_name, quantity, line_total OR DELETE ON order_items
+    FOR EACH ROW EXECUTE FUNCTION trigger_analytics_order_items();
+
+
+-- ============================================
+-- REBUILD
+-- ============================================
+
+-- Recompute both rollups from orders and order_items. Order writes wait
+-- until it finishes, so no delta lands between the wipe and the backfill.
+CREATE OR REPLACE FUNCTION rebuild_analytics_rollups()
+RETURNS JSONB AS $$
+DECLARE
+    v_days INTEGER;
+    v_products INTEGER;
+BEGIN
+    LOCK TABLE orders, order_items IN SHARE MODE;
+    LOCK TABLE analytics_daily, analytics_product_sales IN EXCLUSIVE MODE;
+
+    DELETE FROM analytics_daily;
+    DELETE FROM analytics_product_sales;
+
+    INSERT INTO analytics_daily (day, orders, total_amount, subtotal_amount, shipping_amount)
+    SELECT
+        (created_at AT TIME ZONE 'UTC')::DATE,
+        COUNT(*),
+        SUM(total_amount),
+        SUM(subtotal_amount),
+        SUM(COALESCE(shipping_amount, 0))
+    FROM orders
+    WHERE analytics_order_counts(status)
+    GROUP BY 1;
+    GET DIAGNOSTICS v_days = ROW_COUNT;
+
+    INSERT INTO analytics_product_sales (product_name, quantity, revenue)
+    SELECT oi.product_name, SUM(oi.quantity), SUM(oi.line_total)
+    FROM order_items oi
+    JOIN orders o ON o.id = oi.order_id
+    WHERE analytics_order_counts(o.status)
+    GROUP BY oi.product_name;
+    GET DIAGNOSTICS v_products = ROW_COUNT;
+
+    RETURN jsonb_build_object('days', v_days, 'products', v_products);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- The function runs as its owner, so only the backend may call it
+REVOKE EXECUTE ON FUNCTION rebuild_analytics_rollups() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION rebuild_analytics_rollups() TO service_role;
+
+SELECT rebuild_analytics_rollups();
+
+-- Force schema reload
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,122 @@
+-- Per-customer order totals for the admin customer list
+-- The list used to run one orders query per customer on the page to work out
+-- order_count, total_spent and last_order_at. customer_stats holds those
+-- figures, kept current by triggers on customers and orders, and the
+-- customers_with_stats view joins them on so a page is one query - and can be
+-- sorted by total spent or last order date using the indexes below.
+--
+-- Like the old per-row calculation, every order counts regardless of status.
+
+CREATE TABLE IF NOT EXISTS customer_stats (
+    customer_id UUID PRIMARY KEY REFERENCES customers(id) ON DELETE CASCADE,
+    order_count INTEGER NOT NULL DEFAULT 0,
+    total_spent BIGINT NOT NULL DEFAULT 0,
+    last_order_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- NULLS LAST on every index to match the list's order (customers_page_query);
+-- a DESC index defaults to NULLS FIRST, which the planner can't use for it.
+-- Dropped first so databases that ran an earlier version get the new definition.
+DROP INDEX IF EXISTS idx_customer_stats_total_spent;
+DROP INDEX IF EXISTS idx_customers_created;
+CREATE INDEX IF NOT EXISTS idx_customer_stats_total_spent ON customer_stats(total_spent DESC NULLS LAST, customer_id DESC);
+CREATE INDEX IF NOT EXISTS idx_customer_stats_last_order ON customer_stats(last_order_at DESC NULLS LAST, customer_id DESC);
+CREATE INDEX IF NOT EXISTS idx_customers_created ON customers(created_at DESC NULLS LAST, id DESC);
+
+ALTER TABLE customer_stats ENABLE ROW LEVEL SECURITY;
+
+-- Allow service role to do anything (for admin backend)
+CREATE POLICY "Service role has full access to customer_stats"
+    ON customer_stats
+    FOR ALL
+    TO service_role
+    USING (true)
+    WITH CHECK (true);
+
+
+-- ============================================
+-- TRIGGERS
+-- ============================================
+
+-- Every customer gets a stats row, so the view can inner join
+CREATE OR REPLACE FUNCTION trigger_customer_stats_customers()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO customer_stats (customer_id) VALUES (NEW.id)
+    ON CONFLICT (customer_id) DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Orders are added as increments so concurrent orders for one customer don't
+-- overwrite each other; removals re-read the latest remaining order date.
+CREATE OR REPLACE FUNCTION trigger_customer_stats_orders()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE customer_stats SET
+            order_count = order_count - 1,
+            total_spent = total_spent - OLD.total_amount,
+            last_order_at = (SELECT MAX(created_at) FROM orders WHERE customer_id = OLD.customer_id),
+            updated_at = NOW()
+        WHERE customer_id = OLD.customer_id;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO customer_stats AS s (customer_id, order_count, total_spent, last_order_at)
+        VALUES (NEW.customer_id, 1, NEW.total_amount, NEW.created_at)
+        ON CONFLICT (customer_id) DO UPDATE SET
+            order_count = s.order_count + 1,
+            total_spent = s.total_spent + EXCLUDED.total_spent,
+            last_order_at = GREATEST(s.last_order_at, EXCLUDED.last_order_at),
+            updated_at = NOW();
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS customer_stats_on_customer ON customers;
+CREATE TRIGGER customer_stats_on_customer
+    AFTER INSERT ON customers
+    FOR EACH ROW EXECUTE FUNCTION trigger_customer_stats_customers();
+
+DROP TRIGGER IF EXISTS customer_stats_on_order ON orders;
+CREATE TRIGGER customer_stats_on_order
+    AFTER INSERT OR UPDATE OF customer_id, total_amount, created_at OR DELETE ON orders
+    FOR EACH ROW EXECUTE FUNCTION trigger_customer_stats_orders();
+
+
+-- ============================================
+-- VIEW
+-- ============================================
+
+CREATE OR REPLACE VIEW customers_with_stats
+WITH (security_invoker = true) AS
+SELECT
+    c.*,
+    s.order_count,
+    s.total_spent,
+    s.last_order_at
+FROM customers c
+JOIN customer_stats s ON s.customer_id = c.id;
+
+
+-- ============================================
+-- BACKFILL
+-- ============================================
+
+INSERT INTO customer_stats (customer_id, order_count, total_spent, last_order_at)
+SELECT c.id, COUNT(o.id), COALESCE(SUM(o.total_amount), 0), MAX(o.created_at)
+FROM customers c
+LEFT JOIN orders o ON o.customer_id = c.id
+GROUP BY c.id
+ON CONFLICT (customer_id) DO UPDATE SET
+    order_count = EXCLUDED.order_count,
+    total_spent = EXCLUDED.total_spent,
+    last_order_at = EXCLUDED.last_order_at,
+    updated_at = NOW();
+
+-- Force schema reload
+NOTIFY pgrst, 'reload schema';
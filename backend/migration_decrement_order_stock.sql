@@ -0,0 +1,112 @@
+-- Atomic stock decrement for a whole order
+-- Replaces the read / subtract / update / insert loop in database.decrement_stock
+-- (3 round trips per line, and a lost-update race under concurrent webhooks).
+--
+-- Every line is decremented with a `stock_quantity >= quantity` guard in one
+-- UPDATE, the stock_transactions ledger rows are bulk-inserted, and the
+-- before/after values are returned. If any line can't be fulfilled the whole
+-- call raises and nothing is changed.
+--
+-- p_items: [{"product_id": "...", "size": "M", "quantity": 2}, ...]
+-- Returns: [{"product_variant_id", "product_id", "size", "quantity", "stock_before", "stock_after"}, ...]
+
+CREATE OR REPLACE FUNCTION decrement_order_stock(
+    p_order_id UUID,
+    p_items JSONB,
+    p_created_by TEXT DEFAULT 'system'
+)
+RETURNS JSONB AS $$
+DECLARE
+    expected_lines INTEGER;
+    updated_lines INTEGER;
+    missing RECORD;
+    result JSONB;
+BEGIN
+    -- Collapse repeated product/size lines into one requested quantity
+    CREATE TEMP TABLE IF NOT EXISTS _requested_stock (
+        product_id TEXT,
+        size TEXT,
+        quantity INTEGER
+    ) ON COMMIT DROP;
+    TRUNCATE _requested_stock;
+
+    INSERT INTO _requested_stock (product_id, size, quantity)
+    SELECT r.product_id, r.size, SUM(r.quantity)::INTEGER
+    FROM jsonb_to_recordset(p_items) AS r(product_id TEXT, size TEXT, quantity INTEGER)
+    GROUP BY r.product_id, r.size;
+
+    SELECT COUNT(*) INTO expected_lines FROM _requested_stock;
+
+    -- Unknown variants
+    SELECT req.product_id, req.size INTO missing
+    FROM _requested_stock req
+    LEFT JOIN product_variants pv ON pv.product_id = req.product_id AND pv.size = req.size
+    WHERE pv.id IS NULL
+    LIMIT 1;
+
+    IF FOUND THEN
+        RAISE EXCEPTION 'Variant not found: % - %', missing.product_id, missing.size;
+    END IF;
+
+    -- Lock rows in a fixed order so concurrent orders can't deadlock
+    PERFORM 1
+    FROM product_variants pv
+    JOIN _requested_stock req ON pv.product_id = req.product_id AND pv.size = req.size
+    ORDER BY pv.id
+    FOR UPDATE OF pv;
+
+    -- Rows are locked, so this check can't be invalidated before the update
+    SELECT req.product_id, req.size INTO missing
+    FROM _requested_stock req
+    JOIN product_variants pv ON pv.product_id = req.product_id AND pv.size = req.size
+    WHERE pv.stock_quantity < req.quantity
+    LIMIT 1;
+
+    IF FOUND THEN
+        RAISE EXCEPTION 'Insufficient stock for % (Size: %)', missing.product_id, missing.size;
+    END IF;
+
+    WITH updated AS (
+        UPDATE product_variants pv
+        SET stock_quantity = pv.stock_quantity - req.quantity
+        FROM _requested_stock req
+        WHERE pv.product_id = req.product_id
+          AND pv.size = req.size
+          AND pv.stock_quantity >= req.quantity
+        RETURNING
+            pv.id AS product_variant_id,
+            pv.product_id,
+            pv.size,
+            req.quantity,
+            pv.stock_quantity + req.quantity AS stock_before,
+            pv.stock_quantity AS stock_after
+    ),
+    ledger AS (
+        INSERT INTO stock_transactions (
+            product_variant_id, order_id, transaction_type, quantity_change,
+            stock_before, stock_after, created_by, notes
+        )
+        SELECT
+            product_variant_id, p_order_id, 'sale', -quantity,
+            stock_before, stock_after, p_created_by, 'Order ' || p_order_id
+        FROM updated
+    )
+    SELECT COALESCE(jsonb_agg(to_jsonb(updated)), '[]'::JSONB), COUNT(*)
+    INTO result, updated_lines
+    FROM updated;
+
+    -- Guard failed for at least one line - abort so nothing is decremented
+    IF updated_lines < expected_lines THEN
+        RAISE EXCEPTION 'Insufficient stock: % of % lines could be fulfilled', updated_lines, expected_lines;
+    END IF;
+
+    RETURN result;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- The function runs as its owner, so only the backend may call it
+REVOKE EXECUTE ON FUNCTION decrement_order_stock(UUID, JSONB, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION decrement_order_stock(UUID, JSONB, TEXT) TO service_role;
+
+-- Force schema reload
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,10 @@
+-- Indexes for keyset (cursor) pagination of the admin order list
+-- Pages are ordered by (created_at DESC, id DESC) and the next page starts
+-- after the previous page's last row, so each page is an index range scan
+-- instead of an offset scan. Customer list indexes are in
+-- migration_customer_stats.sql.
+
+CREATE INDEX IF NOT EXISTS idx_orders_created_id ON orders(created_at DESC, id DESC);
+
+-- Status-filtered order lists
+CREATE INDEX IF NOT EXISTS idx_orders_status_created_id ON orders(status, created_at DESC, id DESC);
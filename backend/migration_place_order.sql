@@ -0,0 +1,123 @@
+-- Transactional order placement in a single round trip
+-- Replaces the webhook's chain of separate calls (find_or_create_customer,
+-- create_address, generate_order_number, orders insert, one order_items insert
+-- per line, record_discount_code_usage, decrement_stock) with one function call.
+-- Everything runs in one transaction, so a failure part-way (e.g. insufficient
+-- stock) leaves no half-written order behind.
+--
+-- Requires: migration_decrement_order_stock.sql, migration_discount_codes.sql
+--
+-- p_shipping: Stripe shipping object {"name": "...", "address": {"line1": ..., ...}}
+-- p_items:    PaymentIntent metadata items [{"id", "name", "price", "quantity", "size", "image"?}, ...]
+-- Returns:    the order row, plus "already_exists" and "stock_changes"
+
+CREATE OR REPLACE FUNCTION place_order(
+    p_payment_intent_id TEXT,
+    p_customer_email TEXT,
+    p_customer_name TEXT,
+    p_shipping JSONB,
+    p_items JSONB,
+    p_total_amount INTEGER,
+    p_shipping_amount INTEGER DEFAULT 0,
+    p_discount_code_id UUID DEFAULT NULL
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_customer_id UUID;
+    v_address_id UUID;
+    v_order orders%ROWTYPE;
+    v_subtotal INTEGER;
+    v_expected_items INTEGER;
+    v_inserted_items INTEGER;
+    v_stock_changes JSONB;
+BEGIN
+    -- Serialize concurrent deliveries for the same payment
+    PERFORM pg_advisory_xact_lock(hashtext(p_payment_intent_id));
+
+    SELECT * INTO v_order FROM orders WHERE stripe_payment_intent_id = p_payment_intent_id LIMIT 1;
+    IF FOUND THEN
+        RETURN to_jsonb(v_order) || jsonb_build_object('already_exists', true, 'stock_changes', '[]'::JSONB);
+    END IF;
+
+    -- 1. Find or create customer
+    SELECT id INTO v_customer_id FROM customers WHERE email = p_customer_email LIMIT 1;
+    IF NOT FOUND THEN
+        INSERT INTO customers (email, name)
+        VALUES (p_customer_email, p_customer_name)
+        RETURNING id INTO v_customer_id;
+    END IF;
+
+    -- 2. Shipping address
+    INSERT INTO addresses (customer_id, name, line1, line2, city, state, postal_code, country)
+    VALUES (
+        v_customer_id,
+        COALESCE(p_shipping->>'name', ''),
+        COALESCE(p_shipping->'address'->>'line1', ''),
+        p_shipping->'address'->>'line2',
+        COALESCE(p_shipping->'address'->>'city', ''),
+        p_shipping->'address'->>'state',
+        COALESCE(p_shipping->'address'->>'postal_code', ''),
+        COALESCE(p_shipping->'address'->>'country', 'GB')
+    )
+    RETURNING id INTO v_address_id;
+
+    -- 3. Order
+    SELECT COALESCE(SUM(r.price * r.quantity), 0)::INTEGER, COUNT(*)
+    INTO v_subtotal, v_expected_items
+    FROM jsonb_to_recordset(p_items) AS r(price INTEGER, quantity INTEGER);
+
+    INSERT INTO orders (
+        order_number, customer_id, shipping_address_id, status,
+        subtotal_amount, shipping_amount, total_amount, currency,
+        stripe_payment_intent_id, paid_at, discount_code_id
+    )
+    VALUES (
+        generate_order_number(), v_customer_id, v_address_id, 'paid',
+        v_subtotal, p_shipping_amount, p_total_amount, 'gbp',
+        p_payment_intent_id, NOW(), p_discount_code_id
+    )
+    RETURNING * INTO v_order;
+
+    -- 4. Order items, resolving variants in the same statement
+    INSERT INTO order_items (
+        order_id, product_variant_id, product_name, product_size,
+        product_image_url, quantity, unit_price, line_total
+    )
+    SELECT
+        v_order.id, pv.id, r.name, r.size,
+        r.image, r.quantity, r.price, r.price * r.quantity
+    FROM jsonb_to_recordset(p_items) AS r(id TEXT, name TEXT, size TEXT, image TEXT, quantity INTEGER, price INTEGER)
+    JOIN product_variants pv ON pv.product_id = r.id AND pv.size = r.size;
+
+    GET DIAGNOSTICS v_inserted_items = ROW_COUNT;
+    IF v_inserted_items < v_expected_items THEN
+        RAISE EXCEPTION 'Variant not found for % of % order lines', v_expected_items - v_inserted_items, v_expected_items;
+    END IF;
+
+    -- 5. Discount code usage (a repeat use shouldn't fail a paid order)
+    IF p_discount_code_id IS NOT NULL THEN
+        INSERT INTO discount_code_usage (discount_code_id, customer_email, order_id)
+        VALUES (p_discount_code_id, LOWER(p_customer_email), v_order.id)
+        ON CONFLICT (discount_code_id, customer_email) DO NOTHING;
+    END IF;
+
+    -- 6. Stock - raises (rolling everything back) if any line can't be fulfilled
+    v_stock_changes := decrement_order_stock(
+        v_order.id,
+        (
+            SELECT jsonb_agg(jsonb_build_object('product_id', r.id, 'size', r.size, 'quantity', r.quantity))
+            FROM jsonb_to_recordset(p_items) AS r(id TEXT, size TEXT, quantity INTEGER)
+        ),
+        'system'
+    );
+
+    RETURN to_jsonb(v_order) || jsonb_build_object('already_exists', false, 'stock_changes', v_stock_changes);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- The function runs as its owner, so only the backend may call it
+REVOKE EXECUTE ON FUNCTION place_order(TEXT, TEXT, TEXT, JSONB, JSONB, INTEGER, INTEGER, UUID) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION place_order(TEXT, TEXT, TEXT, JSONB, JSONB, INTEGER, INTEGER, UUID) TO service_role;
+
+-- Force schema reload
+NOTIFY pgrst, 'reload schema';
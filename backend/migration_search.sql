@@ -0,0 +1,162 @@
+-- Indexed, ranked search for admin orders and customers
+-- Order search used to be order_number ILIKE '%term%' and customer search
+-- ILIKE on email and name. A leading wildcard can't use the btree indexes, so
+-- both were sequential scans. Trigram (pg_trgm) GIN indexes serve
+-- ILIKE '%term%' for terms of 3+ characters and provide similarity() for
+-- ranking.
+--
+-- search_orders() matches an order by its number, its customer's email or
+-- name, or its shipping postcode (compared without spaces, case-insensitive),
+-- and ranks the matches best first. search_customers() does the same for
+-- customers by email or name (run migration_customer_stats.sql first).
+--
+-- Returns: {"data": [order row + customers{email, name} + addresses{...} + search_rank], "count": total matches}
+--          {"data": [customers_with_stats row + search_rank], "count": total matches}
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_orders_number_trgm ON orders USING GIN (order_number gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_email_trgm ON customers USING GIN (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_name_trgm ON customers USING GIN (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_addresses_postcode_trgm ON addresses USING GIN ((UPPER(REPLACE(postal_code, ' ', ''))) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_orders_shipping_address ON orders(shipping_address_id);
+
+CREATE OR REPLACE FUNCTION search_orders(
+    p_query TEXT,
+    p_status TEXT DEFAULT NULL,
+    p_limit INTEGER DEFAULT 20,
+    p_offset INTEGER DEFAULT 0
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_term TEXT := TRIM(p_query);
+    v_postcode TEXT := UPPER(REPLACE(TRIM(p_query), ' ', ''));
+    v_pattern TEXT;
+    v_postcode_pattern TEXT;
+    v_result JSONB;
+BEGIN
+    -- Escape LIKE wildcards so the term matches literally
+    v_pattern := '%' || REPLACE(REPLACE(REPLACE(v_term, '\', '\\'), '%', '\%'), '_', '\_') || '%';
+    v_postcode_pattern := '%' || REPLACE(REPLACE(REPLACE(v_postcode, '\', '\\'), '%', '\%'), '_', '\_') || '%';
+
+    WITH matches AS (
+        -- Each branch is served by its own trigram index
+        SELECT o.id FROM orders o
+        WHERE o.order_number ILIKE v_pattern
+        UNION
+        SELECT o.id FROM customers c
+        JOIN orders o ON o.customer_id = c.id
+        WHERE c.email ILIKE v_pattern OR c.name ILIKE v_pattern
+        UNION
+        SELECT o.id FROM addresses a
+        JOIN orders o ON o.shipping_address_id = a.id
+        WHERE UPPER(REPLACE(a.postal_code, ' ', '')) LIKE v_postcode_pattern
+    ),
+    ranked AS (
+        SELECT
+            o.*,
+            c.email AS customer_email,
+            c.name AS customer_name,
+            a.name AS address_name,
+            a.line1 AS address_line1,
+            a.city AS address_city,
+            a.postal_code AS address_postal_code,
+            a.country AS address_country,
+            GREATEST(
+                -- Exact order number or email beats any partial match
+                CASE WHEN UPPER(o.order_number) = UPPER(v_term) OR LOWER(c.email) = LOWER(v_term) THEN 2 ELSE 0 END,
+                similarity(o.order_number, v_term),
+                word_similarity(v_term, c.email),
+                word_similarity(v_term, COALESCE(c.name, '')),
+                similarity(UPPER(REPLACE(COALESCE(a.postal_code, ''), ' ', '')), v_postcode)
+            ) AS search_rank
+        FROM matches m
+        JOIN orders o ON o.id = m.id
+        JOIN customers c ON c.id = o.customer_id
+        LEFT JOIN addresses a ON a.id = o.shipping_address_id
+        WHERE p_status IS NULL OR o.status = p_status
+    )
+    SELECT jsonb_build_object(
+        'count', (SELECT COUNT(*) FROM ranked),
+        'data', COALESCE((
+            SELECT jsonb_agg(
+                (to_jsonb(page) - ARRAY[
+                    'customer_email', 'customer_name', 'address_name', 'address_line1',
+                    'address_city', 'address_postal_code', 'address_country'
+                ]) || jsonb_build_object(
+                    'customers', jsonb_build_object('email', page.customer_email, 'name', page.customer_name),
+                    'addresses', CASE WHEN page.shipping_address_id IS NULL THEN NULL ELSE jsonb_build_object(
+                        'name', page.address_name,
+                        'line1', page.address_line1,
+                        'city', page.address_city,
+                        'postal_code', page.address_postal_code,
+                        'country', page.address_country
+                    ) END
+                )
+                ORDER BY page.search_rank DESC, page.created_at DESC, page.id DESC
+            )
+            FROM (
+                SELECT * FROM ranked
+                ORDER BY search_rank DESC, created_at DESC, id DESC
+                LIMIT p_limit OFFSET p_offset
+            ) page
+        ), '[]'::JSONB)
+    )
+    INTO v_result;
+
+    RETURN v_result;
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER;
+
+-- The function runs as its owner, so only the backend may call it
+REVOKE EXECUTE ON FUNCTION search_orders(TEXT, TEXT, INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION search_orders(TEXT, TEXT, INTEGER, INTEGER) TO service_role;
+
+CREATE OR REPLACE FUNCTION search_customers(
+    p_query TEXT,
+    p_limit INTEGER DEFAULT 50,
+    p_offset INTEGER DEFAULT 0
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_term TEXT := TRIM(p_query);
+    v_pattern TEXT;
+    v_result JSONB;
+BEGIN
+    -- Escape LIKE wildcards so the term matches literally
+    v_pattern := '%' || REPLACE(REPLACE(REPLACE(v_term, '\', '\\'), '%', '\%'), '_', '\_') || '%';
+
+    WITH ranked AS (
+        SELECT
+            cs.*,
+            GREATEST(
+                -- Exact email beats any partial match
+                CASE WHEN LOWER(cs.email) = LOWER(v_term) THEN 2 ELSE 0 END,
+                word_similarity(v_term, cs.email),
+                word_similarity(v_term, COALESCE(cs.name, ''))
+            ) AS search_rank
+        FROM customers_with_stats cs
+        WHERE cs.email ILIKE v_pattern OR cs.name ILIKE v_pattern
+    )
+    SELECT jsonb_build_object(
+        'count', (SELECT COUNT(*) FROM ranked),
+        'data', COALESCE((
+            SELECT jsonb_agg(to_jsonb(page) ORDER BY page.search_rank DESC, page.created_at DESC, page.id DESC)
+            FROM (
+                SELECT * FROM ranked
+                ORDER BY search_rank DESC, created_at DESC, id DESC
+                LIMIT p_limit OFFSET p_offset
+            ) page
+        ), '[]'::JSONB)
+    )
+    INTO v_result;
+
+    RETURN v_result;
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER;
+
+REVOKE EXECUTE ON FUNCTION search_customers(TEXT, INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION search_customers(TEXT, INTEGER, INTEGER) TO service_role;
+
+-- Force schema reload
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,84 @@
+"""
+Keyset (cursor) pagination for the admin lists
+Lists are ordered newest / highest first on one sort column with id as the
+tie-breaker. A cursor is the last row's (sort value, id); the next page is
+every row after it in that order, which the index serves directly instead of
+scanning and discarding `offset` rows. Cursors are opaque to clients.
+
+Offset pages (page/limit) still work, and each response carries next_cursor
+so a client can switch to cursors after the first page.
+"""
+import base64
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# PostgREST count modes; "planned" and "estimated" use planner statistics
+# instead of counting every matching row
+COUNT_MODES = ("exact", "planned", "estimated")
+
+
+def count_mode(count: Optional[str]) -> Optional[str]:
+    """Validate a count mode; None or "none" skips the count. Raises ValueError."""
+    if count is None or count == "none":
+        return None
+    if count not in COUNT_MODES:
+        raise ValueError(f"Invalid count: {count}. Must be one of {', '.join(COUNT_MODES)} or none")
+    return count
+
+
+def encode_cursor(sort: str, value: Any, row_id: str) -> str:
+    payload = json.dumps({"s": sort, "v": value, "id": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[Any, str]:
+    """(sort value, id) from a cursor made for the same sort. Raises ValueError."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value, row_id = payload["v"], str(payload["id"])
+        cursor_sort = payload["s"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+    if cursor_sort != sort:
+        raise ValueError(f"Cursor was made for sort {cursor_sort}, not {sort}")
+    return value, row_id
+
+
+def keyset_after(query, column: str, value: Any, row_id: str, nullable: bool = False):
+    """
+    Filter query to the rows after (value, row_id) in
+    `column DESC NULLS LAST, id DESC` order.
+    A plain upper bound on column comes first so the index scan starts at the
+    cursor; the or() only settles ties on id. Pass nullable=True for columns
+    that can be NULL, whose NULL rows follow every dated row.
+    """
+    if value is None:
+        # Already in the trailing NULLs - only lower ids remain
+        return query.or_(f'and({column}.is.null,id.lt."{row_id}")')
+    if not nullable:
+        return query.lte(column, value).or_(f'{column}.lt."{value}",id.lt."{row_id}"')
+    return query.or_(f'{column}.lte."{value}",{column}.is.null').or_(
+        f'{column}.lt."{value}",id.lt."{row_id}",{column}.is.null'
+    )
+
+
+def page_result(rows: List[Dict], limit: int, sort: str, count: Optional[int], offset: Optional[int]) -> Dict:
+    """
+    Response for a page fetched with limit + 1 rows: the extra row only tells
+    whether there is a next page.
+    """
+    data = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit and data:
+        last = data[-1]
+        next_cursor = encode_cursor(sort, last[sort], last["id"])
+
+    return {
+        "data": data,
+        "count": count,
+        "limit": limit,
+        "offset": offset,
+        "next_cursor": next_cursor
+    }
@@ -0,0 +1,54 @@
+"""
+Per-request query graph
+Named async queries that may depend on each other. Each node runs at most
+once per graph no matter how many others need it, independent nodes run
+concurrently, and the wall time of every node is recorded.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+Node = Callable[["QueryGraph"], Awaitable[Any]]
+
+
+class QueryGraph:
+    """
+    A node is an async function taking the graph; it gets its inputs with
+    `await graph.get("other")`. Build one graph per request - results are
+    not shared between graphs.
+    """
+
+    def __init__(self, nodes: Dict[str, Node]):
+        self._nodes = nodes
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._timings: Dict[str, float] = {}
+        self._started = time.perf_counter()
+
+    async def _run(self, name: str) -> Any:
+        started = time.perf_counter()
+        try:
+            return await self._nodes[name](self)
+        finally:
+            self._timings[name] = (time.perf_counter() - started) * 1000
+
+    def get(self, name: str) -> Awaitable[Any]:
+        """Result of a node, starting it on first use. Unknown names raise KeyError."""
+        if name not in self._tasks:
+            if name not in self._nodes:
+                raise KeyError(f"Unknown query: {name}")
+            self._tasks[name] = asyncio.ensure_future(self._run(name))
+        return self._tasks[name]
+
+    async def gather(self, *names: str) -> Dict[str, Any]:
+        """Results of several nodes, run concurrently, keyed by name."""
+        results = await asyncio.gather(*(self.get(name) for name in names))
+        return dict(zip(names, results))
+
+    def timings(self) -> Dict[str, float]:
+        """
+        Milliseconds per node that has finished, plus "total" since the graph
+        was created. A node's time includes waiting on the nodes it depends on.
+        """
+        timings = {name: round(ms, 2) for name, ms in self._timings.items()}
+        timings["total"] = round((time.perf_counter() - self._started) * 1000, 2)
+        return timings
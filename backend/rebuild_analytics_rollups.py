@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Rebuild the analytics rollup tables (analytics_daily, analytics_product_sales)
+from the full order history.
+
+Triggers keep the rollups current as orders are placed and change status; run
+this after applying migration_analytics_rollups.sql to an existing database
+(the migration also backfills once), after bulk edits made with triggers
+disabled, or if the dashboard totals ever drift from the orders table.
+Order writes wait while the rebuild runs.
+
+Uses the direct Postgres connection when DIRECT_DB_ENABLED is set, otherwise
+the rebuild_analytics_rollups RPC through PostgREST.
+
+Usage: python rebuild_analytics_rollups.py
+"""
+import argparse
+import asyncio
+import time
+
+from dotenv import load_dotenv
+
+
+async def rebuild():
+    # Imported after load_dotenv so the clients see the environment
+    from admin_db_async import rebuild_analytics_rollups
+    from direct_db import direct_pool
+    from supabase_async import async_supabase
+
+    try:
+        return await rebuild_analytics_rollups()
+    finally:
+        await async_supabase.aclose()
+        direct_pool.close()
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+
+    load_dotenv()
+    started = time.perf_counter()
+    result = asyncio.run(rebuild())
+    elapsed = time.perf_counter() - started
+
+    print(f"Rebuilt analytics rollups: {result['days']} days, {result['products']} products in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Single-flight request coalescing
+Concurrent identical calls share one in-flight upstream call and its result,
+so a burst of requests costs one Supabase round trip instead of hundreds.
+single_flight wraps blocking functions; async_single_flight wraps coroutine
+functions running on one event loop.
+"""
+import asyncio
+import functools
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    """An in-flight call that waiters block on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution.
+    Callers that arrive while a call is in flight wait for it and receive
+    the same result (or the same exception).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            # Remove before waking waiters so later callers start a fresh call
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "in_flight": len(self._calls),
+            }
+
+
+class _AsyncCall:
+    """An in-flight coroutine call and the number of callers awaiting it."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.callers = 0
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines. The call runs in its own task that every
+    caller awaits through a shield, so a cancelled caller - the first one
+    included - only stops waiting. The task is cancelled once no callers
+    are left waiting for it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _AsyncCall] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        self.calls += 1
+        call = self._calls.get(key)
+        if call is not None:
+            self.coalesced += 1
+        else:
+            call = _AsyncCall(asyncio.ensure_future(fn(*args, **kwargs)))
+            call.task.add_done_callback(functools.partial(self._finished, key, call))
+            self._calls[key] = call
+            self.executions += 1
+
+        call.callers += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.callers -= 1
+            if call.callers == 0 and not call.task.done():
+                # Nobody is waiting any more - don't keep the upstream call running
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: _AsyncCall) -> None:
+        # Only remove our own entry - a fresh call may already hold the key
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def _finished(self, key: Hashable, call: _AsyncCall, task: asyncio.Task) -> None:
+        self._forget(key, call)
+        # Retrieve the exception so a call nobody awaited doesn't log a warning
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def stats(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "in_flight": len(self._calls),
+        }
+
+
+_groups: Dict[str, Any] = {}
+
+
+def single_flight(func: Callable) -> Callable:
+    """
+    Decorator: coalesce concurrent calls to func that have identical arguments.
+    Arguments must be hashable.
+    """
+    group = SingleFlight(func.__qualname__)
+    _groups[group.name] = group
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        return group.do(key, func, *args, **kwargs)
+
+    wrapper.single_flight = group
+    return wrapper
+
+
+def async_single_flight(func: Callable) -> Callable:
+    """
+    Decorator: coalesce concurrent awaits of coroutine function func that
+    have identical arguments. Arguments must be hashable.
+    """
+    group = AsyncSingleFlight(f"{func.__module__}.{func.__qualname__}")
+    _groups[group.name] = group
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        return await group.do(key, func, *args, **kwargs)
+
+    wrapper.single_flight = group
+    return wrapper
+
+
+def get_single_flight_stats() -> Dict[str, Dict]:
+    """
+    Coalescing counters for every decorated function.
+    """
+    return {name: group.stats() for name, group in _groups.items()}
@@ -0,0 +1,91 @@
+"""
+In-process pub/sub for live stock events (feeds the /api/merch/stream SSE endpoint)
+Each subscriber gets a bounded queue; subscribers that fall behind are dropped
+rather than letting one slow client hold memory or stall publishers.
+"""
+import asyncio
+import os
+import threading
+from typing import Dict, Optional, Set
+
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "100"))
+SSE_MAX_SUBSCRIBERS = int(os.getenv("SSE_MAX_SUBSCRIBERS", "500"))
+
+
+class Subscriber:
+    """A single stream client."""
+
+    def __init__(self, max_queue: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = False
+
+
+class StockBroadcaster:
+    """
+    Fans stock events out to every subscriber's queue.
+    publish() is safe to call from any thread; delivery happens on the event loop.
+    """
+
+    def __init__(self, max_queue: int = SSE_QUEUE_SIZE, max_subscribers: int = SSE_MAX_SUBSCRIBERS):
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self._subscribers: Set[Subscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self) -> Optional[Subscriber]:
+        """
+        Register a subscriber. Must be called on the event loop.
+        Returns None if the subscriber limit has been reached.
+        """
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            self._loop = asyncio.get_running_loop()
+            subscriber = Subscriber(self.max_queue)
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event: Dict) -> None:
+        """
+        Queue an event for every subscriber.
+        """
+        loop = self._loop
+        if loop is None or not self._subscribers or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._fanout, event)
+
+    def _fanout(self, event: Dict) -> None:
+        # Runs on the event loop
+        self.published += 1
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow consumer - drop it; the client reconnects and gets a fresh snapshot
+                self.unsubscribe(subscriber)
+                subscriber.dropped = True
+                self.dropped += 1
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.queue.put_nowait(None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "published": self.published,
+                "dropped": self.dropped,
+            }
+
+
+stock_broadcaster = StockBroadcaster()
@@ -0,0 +1,125 @@
+"""
+Stock change feed for merch page polling and streaming
+Tracks the latest stock level of every variant that has changed, tagged with
+a monotonically increasing version, so clients can fetch only what changed.
+Each change is also published to the live stock broadcaster.
+"""
+import threading
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from stock_broadcast import stock_broadcaster
+
+# Versions are only meaningful within one process - tokens carry the instance
+# so a client polling a different worker/restart gets a full snapshot instead
+FEED_INSTANCE_ID = uuid.uuid4().hex[:8]
+
+_lock = threading.Lock()
+_version = 0
+
+# variant_id -> (version it last changed at, stock)
+_changes: Dict[str, Tuple[int, int]] = {}
+
+# variant_id -> last stock level we know of (changes or catalog refreshes)
+_known_stock: Dict[str, int] = {}
+
+
+def _token(version: int) -> str:
+    return f"{FEED_INSTANCE_ID}.{version}"
+
+
+def parse_stock_version(token: Optional[str]) -> Optional[int]:
+    """
+    Return the version number from a token issued by this process, else None.
+    """
+    if not token:
+        return None
+    instance, _, number = token.partition(".")
+    if instance != FEED_INSTANCE_ID or not number.isdigit():
+        return None
+    return int(number)
+
+
+def _record(variant_id: str, stock: int) -> List:
+    # Caller holds _lock
+    global _version
+    _version += 1
+    _changes[variant_id] = (_version, stock)
+    _known_stock[variant_id] = stock
+    return [variant_id, stock, stock > 0]
+
+
+def _publish(rows: List[List], version: int) -> None:
+    # Called after releasing _lock, with the version captured while holding it
+    if rows:
+        stock_broadcaster.publish({"version": _token(version), "changes": rows})
+
+
+def record_stock_change(variant_id: str, stock: int) -> None:
+    """
+    Record a variant's new stock level. Called from the stock write paths.
+    """
+    variant_id = str(variant_id)
+    rows = []
+    with _lock:
+        if _known_stock.get(variant_id) != stock:
+            rows.append(_record(variant_id, stock))
+        version = _version
+    _publish(rows, version)
+
+
+def sync_from_catalog(catalog: List[Dict]) -> None:
+    """
+    Pick up stock changes seen in a freshly loaded catalog that weren't written
+    through this process (other workers, edits made directly in Supabase).
+    """
+    rows = []
+    with _lock:
+        for product in catalog:
+            for size in product.get("sizes", []):
+                variant_id = size["variant_id"]
+                stock = size["stock"]
+                if variant_id not in _known_stock:
+                    # First sighting - baseline, not a change
+                    _known_stock[variant_id] = stock
+                elif _known_stock[variant_id] != stock:
+                    rows.append(_record(variant_id, stock))
+        version = _version
+    _publish(rows, version)
+
+
+def get_stock_version() -> str:
+    """
+    Current feed version token.
+    """
+    return _token(_version)
+
+
+def get_stock_changes(since: Optional[str], catalog: List[Dict]) -> Dict:
+    """
+    Return stock changes after the `since` token as compact
+    [variant_id, stock, available] rows.
+    If `since` is missing or wasn't issued by this process, returns every
+    variant in the catalog (with recorded changes applied) and full=True.
+    """
+    with _lock:
+        since_version = parse_stock_version(since)
+        current = _version
+
+        if since_version is not None and since_version <= current:
+            rows = [
+                [variant_id, stock, stock > 0]
+                for variant_id, (version, stock) in _changes.items()
+                if version > since_version
+            ]
+            return {"version": _token(current), "full": False, "changes": rows}
+
+        # Full snapshot - the catalog may predate recent writes, so overlay them
+        rows = []
+        for product in catalog:
+            for size in product.get("sizes", []):
+                variant_id = size["variant_id"]
+                stock = _changes[variant_id][1] if variant_id in _changes else size["stock"]
+                rows.append([variant_id, stock, stock > 0])
+
+        return {"version": _token(current), "full": True, "changes": rows}
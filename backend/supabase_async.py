@@ -0,0 +1,303 @@
+"""
+Async Supabase client
+A small PostgREST and Storage client on one pooled httpx.AsyncClient, so async
+routes can await queries - and fan them out with asyncio.gather - without
+holding a thread per call. Connections are kept alive between requests and
+multiplexed over HTTP/2.
+
+The query builder mirrors the subset of supabase-py used in this codebase:
+
+    response = await async_supabase.table("orders")\\
+        .select("*", count="exact")\\
+        .eq("status", "paid")\\
+        .range(0, 19)\\
+        .execute()
+    response.data, response.count
+"""
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from supabase_client import SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
+
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "true").lower() == "true"
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "10"))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+
+# Values containing these must be double-quoted inside PostgREST in.(...) lists
+_RESERVED = set(',()":\\ ')
+
+
+class PostgrestError(Exception):
+    """Error response from PostgREST (or Storage)."""
+
+    def __init__(self, status_code: int, body: Any):
+        body = body if isinstance(body, dict) else {"message": str(body)}
+        self.status_code = status_code
+        self.code = body.get("code") or body.get("error")
+        self.message = body.get("message") or body.get("msg") or f"HTTP {status_code}"
+        self.details = body.get("details")
+        self.hint = body.get("hint")
+        super().__init__(f"{self.message} (code={self.code}, status={status_code})")
+
+    @classmethod
+    def from_response(cls, response: httpx.Response) -> "PostgrestError":
+        try:
+            body = response.json()
+        except ValueError:
+            body = response.text
+        return cls(response.status_code, body)
+
+
+class QueryResponse:
+    """Result of execute(): .data and, when requested, .count"""
+
+    __slots__ = ("data", "count")
+
+    def __init__(self, data: Any, count: Optional[int]):
+        self.data = data
+        self.count = count
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if value is None:
+        return "null"
+    return str(value)
+
+
+def _quote(value: Any) -> str:
+    text = _format_value(value)
+    if any(char in _RESERVED for char in text):
+        return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return text
+
+
+def _parse_count(content_range: Optional[str]) -> Optional[int]:
+    # "0-24/3573" or "*/0"; the total is "*" when no count was requested
+    if not content_range or "/" not in content_range:
+        return None
+    total = content_range.rsplit("/", 1)[1]
+    return int(total) if total.isdigit() else None
+
+
+class QueryBuilder:
+    """
+    One PostgREST request. Filters are query parameters; nothing is sent
+    until execute() is awaited.
+    """
+
+    def __init__(self, client: "AsyncSupabase", path: str, method: str = "GET", json: Any = None):
+        self._client = client
+        self._path = path
+        self._method = method
+        self._json = json
+        self._params: List[Tuple[str, str]] = []
+        self._headers: Dict[str, str] = {}
+        self._prefer: List[str] = []
+        self._negate = False
+
+    # ----- verbs -----
+
+    def select(self, columns: str = "*", count: Optional[str] = None, head: bool = False) -> "QueryBuilder":
+        # Embedded selects are written over several lines - whitespace isn't significant
+        self._params.append(("select", "".join(columns.split())))
+        if count:
+            self._prefer.append(f"count={count}")
+        if head:
+            self._method = "HEAD"
+        return self
+
+    def insert(self, payload: Any) -> "QueryBuilder":
+        self._method = "POST"
+        self._json = payload
+        self._prefer.append("return=representation")
+        return self
+
+    def update(self, payload: Dict) -> "QueryBuilder":
+        self._method = "PATCH"
+        self._json = payload
+        self._prefer.append("return=representation")
+        return self
+
+    def delete(self) -> "QueryBuilder":
+        self._method = "DELETE"
+        self._prefer.append("return=representation")
+        return self
+
+    # ----- filters -----
+
+    @property
+    def not_(self) -> "QueryBuilder":
+        """Negate the next filter: .not_.in_("status", [...])"""
+        self._negate = True
+        return self
+
+    def _filter(self, column: str, operator: str, value: str) -> "QueryBuilder":
+        if self._negate:
+            operator = f"not.{operator}"
+            self._negate = False
+        self._params.append((column, f"{operator}.{value}"))
+        return self
+
+    def eq(self, column: str, value: Any) -> "QueryBuilder":
+        return self._filter(column, "eq", _format_value(value))
+
+    def neq(self, column: str, value: Any) -> "QueryBuilder":
+        return self._filter(column, "neq", _format_value(value))
+
+    def gt(self, column: str, value: Any) -> "QueryBuilder":
+        return self._filter(column, "gt", _format_value(value))
+
+    def gte(self, column: str, value: Any) -> "QueryBuilder":
+        return self._filter(column, "gte", _format_value(value))
+
+    def lt(self, column: str, value: Any) -> "QueryBuilder":
+        return self._filter(column, "lt", _format_value(value))
+
+    def lte(self, column: str, value: Any) -> "QueryBuilder":
+        return self._filter(column, "lte", _format_value(value))
+
+    def ilike(self, column: str, pattern: str) -> "QueryBuilder":
+        return self._filter(column, "ilike", pattern)
+
+    def in_(self, column: str, values: List[Any]) -> "QueryBuilder":
+        return self._filter(column, "in", f"({','.join(_quote(value) for value in values)})")
+
+    def or_(self, filters: str) -> "QueryBuilder":
+        self._params.append(("or", f"({filters})"))
+        return self
+
+    # ----- modifiers -----
+
+    def order(self, column: str, desc: bool = False, nullsfirst: Optional[bool] = None) -> "QueryBuilder":
+        """Same options as supabase-py; nullsfirst=False sorts NULLs last."""
+        term = f"{column}.{'desc' if desc else 'asc'}"
+        if nullsfirst is not None:
+            term += ".nullsfirst" if nullsfirst else ".nullslast"
+        for index, (key, value) in enumerate(self._params):
+            if key == "order":
+                self._params[index] = ("order", f"{value},{term}")
+                return self
+        self._params.append(("order", term))
+        return self
+
+    def limit(self, count: int) -> "QueryBuilder":
+        self._params.append(("limit", str(count)))
+        return self
+
+    def range(self, start: int, end: int) -> "QueryBuilder":
+        """Rows start..end inclusive, like supabase-py."""
+        self._params.append(("offset", str(start)))
+        self._params.append(("limit", str(end - start + 1)))
+        return self
+
+    def single(self) -> "QueryBuilder":
+        """Return one object instead of a list; errors unless exactly one row matches."""
+        self._headers["Accept"] = "application/vnd.pgrst.object+json"
+        return self
+
+    async def execute(self) -> QueryResponse:
+        headers = dict(self._headers)
+        if self._prefer:
+            headers["Prefer"] = ",".join(self._prefer)
+
+        response = await self._client.http().request(
+            self._method,
+            self._path,
+            params=self._params,
+            headers=headers,
+            json=self._json
+        )
+        if response.status_code >= 400:
+            raise PostgrestError.from_response(response)
+
+        data = response.json() if self._method != "HEAD" and response.content else None
+        return QueryResponse(data, _parse_count(response.headers.get("content-range")))
+
+
+class AsyncSupabase:
+    """
+    Service-role client for PostgREST (/rest/v1) and Storage (/storage/v1).
+    The underlying httpx.AsyncClient is created on first use, so it belongs
+    to the event loop the app runs on. Call aclose() at shutdown.
+    """
+
+    def __init__(self, url: str, key: str):
+        self.url = url.rstrip("/")
+        self._key = key
+        self._http: Optional[httpx.AsyncClient] = None
+
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            if not self.url or not self._key:
+                raise ValueError("Supabase credentials not configured. Check SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY in .env")
+
+            self._http = httpx.AsyncClient(
+                base_url=self.url,
+                headers={
+                    "apikey": self._key,
+                    "Authorization": f"Bearer {self._key}",
+                },
+                http2=SUPABASE_HTTP2,
+                limits=httpx.Limits(
+                    max_connections=SUPABASE_MAX_CONNECTIONS,
+                    max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+                    keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY
+                ),
+                timeout=SUPABASE_TIMEOUT
+            )
+        return self._http
+
+    def table(self, name: str) -> QueryBuilder:
+        return QueryBuilder(self, f"/rest/v1/{name}")
+
+    def rpc(self, function: str, params: Optional[Dict] = None) -> QueryBuilder:
+        return QueryBuilder(self, f"/rest/v1/rpc/{function}", method="POST", json=params or {})
+
+    # ----- storage -----
+
+    async def storage_upload(self, bucket: str, path: str, content: bytes, content_type: str) -> Dict:
+        response = await self.http().post(
+            f"/storage/v1/object/{bucket}/{path}",
+            content=content,
+            headers={"Content-Type": content_type, "x-upsert": "false"}
+        )
+        if response.status_code >= 400:
+            raise PostgrestError.from_response(response)
+        return response.json()
+
+    async def storage_remove(self, bucket: str, paths: List[str]) -> List[Dict]:
+        response = await self.http().request(
+            "DELETE",
+            f"/storage/v1/object/{bucket}",
+            json={"prefixes": paths}
+        )
+        if response.status_code >= 400:
+            raise PostgrestError.from_response(response)
+        return response.json()
+
+    def storage_public_url(self, bucket: str, path: str) -> str:
+        return f"{self.url}/storage/v1/object/public/{bucket}/{path}"
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def stats(self) -> Dict:
+        return {
+            "open": self._http is not None,
+            "http2": SUPABASE_HTTP2,
+            "max_connections": SUPABASE_MAX_CONNECTIONS,
+            "max_keepalive_connections": SUPABASE_MAX_KEEPALIVE,
+            "keepalive_expiry": SUPABASE_KEEPALIVE_EXPIRY,
+        }
+
+
+# Singleton instance
+async_supabase = AsyncSupabase(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
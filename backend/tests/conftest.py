@@ -0,0 +1,15 @@
+"""
+Test setup: dummy credentials so main.py imports without a .env, and the
+backend directory on sys.path. Nothing here talks to Supabase or Stripe -
+tests stub the database calls they exercise.
+"""
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "test-service-role-key")
+os.environ.setdefault("STRIPE_SECRET_KEY", "sk_test_dummy")
+os.environ.setdefault("WEBHOOK_QUEUE_PATH", os.path.join(tempfile.mkdtemp(), "webhook_queue.db"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
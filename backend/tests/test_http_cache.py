@@ -0,0 +1,83 @@
+"""
+Conditional GET and Accept-Encoding negotiation for the public read endpoints.
+"""
+import gzip
+
+from starlette.requests import Request
+
+from http_cache import (
+    CACHE_CONTROL_STATIC,
+    StaticPayload,
+    compute_etag,
+    conditional_json_response,
+    etag_matches,
+    negotiate_encoding,
+    parse_accept_encoding,
+    serialize_json,
+    static_response,
+)
+
+CONTENT = {"bands": [{"name": "Plagued", "bio": "x" * 500}]}
+
+
+def make_request(**headers) -> Request:
+    raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+def test_etag_matching_is_weak_and_handles_lists():
+    etag = compute_etag(serialize_json(CONTENT))
+
+    assert etag_matches(make_request(if_none_match=etag), etag)
+    assert etag_matches(make_request(if_none_match=f'"other", W/{etag}'), etag)
+    assert etag_matches(make_request(if_none_match="*"), etag)
+    assert not etag_matches(make_request(if_none_match='"other"'), etag)
+    assert not etag_matches(make_request(), etag)
+
+
+def test_conditional_json_response():
+    etag = compute_etag(serialize_json(CONTENT))
+
+    fresh = conditional_json_response(make_request(), CONTENT, etag, CACHE_CONTROL_STATIC)
+    cached = conditional_json_response(make_request(if_none_match=etag), CONTENT, etag, CACHE_CONTROL_STATIC)
+
+    assert fresh.status_code == 200
+    assert fresh.headers["etag"] == etag
+    assert cached.status_code == 304
+    assert cached.body == b""
+    assert cached.headers["cache-control"] == CACHE_CONTROL_STATIC
+
+
+def test_parse_accept_encoding_qvalues():
+    assert parse_accept_encoding("gzip;q=0.5, br , identity;q=bad") == {"gzip": 0.5, "br": 1.0, "identity": 0.0}
+    assert parse_accept_encoding(None) == {}
+
+
+def test_negotiation_prefers_brotli_and_respects_q_zero():
+    payload = StaticPayload(CONTENT)
+
+    assert negotiate_encoding(make_request(accept_encoding="gzip, br"), payload) == "br"
+    assert negotiate_encoding(make_request(accept_encoding="br;q=0, gzip"), payload) == "gzip"
+    assert negotiate_encoding(make_request(accept_encoding="*"), payload) == "br"
+    assert negotiate_encoding(make_request(accept_encoding="*, br;q=0, gzip;q=0"), payload) is None
+    assert negotiate_encoding(make_request(), payload) is None
+
+
+def test_static_response_encodes_and_revalidates_any_representation():
+    payload = StaticPayload(CONTENT)
+
+    response = static_response(make_request(accept_encoding="gzip"), payload, CACHE_CONTROL_STATIC)
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert gzip.decompress(response.body) == payload.body
+
+    # A validator for the identity body still matches when asking for gzip
+    revalidated = static_response(
+        make_request(accept_encoding="gzip", if_none_match=payload.etag), payload, CACHE_CONTROL_STATIC
+    )
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == response.headers["etag"]
+
+    identity = static_response(make_request(), payload, CACHE_CONTROL_STATIC)
+    assert "content-encoding" not in identity.headers
+    assert identity.body == payload.body
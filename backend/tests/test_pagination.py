@@ -0,0 +1,83 @@
+"""
+Cursor encoding and the keyset filters built from cursors.
+Filters are checked as the PostgREST params the async client would send.
+"""
+import base64
+import json
+
+import pytest
+
+from pagination import count_mode, decode_cursor, encode_cursor, keyset_after, page_result
+from supabase_async import async_supabase
+
+ROW_ID = "22222222-2222-2222-2222-222222222222"
+
+
+def params(query):
+    return query._params[1:]  # drop select
+
+
+def keyset(column, value, nullable=False):
+    return params(keyset_after(async_supabase.table("t").select("*"), column, value, ROW_ID, nullable))
+
+
+def test_cursor_round_trip():
+    for value in ("2024-05-01T12:00:00+00:00", 1500, None):
+        cursor = encode_cursor("total_spent", value, ROW_ID)
+        assert "=" not in cursor
+        assert decode_cursor(cursor, "total_spent") == (value, ROW_ID)
+
+
+def test_cursor_for_another_sort_is_rejected():
+    cursor = encode_cursor("created_at", "2024-05-01", ROW_ID)
+    with pytest.raises(ValueError, match="made for sort created_at"):
+        decode_cursor(cursor, "total_spent")
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-a-cursor!",
+    base64.urlsafe_b64encode(b"[1, 2]").decode(),
+    base64.urlsafe_b64encode(json.dumps({"s": "created_at", "v": 1}).encode()).decode(),
+    encode_cursor("created_at", "2024-05-01", ROW_ID)[:-3],
+])
+def test_tampered_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, "created_at")
+
+
+def test_keyset_bounds_not_null_column():
+    assert keyset("created_at", "2024-05-01") == [
+        ("created_at", "lte.2024-05-01"),
+        ("or", f'(created_at.lt."2024-05-01",id.lt."{ROW_ID}")'),
+    ]
+
+
+def test_keyset_keeps_trailing_nulls_for_nullable_column():
+    assert keyset("last_order_at", "2024-05-01", nullable=True) == [
+        ("or", "(last_order_at.lte.\"2024-05-01\",last_order_at.is.null)"),
+        ("or", f'(last_order_at.lt."2024-05-01",id.lt."{ROW_ID}",last_order_at.is.null)'),
+    ]
+
+
+def test_keyset_inside_trailing_nulls():
+    assert keyset("last_order_at", None, nullable=True) == [
+        ("or", f'(and(last_order_at.is.null,id.lt."{ROW_ID}"))'),
+    ]
+
+
+def test_page_result_cursor_points_at_last_row():
+    rows = [{"id": "c", "last_order_at": "2024-05-02"}, {"id": "b", "last_order_at": None}, {"id": "a", "last_order_at": None}]
+
+    page = page_result(rows, 2, "last_order_at", 3, 0)
+
+    assert [row["id"] for row in page["data"]] == ["c", "b"]
+    assert decode_cursor(page["next_cursor"], "last_order_at") == (None, "b")
+    assert page_result(rows, 3, "last_order_at", 3, 0)["next_cursor"] is None
+
+
+def test_count_mode():
+    assert count_mode(None) is None
+    assert count_mode("none") is None
+    assert count_mode("planned") == "planned"
+    with pytest.raises(ValueError):
+        count_mode("approximate")
@@ -0,0 +1,80 @@
+"""
+process_stripe_event runs on a webhook worker thread and must call the sync
+database functions. These tests stub those calls and run the event through.
+"""
+import json
+
+import pytest
+
+import database
+import main
+
+DISCOUNT_ID = "11111111-1111-1111-1111-111111111111"
+ITEMS = [{"id": "tee-black", "name": "Tee", "price": 2500, "quantity": 1, "size": "M"}]
+
+
+def payment_event(discount=False):
+    metadata = {"items": json.dumps(ITEMS), "shipping_cost": "399"}
+    if discount:
+        metadata.update({"discount_code_id": DISCOUNT_ID, "discount_code": "SAVE10"})
+    return {
+        "id": "evt_test",
+        "type": "payment_intent.succeeded",
+        "data": {"object": {
+            "id": "pi_test",
+            "amount": 2899,
+            "receipt_email": "buyer@example.com",
+            "metadata": metadata,
+            "shipping": {"name": "Buyer", "address": {"line1": "1 High St", "postal_code": "AB1 2CD"}},
+        }},
+    }
+
+
+@pytest.fixture
+def placed(monkeypatch):
+    """Stub the database and email calls; returns the recorded place_order calls."""
+    calls = []
+
+    def place_order(**kwargs):
+        calls.append(kwargs)
+        return {"id": "order-1", "order_number": "ORD-1", "already_exists": False}
+
+    monkeypatch.setattr(database, "validate_discount_code", lambda code, email: {"id": DISCOUNT_ID})
+    monkeypatch.setattr(main, "place_order", place_order)
+    monkeypatch.setattr(main, "queue_order_emails", lambda **kwargs: None)
+    monkeypatch.setattr(main.resend, "api_key", "re_test")
+    return calls
+
+
+def test_payment_succeeded_places_order(placed):
+    result = main.process_stripe_event(payment_event(discount=True))
+
+    assert result == {"status": "success"}
+    assert len(placed) == 1
+    assert placed[0]["stripe_payment_intent_id"] == "pi_test"
+    assert placed[0]["items"] == ITEMS
+    assert placed[0]["shipping_amount"] == 399
+    assert str(placed[0]["discount_code_id"]) == DISCOUNT_ID
+
+
+def test_used_discount_code_is_not_applied(placed, monkeypatch):
+    monkeypatch.setattr(database, "validate_discount_code", lambda code, email: None)
+
+    main.process_stripe_event(payment_event(discount=True))
+
+    assert placed[0]["discount_code_id"] is None
+
+
+def test_retry_requeues_emails_for_existing_order(placed, monkeypatch):
+    """A retry after place_order succeeded must reach already_exists even though stock is now gone."""
+    queued = []
+    monkeypatch.setattr(database, "check_stock_availability", lambda items: (False, "Out of stock"))
+    monkeypatch.setattr(main, "place_order", lambda **kwargs: {
+        "id": "order-1", "order_number": "ORD-1", "already_exists": True, "confirmation_email_sent": False
+    })
+    monkeypatch.setattr(main, "queue_order_emails", lambda **kwargs: queued.append(kwargs))
+
+    result = main.process_stripe_event(payment_event())
+
+    assert result == {"status": "success"}
+    assert [email["order_number"] for email in queued] == ["ORD-1"]
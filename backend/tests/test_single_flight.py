@@ -0,0 +1,121 @@
+"""
+Single-flight coalescing: one execution per burst, shared errors, and
+cancellation that only affects the caller that was cancelled.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from single_flight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    group = SingleFlight("test")
+    release = threading.Event()
+    runs = []
+
+    def load(key):
+        runs.append(key)
+        release.wait(5)
+        return {"key": key}
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        futures = [pool.submit(group.do, "k", load, "k") for _ in range(5)]
+        while group.stats()["coalesced"] < 4:
+            time.sleep(0.001)
+        release.set()
+        results = [future.result(5) for future in futures]
+
+    assert runs == ["k"]
+    assert all(result is results[0] for result in results)
+    assert group.stats() == {"calls": 5, "executions": 1, "coalesced": 4, "errors": 0, "in_flight": 0}
+
+
+def test_error_reaches_every_waiter_and_next_call_starts_fresh():
+    group = SingleFlight("test")
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(group.do, "k", fail) for _ in range(3)]
+        while group.stats()["coalesced"] < 2:
+            time.sleep(0.001)
+        release.set()
+        for future in futures:
+            with pytest.raises(RuntimeError, match="upstream down"):
+                future.result(5)
+
+    assert group.do("k", lambda: "ok") == "ok"
+    assert group.stats()["errors"] == 1
+
+
+def test_async_calls_share_one_execution_and_errors():
+    group = AsyncSingleFlight("test")
+    runs = []
+
+    async def load(fail):
+        runs.append(fail)
+        await asyncio.sleep(0.01)
+        if fail:
+            raise RuntimeError("upstream down")
+        return object()
+
+    async def main():
+        results = await asyncio.gather(*(group.do("ok", load, False) for _ in range(3)))
+        errors = await asyncio.gather(*(group.do("bad", load, True) for _ in range(3)), return_exceptions=True)
+        return results, errors
+
+    results, errors = asyncio.run(main())
+
+    assert runs == [False, True]
+    assert results[0] is results[1] is results[2]
+    assert all(isinstance(error, RuntimeError) for error in errors)
+    assert group.stats() == {"calls": 6, "executions": 2, "coalesced": 4, "errors": 1, "in_flight": 0}
+
+
+def test_cancelled_first_caller_does_not_cancel_waiters():
+    group = AsyncSingleFlight("test")
+
+    async def load():
+        await asyncio.sleep(0.01)
+        return "loaded"
+
+    async def main():
+        first = asyncio.create_task(group.do("k", load))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(group.do("k", load))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(main()) == ("loaded", True)
+    assert group.stats()["executions"] == 1
+
+
+def test_call_is_cancelled_once_no_callers_remain():
+    group = AsyncSingleFlight("test")
+    cancelled = []
+
+    async def load():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        caller = asyncio.create_task(group.do("k", load))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+
+    assert cancelled == [True]
+    assert group.stats()["in_flight"] == 0
@@ -0,0 +1,60 @@
+"""
+Stock change feed: version tokens, incremental changes and full snapshots.
+"""
+import pytest
+
+import stock_feed
+
+CATALOG = [{"sizes": [{"variant_id": "v-s", "stock": 5}, {"variant_id": "v-m", "stock": 0}]}]
+
+
+@pytest.fixture(autouse=True)
+def feed(monkeypatch):
+    """A fresh, empty feed; returns the events published to the broadcaster."""
+    published = []
+    monkeypatch.setattr(stock_feed, "_version", 0)
+    monkeypatch.setattr(stock_feed, "_changes", {})
+    monkeypatch.setattr(stock_feed, "_known_stock", {})
+    monkeypatch.setattr(stock_feed.stock_broadcaster, "publish", published.append)
+    return published
+
+
+def test_version_token_is_tied_to_this_process():
+    token = stock_feed.get_stock_version()
+
+    assert stock_feed.parse_stock_version(token) == 0
+    assert stock_feed.parse_stock_version(f"other.{token.partition('.')[2]}") is None
+    assert stock_feed.parse_stock_version(f"{stock_feed.FEED_INSTANCE_ID}.-1") is None
+    assert stock_feed.parse_stock_version(None) is None
+
+
+def test_changes_since_a_token(feed):
+    stock_feed.sync_from_catalog(CATALOG)
+    since = stock_feed.get_stock_version()
+
+    stock_feed.record_stock_change("v-s", 4)
+    stock_feed.record_stock_change("v-s", 4)  # unchanged - not a new version
+
+    result = stock_feed.get_stock_changes(since, CATALOG)
+    assert result["full"] is False
+    assert result["changes"] == [["v-s", 4, True]]
+    assert stock_feed.parse_stock_version(result["version"]) == 1
+    assert feed == [{"version": result["version"], "changes": [["v-s", 4, True]]}]
+
+
+def test_catalog_refresh_picks_up_outside_changes(feed):
+    stock_feed.sync_from_catalog(CATALOG)
+    assert feed == []  # first sighting is a baseline
+
+    stock_feed.sync_from_catalog([{"sizes": [{"variant_id": "v-s", "stock": 5}, {"variant_id": "v-m", "stock": 3}]}])
+
+    assert feed[0]["changes"] == [["v-m", 3, True]]
+
+
+def test_unknown_token_gets_full_snapshot_with_changes_applied():
+    stock_feed.record_stock_change("v-m", 2)
+
+    result = stock_feed.get_stock_changes("someone-else.7", CATALOG)
+
+    assert result["full"] is True
+    assert result["changes"] == [["v-s", 5, True], ["v-m", 2, True]]
@@ -0,0 +1,101 @@
+"""
+Webhook queue leases, retries and event-ID deduplication, on a throwaway
+SQLite database per test.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+import webhook_queue
+from event_dedup import EventDeduplicator
+from webhook_queue import WebhookQueue
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(webhook_queue, "time", SimpleNamespace(time=clock))
+    monkeypatch.setattr(webhook_queue, "random", SimpleNamespace(uniform=lambda low, high: 1.0))
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return WebhookQueue(str(tmp_path / "queue.db"), max_attempts=3, lease_seconds=60)
+
+
+def test_duplicate_event_is_not_queued_twice(queue):
+    assert queue.enqueue("evt_1", "payment_intent.succeeded", "{}") is True
+    assert queue.enqueue("evt_1", "payment_intent.succeeded", "{}") is False
+    assert queue.stats()["pending"] == 1
+
+
+def test_event_id_outlives_the_pruned_event(queue, clock):
+    queue.enqueue("evt_1", "payment_intent.succeeded", "{}")
+    queue.complete(queue.claim()["id"])
+
+    clock.now += 10 * 86400
+    assert queue.prune(retention_days=7) == 1
+    assert queue.enqueue("evt_1", "payment_intent.succeeded", "{}") is False
+
+    clock.now += 30 * 86400
+    assert queue.prune_event_ids(retention_days=30) == 1
+    assert queue.enqueue("evt_1", "payment_intent.succeeded", "{}") is True
+
+
+def test_lease_expiry_hands_event_to_another_worker(queue, clock):
+    queue.enqueue("evt_1", "payment_intent.succeeded", "{}")
+
+    first = queue.claim()
+    assert first["attempts"] == 1
+    assert queue.claim() is None  # leased
+
+    clock.now += 61
+    second = queue.claim()
+    assert second["id"] == first["id"]
+    assert second["attempts"] == 2
+
+    # The first worker's late result must not reschedule the reclaimed event
+    queue.retry(first["id"], first["attempts"], "timed out")
+    assert queue.stats()["processing"] == 1
+
+
+def test_retry_backs_off_then_fails(queue, clock):
+    queue.enqueue("evt_1", "payment_intent.succeeded", "{}")
+
+    item = queue.claim()
+    assert queue.retry(item["id"], item["attempts"], "boom") is True
+    assert queue.claim() is None  # backing off for 2s
+
+    clock.now += 2
+    item = queue.claim()
+    assert queue.retry(item["id"], item["attempts"], "boom") is True
+
+    clock.now += 4
+    item = queue.claim()
+    assert queue.retry(item["id"], item["attempts"], "boom") is False
+
+    assert queue.stats()["failed"] == 1
+    assert queue.failed_events()[0]["last_error"] == "boom"
+
+
+def test_deduplicator_counts_queue_answers():
+    dedup = EventDeduplicator(max_memory=2)
+
+    assert dedup.seen("evt_1") is False
+    dedup.remember("evt_1", queued=True)
+    dedup.remember("evt_2", queued=False)
+    assert dedup.seen("evt_1") is True
+
+    dedup.remember("evt_3", queued=True)  # evicts evt_2, the least recently used
+    assert dedup.seen("evt_2") is False
+
+    assert dedup.stats() == {"memory_hits": 1, "store_hits": 1, "misses": 2, "lru_size": 2, "lru_capacity": 2}
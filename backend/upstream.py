@@ -0,0 +1,158 @@
+"""
+Execution layer for blocking calls
+supabase-py, stripe and resend are synchronous SDKs. Async routes hand their
+calls to run_blocking(), which runs them on a dedicated, bounded thread pool
+so the event loop keeps serving other requests. Each upstream has its own
+concurrency limit - excess callers wait on an asyncio semaphore without
+holding a thread, so one slow upstream can't starve the others.
+
+Pure-CPU admin aggregations go through run_cpu(), which uses a process pool
+when ADMIN_PROCESS_POOL is enabled.
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+UPSTREAM_THREADS = int(os.getenv("UPSTREAM_THREADS", "40"))
+
+# Max concurrent calls per upstream. Keep the sum at or below UPSTREAM_THREADS
+# so every upstream can always get a thread.
+UPSTREAM_LIMITS = {
+    "supabase": int(os.getenv("SUPABASE_CONCURRENCY", "16")),
+    "stripe": int(os.getenv("STRIPE_CONCURRENCY", "6")),
+    "resend": int(os.getenv("RESEND_CONCURRENCY", "2")),
+    # Direct Postgres pool (direct_db.py), when enabled
+    "postgres": int(os.getenv("DIRECT_DB_POOL_MAX", "10")),
+    # Local SQLite stores (webhook queue, dedup, email outbox)
+    "local": int(os.getenv("LOCAL_IO_CONCURRENCY", "4")),
+    # CPU work when the process pool is disabled
+    "cpu": int(os.getenv("CPU_CONCURRENCY", "2")),
+}
+
+ADMIN_PROCESS_POOL = os.getenv("ADMIN_PROCESS_POOL", "false").lower() == "true"
+ADMIN_PROCESS_WORKERS = int(os.getenv("ADMIN_PROCESS_WORKERS", "2"))
+
+
+class Upstream:
+    """Concurrency limit and counters for one upstream service."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self._semaphores: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_time = 0.0
+
+    def semaphore(self) -> asyncio.Semaphore:
+        # One per event loop - asyncio primitives are bound to the loop that uses them
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.limit)
+                self._semaphores[loop] = semaphore
+            return semaphore
+
+    def stats(self) -> Dict:
+        return {
+            "limit": self.limit,
+            "calls": self.calls,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "avg_wait_ms": round(self.total_wait / self.calls * 1000, 2) if self.calls else 0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "avg_call_ms": round(self.total_time / self.calls * 1000, 2) if self.calls else 0,
+        }
+
+
+_upstreams = {name: Upstream(name, limit) for name, limit in UPSTREAM_LIMITS.items()}
+_thread_pool = ThreadPoolExecutor(max_workers=UPSTREAM_THREADS, thread_name_prefix="upstream")
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+async def run_blocking(upstream: str, fn: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking call on the upstream thread pool, at most
+    UPSTREAM_LIMITS[upstream] at a time.
+    """
+    target = _upstreams[upstream]
+    queued_at = time.perf_counter()
+    target.waiting += 1
+    acquired = False
+    try:
+        async with target.semaphore():
+            acquired = True
+            target.waiting -= 1
+            started = time.perf_counter()
+            wait = started - queued_at
+            target.calls += 1
+            target.in_flight += 1
+            target.total_wait += wait
+            target.max_wait = max(target.max_wait, wait)
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(_thread_pool, functools.partial(fn, *args, **kwargs))
+            except Exception:
+                target.errors += 1
+                raise
+            finally:
+                target.in_flight -= 1
+                target.total_time += time.perf_counter() - started
+    finally:
+        if not acquired:
+            # Cancelled while waiting for a slot
+            target.waiting -= 1
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            # spawn: forking a process with live threads and sockets isn't safe
+            _process_pool = ProcessPoolExecutor(
+                max_workers=ADMIN_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_pool
+
+
+async def run_cpu(fn: Callable, *args) -> Any:
+    """
+    Run a pure-CPU function. fn and its arguments must be picklable when the
+    process pool is enabled (module-level function, plain data).
+    """
+    if not ADMIN_PROCESS_POOL:
+        return await run_blocking("cpu", fn, *args)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_process_pool(), functools.partial(fn, *args))
+
+
+def get_upstream_stats() -> Dict:
+    return {
+        "threads": UPSTREAM_THREADS,
+        "process_pool": ADMIN_PROCESS_POOL,
+        "upstreams": {name: upstream.stats() for name, upstream in _upstreams.items()},
+    }
+
+
+def shutdown_process_pool() -> None:
+    """Stop the process pool if it was started. Call at application shutdown."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
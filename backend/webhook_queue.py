@@ -0,0 +1,318 @@
+"""
+Durable local queue for Stripe webhook events
+The webhook endpoint verifies the signature, appends the event here and acks
+Stripe immediately. Background workers drain the queue with retries and
+exponential backoff. Events are stored in SQLite, so nothing acknowledged to
+Stripe is lost across restarts.
+"""
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from upstream import run_blocking
+
+WEBHOOK_QUEUE_PATH = os.getenv(
+    "WEBHOOK_QUEUE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "webhook_queue.db")
+)
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+# Seconds a claimed event stays leased to its worker; if the worker dies, the
+# event is claimed again once the lease runs out
+WEBHOOK_LEASE_SECONDS = float(os.getenv("WEBHOOK_LEASE_SECONDS", "300"))
+# Days processed events are kept before prune() deletes them (failed events are kept)
+WEBHOOK_RETENTION_DAYS = float(os.getenv("WEBHOOK_RETENTION_DAYS", "7"))
+# Days an accepted Stripe event ID is remembered - well past Stripe's 3-day retry window
+EVENT_DEDUP_RETENTION_DAYS = float(os.getenv("EVENT_DEDUP_RETENTION_DAYS", "30"))
+
+# Backoff between attempts: 2s, 4s, 8s ... capped at 5 minutes
+RETRY_BASE_SECONDS = 2.0
+RETRY_MAX_SECONDS = 300.0
+
+# How often idle workers re-check for events whose backoff has expired
+IDLE_POLL_SECONDS = 1.0
+
+# Rows deleted per statement when pruning, so writers aren't blocked for long
+PRUNE_BATCH_SIZE = 1000
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds to wait before the next attempt, with +/-20% jitter."""
+    delay = min(RETRY_BASE_SECONDS * (2 ** (attempts - 1)), RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def prune_rows(conn: sqlite3.Connection, lock: threading.Lock, table: str, where: str, params: tuple) -> int:
+    """Delete matching rows in batches of PRUNE_BATCH_SIZE. Returns the number deleted."""
+    deleted = 0
+    while True:
+        with lock:
+            cursor = conn.execute(
+                f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)",
+                (*params, PRUNE_BATCH_SIZE)
+            )
+        deleted += cursor.rowcount
+        if cursor.rowcount < PRUNE_BATCH_SIZE:
+            return deleted
+
+
+class WebhookQueue:
+    """
+    SQLite-backed event queue.
+    Statuses: pending -> processing -> done, or failed after WEBHOOK_MAX_ATTEMPTS.
+    While an event is processing, next_attempt_at is its lease expiry: an event
+    whose worker died (or whose process was restarted) is claimed again once
+    the lease runs out, while events held by live workers - in this or another
+    process sharing the database - are left alone.
+
+    Accepted event IDs are recorded in processed_stripe_events in the same
+    transaction as the event is queued, and kept after the event itself is
+    pruned, so a redelivery is rejected for EVENT_DEDUP_RETENTION_DAYS.
+    """
+
+    def __init__(
+        self,
+        path: str = WEBHOOK_QUEUE_PATH,
+        max_attempts: int = WEBHOOK_MAX_ATTEMPTS,
+        lease_seconds: float = WEBHOOK_LEASE_SECONDS
+    ):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL: an event is fsynced before we ack Stripe
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS webhook_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id TEXT UNIQUE NOT NULL,
+                event_type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_webhook_events_due ON webhook_events(status, next_attempt_at)"
+        )
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS processed_stripe_events (
+                event_id TEXT PRIMARY KEY,
+                seen_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_processed_stripe_events_seen ON processed_stripe_events(seen_at)"
+        )
+
+    def enqueue(self, event_id: str, event_type: str, payload: str) -> bool:
+        """
+        Durably record the event ID and append the event, in one transaction.
+        Returns False if this event ID was already accepted (nothing is written).
+        Of two concurrent deliveries of one event, exactly one returns True.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO processed_stripe_events (event_id, seen_at) VALUES (?, ?)",
+                    (event_id, now)
+                )
+                if cursor.rowcount == 0:
+                    self._conn.execute("COMMIT")
+                    return False
+
+                # OR IGNORE: events queued before processed_stripe_events existed
+                cursor = self._conn.execute(
+                    """
+                    INSERT OR IGNORE INTO webhook_events
+                        (event_id, event_type, payload, status, next_attempt_at, created_at, updated_at)
+                    VALUES (?, ?, ?, 'pending', ?, ?, ?)
+                    """,
+                    (event_id, event_type, payload, now, now, now)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return cursor.rowcount == 1
+
+    def claim(self) -> Optional[Dict]:
+        """
+        Atomically take the oldest due event (or one whose lease has expired)
+        and lease it to the caller.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    """
+                    SELECT * FROM webhook_events
+                    WHERE status IN ('pending', 'processing') AND next_attempt_at <= ?
+                    ORDER BY next_attempt_at, id
+                    LIMIT 1
+                    """,
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+
+                if row["status"] == "processing":
+                    print(f"[WEBHOOK QUEUE] Lease expired on {row['event_id']} (attempt {row['attempts']}), reclaiming")
+
+                self._conn.execute(
+                    """
+                    UPDATE webhook_events
+                    SET status = 'processing', attempts = attempts + 1, next_attempt_at = ?, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (now + self.lease_seconds, now, row["id"])
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        event = dict(row)
+        event["attempts"] += 1
+        return event
+
+    def complete(self, queue_id: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE webhook_events SET status = 'done', last_error = NULL, updated_at = ? WHERE id = ?",
+                (time.time(), queue_id)
+            )
+
+    def retry(self, queue_id: int, attempts: int, error: str) -> bool:
+        """
+        Schedule another attempt with exponential backoff and jitter.
+        Returns False (and marks the event failed) once attempts are exhausted.
+        Does nothing if the lease expired and the event was claimed again since.
+        """
+        now = time.time()
+        with self._lock:
+            if attempts >= self.max_attempts:
+                self._conn.execute(
+                    "UPDATE webhook_events SET status = 'failed', last_error = ?, updated_at = ? WHERE id = ? AND attempts = ?",
+                    (error, now, queue_id, attempts)
+                )
+                return False
+
+            delay = retry_delay(attempts)
+            self._conn.execute(
+                """
+                UPDATE webhook_events
+                SET status = 'pending', next_attempt_at = ?, last_error = ?, updated_at = ?
+                WHERE id = ? AND attempts = ?
+                """,
+                (now + delay, error, now, queue_id, attempts)
+            )
+            return True
+
+    def prune(self, retention_days: float = WEBHOOK_RETENTION_DAYS) -> int:
+        """
+        Delete done events last updated more than retention_days ago. Returns the
+        number deleted. Failed events are kept for inspection.
+        """
+        cutoff = time.time() - retention_days * 86400
+        return prune_rows(self._conn, self._lock, "webhook_events", "status = 'done' AND updated_at < ?", (cutoff,))
+
+    def prune_event_ids(self, retention_days: float = EVENT_DEDUP_RETENTION_DAYS) -> int:
+        """
+        Forget accepted event IDs first seen more than retention_days ago.
+        Returns the number deleted.
+        """
+        cutoff = time.time() - retention_days * 86400
+        return prune_rows(self._conn, self._lock, "processed_stripe_events", "seen_at < ?", (cutoff,))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) AS count FROM webhook_events GROUP BY status"
+            ).fetchall()
+            oldest = self._conn.execute(
+                "SELECT MIN(created_at) FROM webhook_events WHERE status IN ('pending', 'processing')"
+            ).fetchone()[0]
+
+        counts = {"pending": 0, "processing": 0, "done": 0, "failed": 0}
+        counts.update({row["status"]: row["count"] for row in rows})
+        return {
+            **counts,
+            "oldest_pending_age_seconds": round(time.time() - oldest, 1) if oldest else None,
+        }
+
+    def failed_events(self, limit: int = 50) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT id, event_id, event_type, attempts, last_error, created_at, updated_at
+                FROM webhook_events WHERE status = 'failed'
+                ORDER BY updated_at DESC LIMIT ?
+                """,
+                (limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+webhook_queue = WebhookQueue()
+_wake: Optional[asyncio.Event] = None
+
+
+def notify_workers() -> None:
+    """
+    Wake idle workers after an enqueue. Call from the event loop.
+    """
+    if _wake is not None:
+        _wake.set()
+
+
+async def run_webhook_worker(handler: Callable[[Dict], Dict], worker_id: int) -> None:
+    """
+    Drain the queue forever, calling handler(event) on the Supabase pool for
+    each event. An exception from the handler schedules a retry.
+    """
+    global _wake
+    if _wake is None:
+        _wake = asyncio.Event()
+
+    while True:
+        item = await run_blocking("local", webhook_queue.claim)
+        if item is None:
+            _wake.clear()
+            try:
+                await asyncio.wait_for(_wake.wait(), timeout=IDLE_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        event_id = item["event_id"]
+        try:
+            result = await run_blocking("supabase", handler, json.loads(item["payload"]))
+            await run_blocking("local", webhook_queue.complete, item["id"])
+            print(f"[WEBHOOK QUEUE] worker {worker_id}: {event_id} done (attempt {item['attempts']}): {result}")
+        except asyncio.CancelledError:
+            # Leave it 'processing' - it is claimed again once its lease expires
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            will_retry = await run_blocking("local", webhook_queue.retry, item["id"], item["attempts"], error)
+            if will_retry:
+                print(f"[WEBHOOK QUEUE] worker {worker_id}: {event_id} failed (attempt {item['attempts']}), retrying: {error}")
+            else:
+                print(f"[WEBHOOK QUEUE] worker {worker_id}: {event_id} FAILED permanently after {item['attempts']} attempts: {error}")
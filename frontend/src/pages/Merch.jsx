@@ -172,6 +172,30 @@ function Merch() {
     fetchMerch()
   }, [])
 
+  // Live stock updates - one stream instead of refetching the whole catalog
+  useEffect(() => {
+    if (typeof EventSource === 'undefined') return
+
+    const source = new EventSource('/api/merch/stream')
+    const applyStock = (event) => {
+      const { changes } = JSON.parse(event.data)
+      const stockById = new Map(changes.map(([variantId, stock, available]) => [variantId, { stock, available }]))
+
+      setProducts((current) => current.map((product) => {
+        if (!product.sizes.some((size) => stockById.has(size.variant_id))) return product
+        const sizes = product.sizes.map((size) => (
+          stockById.has(size.variant_id) ? { ...size, ...stockById.get(size.variant_id) } : size
+        ))
+        return { ...product, sizes, inStock: sizes.some((size) => size.available) }
+      }))
+    }
+
+    source.addEventListener('snapshot', applyStock)
+    source.addEventListener('stock', applyStock)
+
+    return () => source.close()
+  }, [])
+
   const fetchMerch = async () => {
     try {
       setLoading(true)